@@ -2,6 +2,9 @@
 import flask.blueprints   # 這行一定放最上面
 
 import os
+import sqlalchemy as sa
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from flask import Flask, redirect, url_for
 from config     import Config
 from extensions import db, migrate
@@ -12,8 +15,14 @@ from blueprints.punch     import punch_bp
 from blueprints.employees       import emp_bp
 from blueprints.records         import rec_bp
 from blueprints.export          import exp_bp
+from blueprints.export_jobs     import job_bp
 from blueprints.import_employees import import_bp
+from blueprints.import_checkins  import ckimp_bp
 from blueprints.order_tool import order_bp
+from blueprints.metrics    import metrics_bp
+from blueprints.daily_summary import summary_cli
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
 
 
 def create_app() -> Flask:
@@ -29,9 +38,15 @@ def create_app() -> Flask:
     app.register_blueprint(emp_bp,  url_prefix="/admin")
     app.register_blueprint(rec_bp,  url_prefix="/admin")
     app.register_blueprint(exp_bp,  url_prefix="/admin")
+    app.register_blueprint(job_bp,  url_prefix="/admin")
     app.register_blueprint(import_bp, url_prefix="/admin")
+    app.register_blueprint(ckimp_bp, url_prefix="/admin")
     app.register_blueprint(order_bp, url_prefix="/admin/order-tool")
     app.register_blueprint(punch_bp)              # /punch
+    app.register_blueprint(metrics_bp)            # /admin/metrics
+
+    # ── CLI：flask summary rebuild YYYY-MM ──
+    app.cli.add_command(summary_cli)
 
     # ── 首頁導向 ──
     @app.route("/")
@@ -39,9 +54,22 @@ def create_app() -> Flask:
         return redirect(url_for("punch.qrcode_view"))
 
     # ── ★ 第一次啟動自動建立所有資料表 ──
+    # 全新的空資料庫：create_all 建出目前的結構，並標記為最新版本（之後 flask db upgrade 直接接續）。
+    # 已有資料表卻沒有 alembic_version 的，是舊版以 create_all 建的資料庫：結構是舊的，
+    # 不能再 create_all（新資料表會搶在 migration 前建好，upgrade 就建不起來），交給 flask db upgrade
     with app.app_context():
-        db.create_all()          # 如果已存在資料表則忽略，不會覆寫
-        
+        insp = sa.inspect(db.engine)
+        if not insp.has_table("alembic_version"):
+            if not insp.get_table_names():
+                db.create_all()
+                with db.engine.begin() as conn:
+                    MigrationContext.configure(conn).stamp(ScriptDirectory(MIGRATIONS_DIR), "head")
+            else:
+                app.logger.warning(
+                    "資料庫尚未交給 Flask-Migrate 管理（沒有 alembic_version），"
+                    "請先執行 flask db upgrade，打卡與報表才會用到新的欄位"
+                )
+
     return app
 
 
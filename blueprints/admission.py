@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+打卡頁（/punch、/punch/use）的流量管制。
+
+上班尖峰時手機一慢大家就狂按 F5，每次重整都在搶 worker，
+真正送出打卡的 POST /punch 反而排不到。這裡只管「看頁面」的請求：
+  - token bucket：每個 IP、每個瀏覽器（punch_sid cookie）各一個，存在各 worker
+    自己的記憶體（MemoryStore），不寫 punch_store：重整風暴不會去搶 POST /punch
+    消耗 token 時要的 SQLite 寫鎖。額度因此是每個 worker 各算一份；
+    公司 Wi-Fi 共用 IP，故 IP 額度給得較寬。
+    同一 Wi-Fi、同款手機的 IP + UA 指紋相同，不能拿來分人；
+    還沒有 punch_sid 的第一次請求只受 IP 額度管制
+  - 同時處理中的頁面請求數上限（每個 worker），超過就不再排隊
+被擋下時回傳極小的「請稍候」頁（429 + Retry-After），幾秒後自動重試。
+POST /punch 與 /punch/api 不經過這裡。
+"""
+
+from __future__ import annotations
+
+import functools
+import threading
+import time
+
+from flask import current_app, make_response
+
+from .punch_store import MemoryStore
+
+WAIT_HTML = (
+    "<!doctype html><html><head><meta charset='utf-8'>"
+    "<meta name='viewport' content='width=device-width, initial-scale=1.0'>"
+    "<meta http-equiv='refresh' content='{sec}'></head>"
+    "<body style='font-family:sans-serif;text-align:center;padding-top:3em'>"
+    "<h2>目前打卡人數較多</h2><p>請稍候，{sec} 秒後自動重新整理。</p>"
+    "</body></html>"
+)
+
+_inflight: dict[str, threading.BoundedSemaphore] = {}
+_inflight_lock = threading.Lock()
+
+
+def _buckets() -> MemoryStore:
+    app = current_app._get_current_object()
+    store = app.extensions.get("admission_buckets")
+    if store is None:
+        store = app.extensions.setdefault("admission_buckets", MemoryStore())
+    return store
+
+
+def take(key: str, rate: float, burst: float) -> bool:
+    """Take one token from bucket *key* (refill *rate*/s, capacity *burst*)."""
+
+    if rate <= 0:
+        return True
+    now = time.time()
+    ttl = int(burst / rate) + 1
+    allowed = False
+
+    def fn(b):
+        nonlocal allowed
+        tokens = min(burst, b["t"] + (now - b["at"]) * rate)
+        allowed = tokens >= 1
+        return {"t": tokens - 1 if allowed else tokens, "at": now}
+
+    store = _buckets()
+    if not store.update(key, fn, ttl):
+        store.put(key, {"t": burst - 1, "at": now}, ttl)
+        allowed = True
+    return allowed
+
+
+def _slot(view: str) -> threading.BoundedSemaphore:
+    sem = _inflight.get(view)
+    if sem is None:
+        with _inflight_lock:
+            limit = int(current_app.config.get("PUNCH_PAGE_MAX_INFLIGHT", 8))
+            sem = _inflight.setdefault(view, threading.BoundedSemaphore(limit))
+    return sem
+
+
+def wait_response():
+    sec = int(current_app.config.get("PUNCH_PAGE_RETRY_SEC", 3))
+    resp = make_response(WAIT_HTML.format(sec=sec), 429)
+    resp.headers["Retry-After"] = str(sec)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def admit(view: str, client_ip, client_key, on_reject=None):
+    """Decorator: rate-limit a page view per IP and per client key, cap in-flight renders."""
+
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cfg = current_app.config
+            key = client_key()
+            ok = take(
+                f"rl:ip:{client_ip()}",
+                float(cfg.get("PUNCH_IP_RATE", 20)), float(cfg.get("PUNCH_IP_BURST", 60)),
+            ) and (not key or take(
+                f"rl:sid:{key}",
+                float(cfg.get("PUNCH_FP_RATE", 0.5)), float(cfg.get("PUNCH_FP_BURST", 6)),
+            ))
+            sem = _slot(view)
+            if not ok or not sem.acquire(blocking=False):
+                if on_reject:
+                    on_reject(view, "throttled" if not ok else "busy")
+                return wait_response()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                sem.release()
+
+        return wrapper
+
+    return deco
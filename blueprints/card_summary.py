@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+打卡結果頁（/punch/result/<eid>）的每人每月摘要。
+
+摘要內容與 card() 原本的查詢相同：本月所有打卡，加上下月 1 日 NIGHT_END 前的下班。
+存放在 punch_store（多 worker 共用），打卡寫入與後台單筆編輯時就地更新；
+摘要不存在（過期、首次查詢）時才回頭查資料庫重建；已結帳的月份從封存快照重建。
+
+重建與打卡寫入會互相競爭：查資料庫之後、寫回之前 commit 的打卡找不到摘要可更新，
+寫回的舊摘要就會少這一筆。所以重建前先放一個佔位（add，已有就不放），
+打卡更新遇到佔位時把它刪掉，重建完只在自己的佔位還在時才寫回，否則這次不存。
+"""
+
+from __future__ import annotations
+
+import secrets
+from datetime import date, datetime, time, timedelta
+
+from models import Checkin
+from . import NIGHT_END
+from .month_archive import snapshot
+from .punch_store import get_store
+
+# 摘要保存時間（秒）；過期後下次查詢自動重建
+SUMMARY_TTL_SEC = 40 * 86400
+# 重建佔位的保存時間（秒）；重建中途失敗時佔位在這之後失效
+BUILD_TTL_SEC = 30
+
+OUT_TYPES = {"am-out", "pm-out", "ot-out"}
+
+
+def _key(eid, y: int, m: int) -> str:
+    return f"card:{eid}:{y}-{m:02d}"
+
+
+def _next_month(y: int, m: int) -> date:
+    return (date(y, m, 1) + timedelta(days=32)).replace(day=1)
+
+
+def build_month(eid, y: int, m: int) -> dict[str, str]:
+    """Rebuild the summary from the database (or the month's snapshot) and store it."""
+
+    snap = snapshot(y, m)
+    if snap is not None:
+        # 快照只收了本月與下月 1 日 NIGHT_END 前的下班，與下面的查詢相同
+        summary = {f"{wd}|{pt}": ts[11:16] for _, wd, pt, ts, _ in snap.employee_rows(eid)}
+        get_store().put(_key(eid, y, m), {"rows": summary}, SUMMARY_TTL_SEC)
+        return summary
+
+    store, key, tok = get_store(), _key(eid, y, m), secrets.token_hex(8)
+    claimed = store.add(key, {"building": True, "tok": tok}, BUILD_TTL_SEC)
+
+    first, next_m = date(y, m, 1), _next_month(y, m)
+    night_end = datetime.combine(next_m, time.fromisoformat(NIGHT_END))
+    # 以 work_day 範圍掃描，下月 1 日只留 NIGHT_END 前的下班
+    rows = (
+        Checkin.query
+        .with_entities(Checkin.work_date, Checkin.p_type, Checkin.ts)
+        .filter(Checkin.employee_id == eid)
+        .filter(Checkin.work_day.between(first, next_m))
+        .filter(
+            (Checkin.work_day < next_m) |
+            (Checkin.p_type.in_(OUT_TYPES) & (Checkin.ts_at < night_end))
+        )
+        .all()
+    )
+    summary = {f"{r.work_date}|{r.p_type}": r.ts[11:16] for r in rows}
+    if claimed:
+        store.update(key, lambda v: {"rows": summary} if v.get("tok") == tok else None,
+                     SUMMARY_TTL_SEC)
+    return summary
+
+
+def load_month(eid, y: int, m: int) -> list[tuple[str, str, str]]:
+    """Return [(work_date, p_type, 'HH:MM')] ordered like the original query."""
+
+    hit = get_store().get(_key(eid, y, m))
+    summary = hit["rows"] if hit and "rows" in hit else build_month(eid, y, m)
+    return sorted(
+        (k.split("|", 1)[0], k.split("|", 1)[1], hm) for k, hm in summary.items()
+    )
+
+
+def _apply(eid, y: int, m: int, field: str, hm: str | None) -> None:
+    building = False
+
+    def fn(value):
+        nonlocal building
+        if "rows" not in value:
+            building = True
+            return None
+        if hm is None:
+            value["rows"].pop(field, None)
+        else:
+            value["rows"][field] = hm
+        return value
+
+    # 摘要不存在就不動，等下次查詢時整月重建；正在重建就作廢那次重建
+    store, key = get_store(), _key(eid, y, m)
+    store.update(key, fn, SUMMARY_TTL_SEC)
+    if building:
+        store.consume(key, "building", True)
+
+
+def note_checkin(eid, work_date: str, p_type: str, ts: str) -> None:
+    """Reflect an inserted/updated check-in in every month summary it belongs to."""
+
+    d = date.fromisoformat(work_date)
+    field = f"{work_date}|{p_type}"
+    _apply(eid, d.year, d.month, field, ts[11:16])
+    if d.day == 1 and p_type in OUT_TYPES:
+        prev = d - timedelta(days=1)
+        in_prev = ts < f"{work_date}T{NIGHT_END}:00"
+        _apply(eid, prev.year, prev.month, field, ts[11:16] if in_prev else None)
+
+
+def drop_checkin(eid, work_date: str, p_type: str) -> None:
+    """Remove a deleted check-in from the month summaries."""
+
+    d = date.fromisoformat(work_date)
+    field = f"{work_date}|{p_type}"
+    _apply(eid, d.year, d.month, field, None)
+    if d.day == 1:
+        prev = d - timedelta(days=1)
+        _apply(eid, prev.year, prev.month, field, None)
+
+
+def forget_days(changes) -> None:
+    """Drop the month summaries touched by [(eid, work_date)]; they rebuild on next view."""
+
+    keys = set()
+    for eid, work_date in changes:
+        d = date.fromisoformat(work_date)
+        keys.add(_key(eid, d.year, d.month))
+        if d.day == 1:
+            prev = d - timedelta(days=1)
+            keys.add(_key(eid, prev.year, prev.month))
+    store = get_store()
+    for key in keys:
+        store.delete(key)
+
+
+def forget_employee(eid) -> None:
+    get_store().delete_prefix(f"card:{eid}:")
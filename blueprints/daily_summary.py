@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+每人每日出勤摘要（daily_summary）：六段時間、正班 / 加班≤2 / 加班>2、假日、假別。
+
+- 月份以 summary_month 標記「已建好」；未建的月份第一次被報表查詢時整月重建
+- 已建好的月份，打卡寫入（含 group commit 整批）、單筆編輯、刪除員工時
+  在同一個交易內重算受影響的日子
+- 凌晨下班歸前日一律採薪資規則（HH:MM ≤ NIGHT_END）；月表的分界不同（03:00），
+  不讀這裡，自行以 RECORDS_CUTOFF 計算（month_archive.card_hours）
+- flask summary rebuild YYYY-MM … 可手動重建指定月份
+- 打卡有異動的月份在 checkin_month 計數 +1（不論是否已建好），重建已建好的月份也 +1，
+  watermark() 以此加上該月最大 checkin id 判斷匯出結果是否還能沿用
+- flask summary close / reopen YYYY-MM … 結帳（凍結成 month_archive 快照，之後唯讀）/ 取消結帳
+
+重建整月時先鎖住 checkin 的寫入（SQLite 以一筆寫入取得寫鎖、Postgres 以 LOCK TABLE），
+避免重建讀取期間有打卡寫入卻沒被算進去。
+"""
+
+from __future__ import annotations
+
+import calendar
+from datetime import date, datetime, timedelta
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import Checkin, CheckinMonth, DailySummary, Employee, SummaryMonth
+from . import NIGHT_END
+from .hours import SEGMENTS, PAYROLL_CUTOFF, MonthHours, compute_month
+from .month_archive import closed_at, remove_snapshot, snapshot, write_snapshot
+
+_ck = Checkin.__table__
+_ds = DailySummary.__table__
+_emp = Employee.__table__
+_sm = SummaryMonth.__table__
+_cm = CheckinMonth.__table__
+
+# SEGMENTS 對應的欄位名稱
+_COLS = tuple(t.replace("-", "_") for t in SEGMENTS)
+
+summary_cli = AppGroup("summary", help="每日出勤摘要（daily_summary）維護")
+
+
+def _ym(y: int, m: int) -> str:
+    return f"{y}-{m:02d}"
+
+
+def _month_range(y: int, m: int) -> tuple[date, date]:
+    return date(y, m, 1), date(y, m, calendar.monthrange(y, m)[1])
+
+
+def _lock(conn, ym: str) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("LOCK TABLE checkin IN SHARE ROW EXCLUSIVE MODE"))
+    else:
+        # 任何寫入都會取得 SQLite 的寫鎖，其後的讀取與打卡寫入互斥
+        conn.execute(update(_sm).where(_sm.c.ym == ym).values(built_at=_sm.c.built_at))
+
+
+def _built(conn, yms) -> set[str]:
+    return set(conn.execute(select(_sm.c.ym).where(_sm.c.ym.in_(list(yms)))).scalars())
+
+
+def _records(mh: MonthHours, lo: int, hi: int) -> list[dict]:
+    """daily_summary rows for day indexes [lo, hi) of every employee in *mh*."""
+
+    out = []
+    times = mh.times[:, :, lo:hi]
+    regs, ot2s, otxs = (mh.reg[:, lo:hi].tolist(), mh.ot2[:, lo:hi].tolist(),
+                        mh.otx[:, lo:hi].tolist())
+    for e, eid in enumerate(mh.eids):
+        leave = mh.leave.get(eid, {})
+        for k in range(hi - lo):
+            d = lo + k
+            seg = times[:, e, k]
+            note = leave.get(f"{d + 1:02d}")
+            reg, ot2, otx = regs[e][k], ot2s[e][k], otxs[e][k]
+            if not (note or reg or ot2 or otx or any(seg)):
+                continue
+            row = {c: (v or None) for c, v in zip(_COLS, seg)}
+            row.update(
+                employee_id=eid, work_day=date(mh.y, mh.m, d + 1),
+                reg=reg, ot2=ot2, otx=otx,
+                is_holiday=bool(mh.is_hol[d]), leave_note=note,
+            )
+            out.append(row)
+    return out
+
+
+def _compute(conn, y: int, m: int, eids, first: date, last: date) -> MonthHours:
+    """Recompute days first..last for *eids* (None = every employee) from checkin."""
+
+    q = select(_emp.c.id, _emp.c.default_break).order_by(_emp.c.id)
+    if eids is not None:
+        q = q.where(_emp.c.id.in_(eids))
+    brk = dict(conn.execute(q).all())
+    ids = list(brk)
+
+    q = select(_ck.c.employee_id, _ck.c.work_date, _ck.c.p_type, _ck.c.ts, _ck.c.note).where(
+        _ck.c.work_day.between(first, last + timedelta(days=1))
+    )
+    if eids is not None:
+        q = q.where(_ck.c.employee_id.in_(ids))
+    rows = conn.execute(q).all()
+    return compute_month(rows, y, m, ids, list(brk.values()), cutoff=PAYROLL_CUTOFF)
+
+
+def _store_month(conn, y: int, m: int, mh: MonthHours) -> None:
+    ym = _ym(y, m)
+    first, last = _month_range(y, m)
+    if _built(conn, [ym]):
+        # 改寫已有的摘要（rebuild / 結帳）：匯出快取要跟著失效
+        bump_months(conn, [ym])
+    conn.execute(delete(_ds).where(_ds.c.work_day.between(first, last)))
+    recs = _records(mh, 0, mh.days)
+    if recs:
+        conn.execute(insert(_ds), recs)
+    conn.execute(delete(_sm).where(_sm.c.ym == ym))
+    conn.execute(insert(_sm).values(ym=ym, built_at=datetime.now().isoformat(timespec="seconds")))
+
+
+def build_month(conn, y: int, m: int, *, force: bool = True) -> bool:
+    """(Re)build every summary row of (y, m) inside *conn*'s transaction."""
+
+    ym = _ym(y, m)
+    _lock(conn, ym)
+    if not force and _built(conn, [ym]):
+        return False
+    if closed_at(y, m, conn):
+        raise ValueError(f"{ym} 已結帳，不能重建")
+
+    first, last = _month_range(y, m)
+    _store_month(conn, y, m, _compute(conn, y, m, None, first, last))
+    return True
+
+
+def ensure_month(y: int, m: int) -> None:
+    """Build (y, m) once if no summary exists for it yet."""
+
+    if SummaryMonth.query.get(_ym(y, m)) is not None:
+        return
+    with db.engine.begin() as conn:
+        build_month(conn, y, m, force=False)
+
+
+def bump_months(conn, yms) -> None:
+    """Count one change to the checkin rows of each 'YYYY-MM' in *yms*."""
+
+    for ym in sorted(set(yms)):
+        if conn.dialect.name in ("sqlite", "postgresql"):
+            ins = (sqlite if conn.dialect.name == "sqlite" else postgresql).insert(_cm)
+            conn.execute(ins.values(ym=ym, rev=1).on_conflict_do_update(
+                index_elements=[_cm.c.ym], set_={"rev": _cm.c.rev + 1}))
+        elif not conn.execute(update(_cm).where(_cm.c.ym == ym)
+                              .values(rev=_cm.c.rev + 1)).rowcount:
+            conn.execute(insert(_cm).values(ym=ym, rev=1))
+
+
+def watermark(y: int, m: int) -> tuple:
+    """(max checkin id, change counter) of the rows that feed (y, m)'s reports.
+
+    Any punch / edit / delete that can change the month moves one of the two.
+    """
+
+    first, last = _month_range(y, m)
+    max_id = db.session.execute(
+        select(func.max(_ck.c.id)).where(_ck.c.work_day.between(first, last + timedelta(days=1)))
+    ).scalar()
+    rev = db.session.execute(select(_cm.c.rev).where(_cm.c.ym == _ym(y, m))).scalar()
+    return max_id or 0, rev or 0
+
+
+def refresh(conn, changes) -> None:
+    """Recompute the summary days touched by [(employee_id, work_date)] changes.
+
+    A check-in on day D can change D (its own segments) and D-1 (night out),
+    so both are recomputed; months that were never built are left alone.
+    Every touched month's checkin_month counter is bumped either way.
+    """
+
+    groups: dict[tuple[int, int], dict[int, list[date]]] = {}
+    for eid, wd in changes:
+        d = date.fromisoformat(wd) if isinstance(wd, str) else wd
+        for day in (d - timedelta(days=1), d):
+            groups.setdefault((day.year, day.month), {}).setdefault(int(eid), []).append(day)
+    if not groups:
+        return
+
+    bump_months(conn, [_ym(y, m) for y, m in groups])
+    built = _built(conn, [_ym(y, m) for y, m in groups])
+    for (y, m), by_emp in groups.items():
+        if _ym(y, m) not in built:
+            continue
+        days = [d for ds in by_emp.values() for d in ds]
+        first, last = min(days), max(days)
+        eids = sorted(by_emp)
+        mh = _compute(conn, y, m, eids, first, last)
+        conn.execute(delete(_ds).where(
+            _ds.c.employee_id.in_(eids), _ds.c.work_day.between(first, last)
+        ))
+        recs = _records(mh, first.day - 1, last.day)
+        if recs:
+            conn.execute(insert(_ds), recs)
+
+
+def refresh_employees(conn, eids) -> None:
+    """Recompute every built month of *eids* (e.g. after a break change)."""
+
+    eids = [int(e) for e in eids]
+    if not eids:
+        return
+    # 已結帳的月份維持結帳時的結果
+    for ym in conn.execute(select(_sm.c.ym).where(_sm.c.closed_at.is_(None))).scalars().all():
+        y, m = map(int, ym.split("-"))
+        first, last = _month_range(y, m)
+        conn.execute(delete(_ds).where(
+            _ds.c.employee_id.in_(eids), _ds.c.work_day.between(first, last)
+        ))
+        recs = _records(_compute(conn, y, m, eids, first, last), 0, last.day)
+        if recs:
+            conn.execute(insert(_ds), recs)
+
+
+def forget_employee(conn, eid) -> None:
+    conn.execute(delete(_ds).where(_ds.c.employee_id == int(eid)))
+
+
+def month_hours(y: int, m: int, eids: list) -> MonthHours:
+    """Read (y, m) for *eids* from daily_summary (or its snapshot once closed)."""
+
+    snap = snapshot(y, m)
+    if snap is not None:
+        return snap.month_hours(eids)
+
+    ensure_month(y, m)
+    first, last = _month_range(y, m)
+    days = last.day
+    pos = {eid: i for i, eid in enumerate(eids)}
+
+    times = np.full((len(SEGMENTS), len(eids), days), "", dtype=object)
+    reg = np.zeros((len(eids), days))
+    ot2 = np.zeros((len(eids), days))
+    otx = np.zeros((len(eids), days))
+    leave: dict = {}
+
+    # 逐批讀欄位值（不建 ORM 物件），人數多時記憶體只多在結果矩陣上
+    q = (
+        select(_ds.c.employee_id, _ds.c.work_day, *(_ds.c[c] for c in _COLS),
+               _ds.c.reg, _ds.c.ot2, _ds.c.otx, _ds.c.leave_note)
+        .where(_ds.c.work_day.between(first, last), _ds.c.employee_id.in_(eids))
+        .execution_options(yield_per=2000)
+    )
+    rows = db.session.execute(q) if eids else []
+    for eid, day, *seg, r_reg, r_ot2, r_otx, note in rows:
+        e, d = pos[eid], day.day - 1
+        for k, v in enumerate(seg):
+            times[k, e, d] = v or ""
+        reg[e, d], ot2[e, d], otx[e, d] = r_reg, r_ot2, r_otx
+        if note:
+            leave.setdefault(eid, {})[f"{d + 1:02d}"] = note
+
+    is_hol = np.array([date(y, m, d).weekday() >= 5 for d in range(1, days + 1)])
+    return MonthHours(y, m, list(eids), days, is_hol, times, reg, ot2, otx, leave, {})
+
+
+def close_month(y: int, m: int) -> str:
+    """Rebuild (y, m), freeze it into an archive snapshot and mark it read-only."""
+
+    ym = _ym(y, m)
+    first, last = _month_range(y, m)
+    nxt = last + timedelta(days=1)
+    # 下月 1 日凌晨的下班還會算進本月，要等那一天過完
+    if date.today() <= nxt:
+        raise ValueError(f"{ym} 尚未結束，{nxt + timedelta(days=1)} 起才能結帳")
+
+    stamp = datetime.now().isoformat(timespec="seconds")
+    with db.engine.begin() as conn:
+        _lock(conn, ym)
+        brk = dict(conn.execute(select(_emp.c.id, _emp.c.default_break).order_by(_emp.c.id)).all())
+        mh = _compute(conn, y, m, None, first, last)
+        night_end = datetime.combine(nxt, datetime.strptime(NIGHT_END, "%H:%M").time())
+        rows = conn.execute(
+            select(_ck.c.employee_id, _ck.c.work_date, _ck.c.p_type, _ck.c.ts, _ck.c.note)
+            .where(
+                (_ck.c.work_day.between(first, last))
+                | ((_ck.c.work_day == nxt) & _ck.c.p_type.in_(["am-out", "pm-out", "ot-out"])
+                   & (_ck.c.ts_at < night_end))
+            )
+            .order_by(_ck.c.employee_id, _ck.c.work_day, _ck.c.ts_at, _ck.c.p_type)
+        ).all()
+        _store_month(conn, y, m, mh)
+        write_snapshot(y, m, mh, list(brk.values()), rows, stamp)
+        conn.execute(update(_sm).where(_sm.c.ym == ym).values(closed_at=stamp))
+    return stamp
+
+
+def reopen_month(y: int, m: int) -> None:
+    """Make a closed month writable again and drop its snapshot."""
+
+    with db.engine.begin() as conn:
+        conn.execute(update(_sm).where(_sm.c.ym == _ym(y, m)).values(closed_at=None))
+    remove_snapshot(y, m)
+
+
+@summary_cli.command("rebuild")
+@click.argument("months", nargs=-1, required=True)
+def rebuild_cmd(months):
+    """Rebuild daily_summary for each YYYY-MM given."""
+
+    for ym in months:
+        y, m = map(int, ym.split("-"))
+        try:
+            with db.engine.begin() as conn:
+                build_month(conn, y, m)
+        except ValueError as e:
+            click.echo(str(e))
+            continue
+        click.echo(f"{ym} 已重建")
+
+
+@summary_cli.command("close")
+@click.argument("months", nargs=-1, required=True)
+def close_cmd(months):
+    """Close each YYYY-MM given: freeze it into a snapshot, read-only afterwards."""
+
+    for ym in months:
+        y, m = map(int, ym.split("-"))
+        try:
+            close_month(y, m)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{ym} 已結帳")
+
+
+@summary_cli.command("reopen")
+@click.argument("months", nargs=-1, required=True)
+def reopen_cmd(months):
+    """Reopen each closed YYYY-MM given."""
+
+    for ym in months:
+        y, m = map(int, ym.split("-"))
+        reopen_month(y, m)
+        click.echo(f"{ym} 已取消結帳")
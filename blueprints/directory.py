@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+員工 / 區域名錄快取（打卡、月表、匯出共用）。
+
+名錄一週只變動幾次，整份載入記憶體；員工新增 / 編輯 / 刪除 / 匯入後呼叫
+invalidate()，同時改寫版本戳記檔 EMP_DIRECTORY_STAMP，其他 gunicorn worker
+最多 DIRECTORY_CHECK_SEC 秒後就會發現版本變了並重新載入。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import NamedTuple
+
+from flask import current_app
+
+from models import Employee
+
+# 多久檢查一次版本戳記檔（秒）
+DIRECTORY_CHECK_SEC = 1.0
+
+
+class EmpRow(NamedTuple):
+    id: int
+    name: str
+    area: str | None
+    default_break: float
+
+
+class EmployeeDirectory:
+    """Whole-roster snapshot with explicit invalidation and a shared version stamp."""
+
+    def __init__(self, stamp_path: str):
+        self._stamp_path = stamp_path
+        self._lock = threading.Lock()
+        self._snap = None          # (版本, by_id, by_area, areas, ordered)
+        self._checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self):
+        try:
+            st = os.stat(self._stamp_path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _load(self, version) -> tuple:
+        ordered = [
+            EmpRow(e.id, e.name, e.area, e.default_break or 0.0)
+            for e in Employee.query.order_by(Employee.id).all()
+        ]
+        by_area: dict[str, list[EmpRow]] = {}
+        for e in ordered:
+            by_area.setdefault(e.area, []).append(e)
+        areas = sorted(a for a in by_area if a is not None)
+        return version, {e.id: e for e in ordered}, by_area, areas, ordered
+
+    def _current(self) -> tuple:
+        snap = self._snap
+        now = time.monotonic()
+        if snap is not None and now - self._checked < DIRECTORY_CHECK_SEC:
+            self.hits += 1
+            return snap
+        version = self._stamp()
+        self._checked = now
+        if snap is not None and snap[0] == version:
+            self.hits += 1
+            return snap
+        with self._lock:
+            if self._snap is snap:
+                self._snap = self._load(version)
+            self.misses += 1
+            return self._snap
+
+    def get(self, eid) -> EmpRow | None:
+        try:
+            return self._current()[1].get(int(eid))
+        except (TypeError, ValueError):
+            return None
+
+    def areas(self) -> list[str]:
+        """Distinct non-empty areas, sorted."""
+
+        return self._current()[3]
+
+    def in_area(self, area) -> list[EmpRow]:
+        return self._current()[2].get(area, [])
+
+    def all(self) -> list[EmpRow]:
+        """Every employee ordered by id."""
+
+        return self._current()[4]
+
+    def version(self):
+        """Stamp of the roster snapshot in use (changes on every invalidate())."""
+
+        return self._current()[0]
+
+    def invalidate(self) -> None:
+        """Drop this worker's snapshot and bump the shared version stamp."""
+
+        tmp = f"{self._stamp_path}.{os.getpid()}"
+        with open(tmp, "w") as fh:
+            fh.write(str(time.time_ns()))
+        os.replace(tmp, self._stamp_path)
+        with self._lock:
+            self._snap = None
+
+    def stats(self) -> dict:
+        snap = self._snap
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "employees": len(snap[1]) if snap else 0,
+            "version": list(snap[0]) if snap and snap[0] else None,
+        }
+
+
+def get_directory() -> EmployeeDirectory:
+    app = current_app._get_current_object()
+    directory = app.extensions.get("emp_directory")
+    if directory is None:
+        directory = app.extensions.setdefault(
+            "emp_directory", EmployeeDirectory(app.config["EMP_DIRECTORY_STAMP"])
+        )
+    return directory
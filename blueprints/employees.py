@@ -2,49 +2,127 @@
 # -*- coding: utf-8 -*-
 
 from flask.blueprints import Blueprint
-from flask import render_template_string, request, redirect, url_for, abort
+from flask import render_template_string, request, redirect, url_for, abort, jsonify, current_app
+from sqlalchemy import or_, text
 from extensions import db
 from models     import Employee, Checkin          # ← 增：引入 Checkin
 from .          import CSS
+from .directory import get_directory
+from .card_summary import forget_employee
+from .daily_summary import refresh_employees, forget_employee as forget_daily
 
 emp_bp = Blueprint("emp", __name__, url_prefix="/admin")
 
+# 依 ID 前綴搜尋時展開到幾位數的 id
+ID_DIGITS = 9
+
+
+def _id_prefix(q: str):
+    """Ids whose decimal form starts with *q*, as ranges on the primary key."""
+
+    n = int(q)
+    return or_(*(
+        Employee.id.between(n * 10 ** k, (n + 1) * 10 ** k - 1)
+        for k in range(max(1, ID_DIGITS - len(q) + 1))
+    ))
+
+
+def _name_match(q: str):
+    """Substring match on name: FTS5 trigram on SQLite, ILIKE (pg_trgm) on Postgres."""
+
+    # trigram 至少要 3 個字；1–2 字的查詢或沒有 employee_fts 時逐列 LIKE（同樣不分大小寫）
+    if db.session.get_bind().dialect.name == "sqlite" and len(q) >= 3 and db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = 'employee_fts'")
+    ).first():
+        phrase = '"' + q.replace('"', '""') + '"'
+        return Employee.id.in_(
+            text("SELECT rowid FROM employee_fts WHERE employee_fts MATCH :q")
+            .bindparams(q=phrase).columns(rowid=db.Integer)
+        )
+    return Employee.name.icontains(q, autoescape=True)
+
+
 @emp_bp.route("/")
 def list_employees():
-    employees = Employee.query.order_by(Employee.id).all()
-    rows = ""
-    for e in employees:
-        rows += (
-            f"<tr>"
-            f"<td>{e.id}</td>"
-            f"<td>{e.name}</td>"
-            f"<td>{e.area}</td>"
-            f"<td>{e.default_break or 0}</td>"
-            f"<td>"
-            f"<a href=\"{url_for('emp.edit_employee', eid=e.id)}\">編輯</a> "
-            f"<form method='post' action=\"{url_for('emp.delete_employee', eid=e.id)}\" "
-            f"style='display:inline' "
-            f"onsubmit=\"return confirm('刪除 {e.id}-{e.name}？')\">"
-            f"<button type='submit'>刪除</button></form>"
-            f"</td>"
-            f"</tr>"
-        )
+    # 依 id 做 keyset 分頁（after / before = 上一頁最後 / 下一頁第一筆的 id），不用 OFFSET
+    size = current_app.config.get("EMP_PAGE_SIZE", 50)
+    area = request.args.get("area", "")
+    q = request.args.get("q", "").strip()
+    after = request.args.get("after", type=int)
+    before = request.args.get("before", type=int)
+
+    query = Employee.query
+    if area:
+        query = query.filter(Employee.area == area)
+    if q:
+        conds = [_name_match(q)]
+        # 超過 ID_DIGITS 位的數字不可能是 id（也超出整數範圍），只比對姓名
+        if q.isdigit() and not q.startswith("0") and len(q) <= ID_DIGITS:
+            conds.append(_id_prefix(q))
+        query = query.filter(or_(*conds))
+
+    if before is not None:
+        employees = (query.filter(Employee.id < before)
+                     .order_by(Employee.id.desc()).limit(size + 1).all())
+        has_prev, has_next = len(employees) > size, True
+        employees = employees[:size][::-1]
+    else:
+        if after is not None:
+            query = query.filter(Employee.id > after)
+        employees = query.order_by(Employee.id).limit(size + 1).all()
+        has_prev, has_next = after is not None, len(employees) > size
+        employees = employees[:size]
+
+    rows = "".join(
+        f"<tr>"
+        f"<td>{e.id}</td>"
+        f"<td>{e.name}</td>"
+        f"<td>{e.area}</td>"
+        f"<td>{e.default_break or 0}</td>"
+        f"<td>"
+        f"<a href=\"{url_for('emp.edit_employee', eid=e.id)}\">編輯</a> "
+        f"<form method='post' action=\"{url_for('emp.delete_employee', eid=e.id)}\" "
+        f"style='display:inline' "
+        f"onsubmit=\"return confirm('刪除 {e.id}-{e.name}？')\">"
+        f"<button type='submit'>刪除</button></form>"
+        f"</td>"
+        f"</tr>"
+        for e in employees
+    )
+
+    area_opts = "".join(
+        f'<option value="{a}" {"selected" if a == area else ""}>{a}</option>'
+        for a in get_directory().areas()
+    )
+    pager = []
+    if has_prev and employees:
+        pager.append(f'<a href="{url_for("emp.list_employees", area=area, q=q, before=employees[0].id)}">上一頁</a>')
+    if has_next and employees:
+        pager.append(f'<a href="{url_for("emp.list_employees", area=area, q=q, after=employees[-1].id)}">下一頁</a>')
 
     return render_template_string(f"""
     <!doctype html>
     <html><head>{CSS}</head><body>
       <h2>員工名單</h2>
+      <form method="get">
+        區域：<select name="area"><option value="">全部</option>{area_opts}</select>
+        <input name="q" value="{{{{ q }}}}" placeholder="ID 或姓名">
+        <button type="submit">搜尋</button>
+      </form>
       <table>
         <tr><th>ID</th><th>姓名</th><th>區域</th><th>預設午休(小時)</th><th>操作</th></tr>
         {rows}
       </table>
+      <p>{" | ".join(pager)}</p>
       <p>
         <a href="{url_for('emp.add_employee')}">新增員工</a> |
         <a href="{url_for('imp.import_employees')}">批次匯入</a> |
+        <a href="{url_for('ckimp.import_checkins')}">匯入歷史打卡</a> |
         <a href="{url_for('rec.show_records')}">出勤卡查詢</a>
       </p>
     </body></html>
-    """)
+    """, q=q)
+
 
 @emp_bp.route("/add", methods=["GET", "POST"])
 def add_employee():
@@ -59,6 +137,7 @@ def add_employee():
 
         db.session.add(Employee(id=eid, name=name, area=area, default_break=default_break))
         db.session.commit()
+        get_directory().invalidate()
         return redirect(url_for("emp.list_employees"))
 
     return render_template_string(f"""
@@ -86,11 +165,17 @@ def edit_employee(eid):
     if request.method == "POST":
         emp.name = request.form["name"].strip()
         emp.area = request.form["area"].strip()
+        old_break = emp.default_break
         try:
             emp.default_break = float(request.form.get("default_break", 0))
         except ValueError:
             emp.default_break = 0.0
+        if emp.default_break != old_break:
+            # 午休時數影響工時：重算此員工已建好的每日摘要
+            db.session.flush()
+            refresh_employees(db.session.connection(), [emp.id])
         db.session.commit()
+        get_directory().invalidate()
         return redirect(url_for("emp.list_employees"))
 
     return render_template_string(f"""
@@ -119,8 +204,17 @@ def delete_employee(eid):
     # ① 先刪除所有關聯 checkin
     Checkin.query.filter_by(employee_id=eid).delete(synchronize_session=False)
 
-    # ② 再刪除員工
+    # ② 再刪除員工（連同每日摘要）
+    forget_daily(db.session.connection(), eid)
     db.session.delete(emp)
     db.session.commit()
+    get_directory().invalidate()
+    forget_employee(eid)
 
     return redirect(url_for("emp.list_employees"))
+
+
+@emp_bp.route("/cache_stats")
+def cache_stats():
+    """名錄快取命中 / 未命中次數（本 worker）"""
+    return jsonify(employee_directory=get_directory().stats())
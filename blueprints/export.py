@@ -7,22 +7,40 @@
    - 各區一張 Sheet、每位員工 6 欄：
      『正班、加班≤2、加班>2、假日、出勤天數、備註／假別』
      備註／假別放在最後一欄。
-   - 以 xlsxwriter 產生後，合併到 static/薪資計算範本.xlsx，保留欄寬/樣式/合併格。
+   - 直接串流寫進 static/薪資計算範本.xlsx 的副本（xlsx_stream），範本內容原樣保留。
 
 2) 工時卡片總檔（每區每人各一張 Sheet）：/admin/export/punch_all?ym=YYYY-MM
    - 欄位（依你提供之圖片）：『日期、上午上、上午下、下午上、下午下、加班上、加班下、備註、正班、加班≤2、加班>2、假日』
    - 00:00 ~ NIGHT_END 的下班(out)歸前一日的「加班下」；同時此規則也影響當日正班/加班的小時計算。
+   - 從空白活頁簿串流寫入（xlsx_stream），不經 pandas / xlsxwriter。
+   - ?format=csv|ndjson|parquet：長表格式（每人每天一列，同樣欄位，每人最後一列總計），
+     給薪資廠商程式讀取；csv / ndjson 逐人串流輸出，parquet 需要 pyarrow。
+
+資料讀完、工時算完之後，各區（薪資報表）/ 各人（工時卡片）的工作表彼此獨立：
+EXPORT_RENDER_WORKERS > 1 時交給 process pool 分頭繪製，再依原順序併進活頁簿，
+輸出與單一行程逐張寫入完全相同。
+
+產生好的檔案存在 EXPORT_CACHE_DIR，以（報表, 月份, 範本雜湊, 資料 watermark）為鍵：
+watermark = 該月最大 checkin id + checkin_month 異動計數 + 員工名錄版本。
+月份資料沒變就直接回傳舊檔；打卡或編輯只會讓受影響的月份重新產生。
 """
 
-from flask import Blueprint, send_file, request, current_app, abort
-from datetime import date, timedelta, datetime, time as dtime
+from flask import Blueprint, Response, send_file, request, current_app, abort, stream_with_context
+from datetime import date, time as dtime
 from extensions import db
-from models import Employee, Checkin
-from . import merge_night, calc_hours, NIGHT_END
-
-import pandas as pd, io, calendar, re, openpyxl
-from copy import copy
+from . import NIGHT_END
+from .directory import get_directory
+from .hours import SEGMENTS, running_total
+from .daily_summary import month_hours, watermark
+from .month_archive import card_hours
+from .metrics import cache_event, counted
+from .xlsx_stream import TemplateBook, load_template
+
+import calendar, csv, hashlib, io, json, multiprocessing, multiprocessing.util, os, re, threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from urllib.parse import quote
 
 exp_bp = Blueprint("exp", __name__, url_prefix="/admin")
 
@@ -65,225 +83,219 @@ def make_new_title(old_title: str, ym: str, existing: set) -> str:
 # ────────────────────────────────────────────────
 
 
-# ─────────────── Sheet 複製工具（保留欄寬/樣式/合併格） ────────────────
-def clone_sheet(src_ws, tgt_wb, new_title=None):
-    tgt_ws = tgt_wb.create_sheet(new_title or src_ws.title)
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# 報表種類 → 下載檔名（背景匯出工作共用）
+REPORT_NAMES = {
+    "payroll": "{y}-{m:02d}_薪資報表.xlsx",
+    "punch_all": "{y}-{m:02d}_工時卡片_全員.xlsx",
+}
+
+
+def parse_ym(ym) -> tuple[int, int]:
+    """'YYYY-MM' → (y, m); anything else means the current month."""
+    if ym and re.fullmatch(r"\d{4}-\d{2}", ym):
+        y, m = map(int, ym.split("-"))
+        return y, m
+    today = date.today()
+    return today.year, today.month
+
+
+def _send(path, report: str, y: int, m: int):
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=REPORT_NAMES[report].format(y=y, m=m),
+        mimetype=XLSX_MIME,
+    )
+
 
-    # 欄寬
-    for key, dim in src_ws.column_dimensions.items():
-        if dim.width is not None:
-            tgt_ws.column_dimensions[key].width = dim.width
+# ─────────────── 工作表分頁繪製（可交給 process pool）───────────────
+_render_pool: ProcessPoolExecutor | None = None
+_render_pid = 0
+_render_lock = threading.Lock()
 
-    # 合併格
-    for rng in src_ws.merged_cells.ranges:
-        tgt_ws.merge_cells(str(rng))
 
-    # 值與樣式
-    for row in src_ws.iter_rows():
-        for cell in row:
-            tgt = tgt_ws.cell(cell.row, cell.column, cell.value)
-            if cell.has_style:
-                if cell.font:          tgt.font = copy(cell.font)
-                if cell.border:        tgt.border = copy(cell.border)
-                if cell.fill:          tgt.fill = copy(cell.fill)
-                if cell.number_format: tgt.number_format = cell.number_format
-                if cell.alignment:     tgt.alignment = copy(cell.alignment)
-    return tgt_ws
-# ────────────────────────────────────────────────────────────────────────────
+def _get_render_pool() -> ProcessPoolExecutor | None:
+    """Per-process pool for drawing sheets; None when EXPORT_RENDER_WORKERS ≤ 1."""
+
+    global _render_pool, _render_pid
+    workers = int(current_app.config.get("EXPORT_RENDER_WORKERS", 1))
+    if workers <= 1:
+        return None
+    if _render_pool is None or _render_pid != os.getpid():
+        with _render_lock:
+            if _render_pool is None or _render_pid != os.getpid():
+                # 繪製函式只吃 payload，不碰 DB / app，子行程不必 create_app()
+                _render_pool = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                _render_pid = os.getpid()
+                # 本身是 multiprocessing 子行程（背景匯出工作）時，結束前會先 join 所有子行程，
+                # 要先關掉 pool，否則閒置的繪製行程等不到結束訊號；優先序要高於
+                # multiprocessing.Queue 自己的 finalizer（10），趁 queue 還能送出結束訊號時關
+                multiprocessing.util.Finalize(_render_pool, _render_pool.shutdown, exitpriority=100)
+    return _render_pool
+
+
+def _add_sheets(book: TemplateBook, render, sheets: list) -> None:
+    """Draw [(name, payload)] into *book* in order, across the render pool if any."""
+
+    global _render_pool
+    pool = _get_render_pool()
+    chunk = max(1, len(sheets) // (4 * int(current_app.config.get("EXPORT_RENDER_WORKERS", 1))))
+    try:
+        book.add_sheets(render, sheets, pool, chunksize=chunk)
+    except BrokenProcessPool:
+        # 子行程掛了：丟掉這個 pool，下一次匯出重開
+        with _render_lock:
+            if _render_pool is pool:
+                _render_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
 
 
 # =====================================================================
 # 路由一：薪資報表（合併範本）── 與月表相同的分段算法
 # =====================================================================
-@exp_bp.route("/export")
-def export():
-    ym = request.args.get("ym")
-    today = date.today()
-    y, m = (map(int, ym.split("-"))
-            if ym and re.fullmatch(r"\d{4}-\d{2}", ym)
-            else (today.year, today.month))
-    days = calendar.monthrange(y, m)[1]
-    nxt  = (date(y, m, 1) + timedelta(days=32)).replace(day=1)
+PAYROLL_FIELDS = ['正班', '加班≤2', '加班>2', '假日', '出勤天數', '備註 / 假別']
 
-    # ── 建立活頁簿 ──
-    buf = io.BytesIO()
-    writer = pd.ExcelWriter(buf, engine="xlsxwriter")
-    book = writer.book
 
-    hdr_fmt   = book.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3'})
-    cell_fmt  = book.add_format({'border': 1, 'align': 'center'})
-    hol_fmt   = book.add_format({'border': 1, 'align': 'center', 'bg_color': '#FFF2CC'})
-    leave_fmt = book.add_format({'border': 1, 'align': 'center', 'bg_color': '#FFFF00'})
-    total_fmt = book.add_format({'bold': True, 'border': 1, 'align': 'center'})
-    note_fmt  = book.add_format({'border': 1, 'align': 'left'})
+def _payroll_sheet(ws, p: dict) -> None:
+    """Draw one area sheet of the payroll workbook from its payload."""
 
-    fields = ['正班', '加班≤2', '加班>2', '假日', '出勤天數', '備註 / 假別']
+    fields = PAYROLL_FIELDS
+    fmt_ = p["fmt"]
+    hdr_fmt, cell_fmt, hol_fmt = fmt_["hdr"], fmt_["cell"], fmt_["hol"]
+    leave_fmt, total_fmt, note_fmt = fmt_["leave"], fmt_["total"], fmt_["note"]
+    m, days, emps = p["m"], p["days"], p["emps"]
 
-    areas = [a[0] for a in (db.session.query(Employee.area)
-                            .filter(Employee.area.isnot(None))
-                            .distinct().order_by(Employee.area).all())]
+    ws.set_column(0, 0, 10)
+    for idx in range(len(emps)):
+        ws.set_column(1+idx*len(fields), 1+idx*len(fields)+len(fields)-1, 12)
+    ws.freeze_panes(2, 1)
 
-    for area in areas:
-        emps = Employee.query.filter_by(area=area).order_by(Employee.id).all()
-        if not emps:
-            continue
+    # 標題列（逐列寫出：先第一列姓名，再第二列欄名）
+    ws.write(0, 0, '日期', hdr_fmt)
+    for idx, (eid, name) in enumerate(emps):
+        s = 1 + idx * len(fields)
+        e = s + len(fields) - 1
+        ws.merge_range(0, s, 0, e, f"{eid}-{name}", hdr_fmt)
+    for idx in range(len(emps)):
+        ws.write_row(1, 1 + idx * len(fields), fields, hdr_fmt)
 
-        ws = book.add_worksheet(area)
+    regs, ot2s, otxs, hols, leaves = p["reg"], p["ot2"], p["otx"], p["hol"], p["leave"]
 
-        # 標題列
-        ws.write(0, 0, '日期', hdr_fmt)
-        for idx, emp in enumerate(emps):
-            s = 1 + idx * len(fields)
-            e = s + len(fields) - 1
-            ws.merge_range(0, s, 0, e, f"{emp.id}-{emp.name}", hdr_fmt)
-            for j, f in enumerate(fields):
-                ws.write(1, s + j, f, hdr_fmt)
+    # 逐日寫入
+    for d in range(1, days+1):
+        dd = f"{d:02d}"
+        row = 2 + d - 1
+        is_hol = p["is_hol"][d - 1]
+        ws.write(row, 0, f"{m:02d}-{dd}", cell_fmt)
 
-        ws.set_column(0, 0, 10)
         for idx in range(len(emps)):
-            ws.set_column(1+idx*len(fields), 1+idx*len(fields)+len(fields)-1, 12)
-        ws.freeze_panes(2, 1)
+            reg, ot2, otx = regs[idx][d - 1], ot2s[idx][d - 1], otxs[idx][d - 1]
+            hol_hours = hols[idx][d - 1]
 
-        # 取打卡資料
-        emp_raws, emp_notes = {}, {}
-        for emp in emps:
-            raws = (Checkin.query
-                    .with_entities(Checkin.work_date, Checkin.p_type, Checkin.ts, Checkin.note)
-                    .filter(Checkin.employee_id == emp.id)
-                    .filter((Checkin.work_date.like(f"{y}-{m:02d}%")) |
-                            ((Checkin.work_date == nxt.isoformat()) &
-                             (Checkin.p_type.like('%-out')) &
-                             (Checkin.ts < f"{nxt}T{NIGHT_END}:00")))
-                    .order_by(Checkin.work_date, Checkin.p_type, Checkin.ts)
-                    .all())
-
-            # recs：(dd, p_type) -> HH:MM，00:00–NIGHT_END out 歸前日
-            recs = {}
-            for r in raws:
-                hm = r.ts[11:16]
-                hour = int(hm[:2])
-                ne_h, ne_m = map(int, NIGHT_END.split(':'))
-                adj_prev = (r.p_type.endswith('-out') and
-                            (hour < ne_h or (hour == ne_h and int(hm[3:5]) <= ne_m)))
-                adj_date = (datetime.fromisoformat(r.work_date).date() - timedelta(days=1)).isoformat() \
-                           if adj_prev else r.work_date
-                if not adj_date.startswith(f"{y}-{m:02d}"):
-                    continue
-                dd = adj_date[8:10]
-                recs[(dd, r.p_type)] = hm
-            emp_raws[emp.id] = recs
-
-            # 請假／備註
-            emp_notes[emp.id] = {r.work_date[8:10]: (r.note or '請假')
-                                 for r in raws if r.p_type == LEAVE_PTYPE}
-
-        totals = {emp.id: {'reg':0.0,'ot2':0.0,'otx':0.0,'hol':0.0,'wday':0} for emp in emps}
-
-        # 逐日寫入
-        for d in range(1, days+1):
-            dd = f"{d:02d}"
-            row = 2 + d - 1
-            curr = date(y, m, d)
-            is_hol = curr.weekday() >= 5
-            ws.write(row, 0, f"{m:02d}-{dd}", cell_fmt)
-
-            for idx, emp in enumerate(emps):
-                recs  = emp_raws[emp.id]
-                notes = emp_notes[emp.id]
-
-                s_am = recs.get((dd, 'am-in'))
-                e_am = recs.get((dd, 'am-out')) or recs.get((dd, 'pm-out'))
-                has_pm_in = recs.get((dd, 'pm-in')) is not None
-
-                reg = ot2 = otx = 0.0
-                if s_am and e_am:
-                    h = sum(calc_hours(s_am, e_am, emp.default_break, skip_break=has_pm_in))
-                    take_reg = min(h, 8 - reg); reg += take_reg
-                    remain   = h - take_reg
-                    take2    = min(remain, 2 - ot2); ot2 += take2; otx += remain - take2
-
-                s_pm = recs.get((dd, 'pm-in')); e_pm = recs.get((dd, 'pm-out'))
-                if s_pm and e_pm:
-                    h = sum(calc_hours(s_pm, e_pm, emp.default_break, skip_break=True))
-                    take_reg = min(h, 8 - reg); reg += take_reg
-                    remain   = h - take_reg
-                    take2    = min(remain, 2 - ot2); ot2 += take2; otx += remain - take2
-
-                s_ot = recs.get((dd, 'ot-in')); e_ot = recs.get((dd, 'ot-out'))
-                if s_ot and e_ot:
-                    h = sum(calc_hours(s_ot, e_ot, emp.default_break, skip_break=True))
-                    take2 = min(h, 2 - ot2); ot2 += take2; otx += h - take2
-
-                hol_hours = reg + ot2 + otx if is_hol else 0.0
-
-                if reg or ot2 or otx or hol_hours:
-                    totals[emp.id]['wday'] += 1
-                totals[emp.id]['reg'] += reg
-                totals[emp.id]['ot2'] += ot2
-                totals[emp.id]['otx'] += otx
-                totals[emp.id]['hol'] += hol_hours
-
-                note_txt = notes.get(dd, '')
-                leave_word = f"請{note_txt}" if note_txt else ''
-                fmt = leave_fmt if note_txt else (hol_fmt if is_hol else cell_fmt)
-
-                base = 1 + idx*len(fields)
-                if note_txt and not (reg or ot2 or otx or hol_hours):
-                    ws.write_row(row, base, ['']*5 + [leave_word], fmt)
-                else:
-                    ws.write_row(row, base, [
-                        '' if is_hol else reg,
-                        '' if is_hol else ot2,
-                        '' if is_hol else otx,
-                        hol_hours or '',
-                        '',
-                        leave_word
-                    ], fmt)
-
-        # 區域總計
-        tr = 2 + days
-        ws.write(tr, 0, "總計", total_fmt)
-        for idx, emp in enumerate(emps):
-            t = totals[emp.id]; b = 1 + idx*len(fields)
-            ws.write_row(tr, b, [t['reg'], t['ot2'], t['otx'], t['hol'], t['wday'], ''], total_fmt)
-
-        # 備註彙總
-        nr = tr + 1
-        ws.write(nr, 0, "備註", hdr_fmt)
-        for idx, emp in enumerate(emps):
-            notes = emp_notes[emp.id]
-            if not notes:
-                continue
-            items = [f"{m:02d}-{k} {v}" for k, v in sorted(notes.items())]
-            txt = '；'.join(items)
-            s = 1 + idx*len(fields); e = s + len(fields)-1
-            ws.merge_range(nr, s, nr, e, txt, note_fmt)
-
-    writer.close()
-    buf.seek(0)
-    wb_new = openpyxl.load_workbook(buf)
-
-    # 合併到範本（不刪既有 Sheet；以新名稱新增）
-    tpl = Path(current_app.root_path) / "static" / "薪資計算範本.xlsx"
-    wb_tpl = openpyxl.load_workbook(tpl)
-
-    existing = set(wb_tpl.sheetnames)
+            note_txt = leaves[idx].get(dd, '')
+            leave_word = f"請{note_txt}" if note_txt else ''
+            fmt = leave_fmt if note_txt else (hol_fmt if is_hol else cell_fmt)
+
+            base = 1 + idx*len(fields)
+            if note_txt and not (reg or ot2 or otx or hol_hours):
+                ws.write_row(row, base, ['']*5 + [leave_word], fmt)
+            else:
+                ws.write_row(row, base, [
+                    '' if is_hol else reg,
+                    '' if is_hol else ot2,
+                    '' if is_hol else otx,
+                    hol_hours or '',
+                    '',
+                    leave_word
+                ], fmt)
+
+    # 區域總計
+    tr = 2 + days
+    ws.write(tr, 0, "總計", total_fmt)
+    for idx, t in enumerate(p["totals"]):
+        ws.write_row(tr, 1 + idx*len(fields), t, total_fmt)
+
+    # 備註彙總
+    nr = tr + 1
+    ws.write(nr, 0, "備註", hdr_fmt)
+    for idx, notes in enumerate(leaves):
+        if not notes:
+            continue
+        items = [f"{m:02d}-{k} {v}" for k, v in sorted(notes.items())]
+        txt = '；'.join(items)
+        s = 1 + idx*len(fields); e = s + len(fields)-1
+        ws.merge_range(nr, s, nr, e, txt, note_fmt)
+
+
+def payroll_template() -> Path:
+    return Path(current_app.root_path) / "static" / "薪資計算範本.xlsx"
+
+
+def build_payroll(y: int, m: int, out) -> None:
+    """Write the payroll workbook for (y, m) into the binary file object *out*."""
+
+    days = calendar.monthrange(y, m)[1]
+
+    # ── 直接寫進範本副本（不在記憶體裡組整本活頁簿）──
+    book = TemplateBook(payroll_template(), out)
+    existing = set(book.sheetnames)
     ym_token = f"{y}{m:02d}"
-    for s in wb_new.worksheets:
-        new_title = make_new_title(s.title, ym_token, existing)
-        clone_sheet(s, wb_tpl, new_title=new_title)
-        existing.add(new_title)
 
-    out_buf = io.BytesIO()
-    wb_tpl.save(out_buf)
-    out_buf.seek(0)
+    fmt = {
+        'hdr':   book.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3'}),
+        'cell':  book.add_format({'border': 1, 'align': 'center'}),
+        'hol':   book.add_format({'border': 1, 'align': 'center', 'bg_color': '#FFF2CC'}),
+        'leave': book.add_format({'border': 1, 'align': 'center', 'bg_color': '#FFFF00'}),
+        'total': book.add_format({'bold': True, 'border': 1, 'align': 'center'}),
+        'note':  book.add_format({'border': 1, 'align': 'left'}),
+    }
+
+    directory = get_directory()
+    areas = directory.areas()
+
+    # 直接讀每日摘要（HH:MM ≤ NIGHT_END 的下班已歸前一天）
+    mh = month_hours(y, m, [e.id for a in areas for e in directory.in_area(a)])
+    hol_all = mh.hol
+    reg_tot, ot2_tot, otx_tot = (running_total(mh.reg), running_total(mh.ot2),
+                                 running_total(mh.otx))
+    hol_tot = running_total(hol_all)
+    wdays = mh.worked.sum(axis=1)
+    is_hol = [bool(h) for h in mh.is_hol]
+
+    # 每區一份 payload（只含本區的列，轉成 list 後逐日取值較快，也能送進子行程）
+    sheets = []
+    for area in areas:
+        emps = directory.in_area(area)
+        if not emps:
+            continue
+
+        title = make_new_title(area, ym_token, existing)
+        existing.add(title)
 
-    return send_file(
-        out_buf,
-        as_attachment=True,
-        download_name=f"{y}-{m:02d}_薪資報表.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+        rows = [mh.row(emp.id) for emp in emps]
+        sheets.append((title, {
+            "m": m, "days": days, "is_hol": is_hol, "fmt": fmt,
+            "emps": [(emp.id, emp.name) for emp in emps],
+            "reg": mh.reg[rows].tolist(), "ot2": mh.ot2[rows].tolist(),
+            "otx": mh.otx[rows].tolist(), "hol": hol_all[rows].tolist(),
+            "leave": [mh.leave.get(emp.id, {}) for emp in emps],
+            "totals": [[float(reg_tot[i]), float(ot2_tot[i]), float(otx_tot[i]),
+                        float(hol_tot[i]), int(wdays[i]), ''] for i in rows],
+        }))
+
+    _add_sheets(book, _payroll_sheet, sheets)
+    book.close()
+
+
+@exp_bp.route("/export")
+@counted("export")
+def export():
+    y, m = parse_ym(request.args.get("ym"))
+    return _send(cached_export("payroll", y, m), "payroll", y, m)
 
 
 # ======================================================================
@@ -308,188 +320,292 @@ def _night_end_time():
         # 若參數格式不正確，保守採 02:59（未查證）
         return dtime(hour=2, minute=59)
 
-@exp_bp.route("/export/punch_all")
-def export_punch_all():
-    ym = request.args.get("ym")
-    today = date.today()
-    y, m = (map(int, ym.split("-"))
-            if ym and re.fullmatch(r"\d{4}-\d{2}", ym)
-            else (today.year, today.month))
-    days = calendar.monthrange(y, m)[1]
-    month_prefix = f"{y}-{m:02d}"
-    nxt = (date(y, m, 1) + timedelta(days=32)).replace(day=1)
+PUNCH_HEADERS = ['日期', '上午上', '上午下', '下午上', '下午下',
+                 '加班上', '加班下', '備註', '正班', '加班≤2', '加班>2', '假日']
+
+
+def _punch_sheet(ws, p: dict) -> None:
+    """Draw one employee's punch card sheet from its payload."""
+
+    headers = PUNCH_HEADERS
+    fmt_ = p["fmt"]
+    title_fmt, sub_fmt, hdr_fmt = fmt_["title"], fmt_["sub"], fmt_["hdr"]
+    cell_fmt, hol_fmt, total_fmt = fmt_["cell"], fmt_["hol"], fmt_["total"]
+    m, days, times = p["m"], p["days"], p["times"]
+    regs, ot2s, otxs, hols = p["reg"], p["ot2"], p["otx"], p["hol"]
+    # 備註來源：請假（lv）或紀錄上的 note
+    remarks = p["remarks"]
+
+    ws.set_column(0, 0, 10)      # 日期欄
+    ws.set_column(1, 6, 12)      # 六段打卡
+    ws.set_column(7, 7, 20)      # 備註
+    ws.set_column(8, 11, 10)     # 四個小時欄
+    ws.freeze_panes(3, 1)
+
+    # 標題 / 出勤天數
+    ws.merge_range(0, 0, 0, len(headers)-1, p["title"], title_fmt)
+    ws.merge_range(1, 0, 1, len(headers)-1, f"出勤天數：{p['attend']}", sub_fmt)
+
+    for c, h in enumerate(headers):
+        ws.write(2, c, h, hdr_fmt)
+
+    # 寫入表格（工時已由 compute_month 依月表演算法算好）
+    for d in range(1, days + 1):
+        row = 3 + d - 1
+        is_weekend = p["is_hol"][d - 1]
+        fmt = hol_fmt if is_weekend else cell_fmt
+        reg, ot2, otx, hol_hours = regs[d - 1], ot2s[d - 1], otxs[d - 1], hols[d - 1]
+
+        # 寫入日期
+        ws.write(row, 0, f"{m:02d}-{d:02d}", fmt)
+
+        # 寫入六段打卡
+        for k in range(6):
+            ws.write(row, 1 + k, times[k][d - 1], fmt)
+
+        # 備註（去重後以「；」串接）
+        note_txt = '；'.join(sorted(set(remarks.get(f"{d:02d}", []))))
+        ws.write(row, 7, note_txt, fmt)
+
+        # 寫入四個小時欄（週末全部放「假日」，平日各自填入）
+        if is_weekend:
+            ws.write(row, 8,  '', fmt)  # 正班
+            ws.write(row, 9,  '', fmt)  # 加班≤2
+            ws.write(row,10,  '', fmt)  # 加班>2
+            ws.write(row,11,  hol_hours or '', fmt)
+        else:
+            ws.write(row, 8,  reg or '', fmt)
+            ws.write(row, 9,  ot2 or '', fmt)
+            ws.write(row,10,  otx or '', fmt)
+            ws.write(row,11,  '', fmt)  # 假日
+
+    # 總計列（此檔僅卡片視覺用，總計列只畫框）
+    tr = 3 + days
+    ws.write(tr, 0, "總計", total_fmt)
+    for c in range(1, len(headers)):
+        ws.write(tr, c, '', total_fmt)
+
+
+def _punch_month(y: int, m: int):
+    """(employees, MonthHours) behind the punch card exports of (y, m).
+
+    Raises ValueError when there are no employees.
+    """
 
-    emps = Employee.query.order_by(Employee.area, Employee.id).all()
+    # 與原 ORDER BY area, id 相同：無區域者排最前
+    emps = sorted(get_directory().all(), key=lambda e: (e.area is not None, e.area or "", e.id))
     if not emps:
-        return abort(400, "無員工資料")
+        raise ValueError("無員工資料")
 
+    # 整月打卡一次取出（已結帳的月份讀快照），全員工時整批計算（時間 ≤ NIGHT_END 的下班歸前一天）
     ne_time = _night_end_time()
+    mh = card_hours(y, m, [e.id for e in emps], [e.default_break for e in emps],
+                    cutoff=ne_time.hour * 3600 + ne_time.minute * 60 + 1)
+    return emps, mh
 
-    # 取本月資料＋下月首日 00:00~NIGHT_END 的 out（跨月歸前日）
-    all_raws = (Checkin.query
-                .with_entities(Checkin.employee_id, Checkin.work_date,
-                               Checkin.p_type, Checkin.ts, Checkin.note)
-                .filter(
-                    (Checkin.work_date.like(f"{month_prefix}%")) |
-                    ((Checkin.work_date == nxt.isoformat()) &
-                     (Checkin.p_type.like('%-out')) &
-                     (Checkin.ts < f"{nxt}T{NIGHT_END}:00"))
-                )
-                .order_by(Checkin.employee_id, Checkin.work_date, Checkin.ts)
-                .all())
-
-    # 依員工分組
-    by_emp = {}
-    for r in all_raws:
-        by_emp.setdefault(r.employee_id, []).append(r)
-
-    # ---------------- Excel 建立 ----------------
-    buf = io.BytesIO()
-    writer = pd.ExcelWriter(buf, engine="xlsxwriter")
-    book = writer.book
-
-    title_fmt = book.add_format({'bold': True, 'align': 'center', 'font_size': 14})
-    sub_fmt   = book.add_format({'align': 'center'})
-    hdr_fmt   = book.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3'})
-    cell_fmt  = book.add_format({'border': 1, 'align': 'center'})
-    hol_fmt   = book.add_format({'border': 1, 'align': 'center', 'bg_color': '#EDEDED'})
-    total_fmt = book.add_format({'bold': True, 'border': 1, 'align': 'center'})
-
-    headers = ['日期', '上午上', '上午下', '下午上', '下午下',
-               '加班上', '加班下', '備註', '正班', '加班≤2', '加班>2', '假日']
 
+def build_punch_all(y: int, m: int, out) -> None:
+    """Write the all-employee punch card workbook for (y, m) into *out*.
+
+    Raises ValueError when there are no employees.
+    """
+
+    days = calendar.monthrange(y, m)[1]
+    emps, mh = _punch_month(y, m)
+    hol_all = mh.hol
+    attend = mh.worked.sum(axis=1)
+    is_hol = [bool(h) for h in mh.is_hol]
+
+    # ---------------- Excel 建立（空白活頁簿，逐張串流寫入）----------------
+    book = TemplateBook(None, out)
+    fmt = {
+        'title': book.add_format({'bold': True, 'align': 'center', 'font_size': 14}),
+        'sub':   book.add_format({'align': 'center'}),
+        'hdr':   book.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3'}),
+        'cell':  book.add_format({'border': 1, 'align': 'center'}),
+        'hol':   book.add_format({'border': 1, 'align': 'center', 'bg_color': '#EDEDED'}),
+        'total': book.add_format({'bold': True, 'border': 1, 'align': 'center'}),
+    }
+
+    # 每人一份 payload（逐人轉 list，可分批送進子行程繪製）
+    sheets = []
     for emp in emps:
-        ws = book.add_worksheet(f"{(emp.area or '')}-{emp.id}-{emp.name}"[:31])
-
-        # 標題
-        ws.merge_range(0, 0, 0, len(headers)-1,
-                       f"{emp.name}（{emp.id}） 區域：{emp.area or ''}  {y}/{m:02d}",
-                       title_fmt)
-        ws.merge_range(1, 0, 1, len(headers)-1, "出勤天數：", sub_fmt)
-
-        for c, h in enumerate(headers):
-            ws.write(2, c, h, hdr_fmt)
-
-        ws.set_column(0, 0, 10)      # 日期欄
-        ws.set_column(1, 6, 12)      # 六段打卡
-        ws.set_column(7, 7, 20)      # 備註
-        ws.set_column(8, 11, 10)     # 四個小時欄
-        ws.freeze_panes(3, 1)
-
-        # 為每一天預留 11 欄（不含日期）；前 6 欄打卡、接著備註、最後 4 欄為小時計算
-        rec_by_day = {date(y, m, d).isoformat(): [''] * 11
-                      for d in range(1, days + 1)}
-        # 備註來源：請假（lv）或紀錄上的 note
-        notes_by_day = {date(y, m, d).isoformat(): [] for d in range(1, days + 1)}
-
-        # 整理打卡與備註；處理 00:00~NIGHT_END 的 out 歸前日
-        for r in by_emp.get(emp.id, []):
-            ts_dt = datetime.fromisoformat(r.ts)
-            hm = ts_dt.strftime("%H:%M")
-
-            # 決定歸屬日期
-            if r.p_type.endswith('-out') and ts_dt.time() <= ne_time:
-                tgt_date = (ts_dt.date() - timedelta(days=1)).isoformat()
-            else:
-                tgt_date = r.work_date
-
-            if tgt_date[:7] != month_prefix:
-                continue
-            if tgt_date not in rec_by_day:
-                # 防跨月前一日（例如 1 號 00:30 歸 上月末）超出本月表格時略過
-                continue
-
-            # 六段打卡
-            col = _COL_MAP.get(r.p_type)
-            if col:
-                rec_by_day[tgt_date][col - 1] = hm
-
-            # 備註（請假或一般 note）
-            if r.p_type == LEAVE_PTYPE:
-                notes_by_day[tgt_date].append(r.note or '請假')
-            elif r.note:
-                notes_by_day[tgt_date].append(r.note)
-
-        # 寫入表格與每日工時計算（沿用月表演算法）
-        attend_days = 0
-        for d in range(1, days + 1):
-            the_date = date(y, m, d)
-            row = 3 + d - 1
-            is_weekend = the_date.weekday() >= 5
-            fmt = hol_fmt if is_weekend else cell_fmt
-            cols = rec_by_day[the_date.isoformat()]
-
-            # 取六段時間字串
-            s_am, e_am, s_pm, e_pm, s_ot, e_ot = cols[0], cols[1], cols[2], cols[3], cols[4], cols[5]
-
-            # 以月表同邏輯計算（正班最多 8、加班分 ≤2 與 >2；週末全部歸「假日」顯示）
-            reg = ot2 = otx = 0.0
-
-            # 上午：若無 am-out 但有 pm-out，允許用 pm-out 收尾（你的月表行為）
-            if s_am and (e_am or e_pm):
-                end_am = e_am or e_pm
-                has_pm_in = bool(s_pm)
-                h = sum(calc_hours(s_am, end_am, emp.default_break, skip_break=has_pm_in))
-                take_reg = min(h, 8 - reg); reg += take_reg
-                remain   = h - take_reg
-                take2    = min(remain, 2 - ot2); ot2 += take2; otx += remain - take2
-
-            # 下午
-            if s_pm and e_pm:
-                h = sum(calc_hours(s_pm, e_pm, emp.default_break, skip_break=True))
-                take_reg = min(h, 8 - reg); reg += take_reg
-                remain   = h - take_reg
-                take2    = min(remain, 2 - ot2); ot2 += take2; otx += remain - take2
-
-            # 加班
-            if s_ot and e_ot:
-                h = sum(calc_hours(s_ot, e_ot, emp.default_break, skip_break=True))
-                take2 = min(h, 2 - ot2); ot2 += take2; otx += h - take2
-
-            hol_hours = (reg + ot2 + otx) if is_weekend else 0.0
-
-            # 出勤天數（有任一時數則+1；僅備註/請假不算）
-            if reg or ot2 or otx or hol_hours:
-                attend_days += 1
-
-            # 寫入日期
-            ws.write(row, 0, f"{m:02d}-{d:02d}", fmt)
-
-            # 寫入六段打卡
-            for i in range(6):
-                ws.write(row, 1 + i, cols[i], fmt)
-
-            # 備註（去重後以「；」串接）
-            note_txt = '；'.join(sorted(set(notes_by_day[the_date.isoformat()]))) if notes_by_day[the_date.isoformat()] else ''
-            ws.write(row, 7, note_txt, fmt)
-
-            # 寫入四個小時欄（週末全部放「假日」，平日各自填入）
-            if is_weekend:
-                ws.write(row, 8,  '', fmt)  # 正班
-                ws.write(row, 9,  '', fmt)  # 加班≤2
-                ws.write(row,10,  '', fmt)  # 加班>2
-                ws.write(row,11,  hol_hours or '', fmt)
-            else:
-                ws.write(row, 8,  reg or '', fmt)
-                ws.write(row, 9,  ot2 or '', fmt)
-                ws.write(row,10,  otx or '', fmt)
-                ws.write(row,11,  '', fmt)  # 假日
+        i = mh.row(emp.id)
+        sheets.append((f"{(emp.area or '')}-{emp.id}-{emp.name}"[:31], {
+            "m": m, "days": days, "is_hol": is_hol, "fmt": fmt,
+            "title": f"{emp.name}（{emp.id}） 區域：{emp.area or ''}  {y}/{m:02d}",
+            "attend": int(attend[i]),
+            "times": [mh.times[k, i].tolist() for k in range(len(SEGMENTS))],
+            "reg": mh.reg[i].tolist(), "ot2": mh.ot2[i].tolist(),
+            "otx": mh.otx[i].tolist(), "hol": hol_all[i].tolist(),
+            "remarks": mh.remarks.get(emp.id, {}),
+        }))
+
+    _add_sheets(book, _punch_sheet, sheets)
+    book.close()
+
+
+# ─────────────── 長表格式（csv / ndjson / parquet）───────────────
+LONG_COLUMNS = ['區域', '員工編號', '姓名'] + PUNCH_HEADERS
+
+LONG_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "{y}-{m:02d}_工時卡片_全員.csv"),
+    "ndjson": ("application/x-ndjson", "{y}-{m:02d}_工時卡片_全員.ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "{y}-{m:02d}_工時卡片_全員.parquet"),
+}
 
-        # 總計列（此檔僅卡片視覺用，總計列只畫框）
-        tr = 3 + days
-        ws.write(tr, 0, "總計", total_fmt)
-        for c in range(1, len(headers)):
-            ws.write(tr, c, '', total_fmt)
 
-        # 出勤天數
-        ws.write(1, 0, f"出勤天數：{attend_days}", sub_fmt)
+def punch_rows(y: int, m: int):
+    """Long-format rows for (y, m), one list per employee: each day, then a total.
 
-    writer.close()
-    buf.seek(0)
+    Rows are lists in LONG_COLUMNS order; missing times / hours are None.
+    Same values as the punch card sheets: on weekends the hours go to 假日.
+    Raises ValueError (before yielding anything) when there are no employees.
+    """
 
-    return send_file(
-        buf,
-        as_attachment=True,
-        download_name=f"{y}-{m:02d}_工時卡片_全員.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    emps, mh = _punch_month(y, m)
+    hol_all = mh.hol
+    attend = mh.worked.sum(axis=1)
+    is_hol = mh.is_hol.tolist()
+
+    def generate():
+        for emp in emps:
+            i = mh.row(emp.id)
+            times = [mh.times[k, i].tolist() for k in range(len(SEGMENTS))]
+            regs, ot2s, otxs, hols = (mh.reg[i].tolist(), mh.ot2[i].tolist(),
+                                      mh.otx[i].tolist(), hol_all[i].tolist())
+            remarks = mh.remarks.get(emp.id, {})
+            head = [emp.area or '', emp.id, emp.name]
+            rows = []
+            tot = [0.0, 0.0, 0.0, 0.0]
+            for d in range(mh.days):
+                if is_hol[d]:
+                    hours = [None, None, None, hols[d] or None]
+                else:
+                    hours = [regs[d] or None, ot2s[d] or None, otxs[d] or None, None]
+                for k, h in enumerate(hours):
+                    tot[k] += h or 0.0
+                note = '；'.join(sorted(set(remarks.get(f"{d + 1:02d}", []))))
+                rows.append(head + [f"{y}-{m:02d}-{d + 1:02d}"]
+                            + [t[d] or None for t in times] + [note or None] + hours)
+            rows.append(head + ['總計'] + [None] * 6 + [f"出勤天數：{int(attend[i])}"] + tot)
+            yield rows
+
+    return generate()
+
+
+def _csv_chunks(rows):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    # BOM 讓 Excel 直接開也認得 UTF-8
+    buf.write("\ufeff")
+    w.writerow(LONG_COLUMNS)
+    for chunk in rows:
+        w.writerows(chunk)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _ndjson_chunks(rows):
+    for chunk in rows:
+        yield "".join(json.dumps(dict(zip(LONG_COLUMNS, r)), ensure_ascii=False) + "\n"
+                      for r in chunk)
+
+
+def _parquet_bytes(rows) -> bytes:
+    import pandas as pd     # 只有 parquet 用得到
+
+    df = pd.DataFrame([r for chunk in rows for r in chunk], columns=LONG_COLUMNS)
+    out = io.BytesIO()
+    df.to_parquet(out, index=False)     # 需要 pyarrow（或 fastparquet）
+    return out.getvalue()
+
+
+def _send_long(fmt: str, y: int, m: int):
+    try:
+        rows = punch_rows(y, m)
+    except ValueError as e:
+        return abort(400, str(e))
+    mimetype, name = LONG_FORMATS[fmt]
+    name = name.format(y=y, m=m)
+    if fmt == "parquet":
+        try:
+            data = _parquet_bytes(rows)
+        except ImportError:
+            return abort(501, "伺服器未安裝 pyarrow，無法輸出 parquet")
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=name,
+                         mimetype=mimetype)
+    chunks = _csv_chunks(rows) if fmt == "csv" else _ndjson_chunks(rows)
+    resp = Response(stream_with_context(chunks), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(name)}"
+    return resp
+
+
+@exp_bp.route("/export/punch_all")
+@counted("export_punch_all")
+def export_punch_all():
+    y, m = parse_ym(request.args.get("ym"))
+    fmt = request.args.get("format", "xlsx")
+    if fmt in LONG_FORMATS:
+        return _send_long(fmt, y, m)
+    if fmt != "xlsx":
+        return abort(400, "format 只能是 xlsx / csv / ndjson / parquet")
+    try:
+        path = cached_export("punch_all", y, m)
+    except ValueError as e:
+        return abort(400, str(e))
+    return _send(path, "punch_all", y, m)
+
+
+# ======================================================================
+# 匯出結果快取（背景匯出工作共用）
+# ======================================================================
+BUILDERS = {
+    "payroll": build_payroll,
+    "punch_all": build_punch_all,
+}
+
+# 報表版面改變時 +1，讓舊版產生的檔案全部失效
+CACHE_FORMAT = 1
+
+
+def _cache_dir() -> Path:
+    d = Path(current_app.config["EXPORT_CACHE_DIR"])
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def cache_path(report: str, y: int, m: int) -> Path:
+    """Where (report, y, m) is cached for the current template / data watermark."""
+
+    tpl = load_template(payroll_template()).digest if report == "payroll" else ""
+    max_id, rev = watermark(y, m)
+    key = f"{CACHE_FORMAT}|{tpl}|{max_id}|{rev}|{get_directory().version()}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return _cache_dir() / f"{report}-{y}-{m:02d}-{digest}.xlsx"
+
+
+def cached_export(report: str, y: int, m: int) -> Path:
+    """Finished workbook for (report, y, m), built (and cached) on a miss."""
+
+    # watermark 要在讀資料之前取：之後才寫入的打卡只會讓這份檔案「比鍵新」，不會過期
+    path = cache_path(report, y, m)
+    if path.exists():
+        cache_event(report, "hit")
+        return path
+
+    cache_event(report, "miss")
+    part = path.with_name(f".{path.stem}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        with open(part, "wb") as out:
+            BUILDERS[report](y, m, out)
+        os.replace(part, path)
+    finally:
+        part.unlink(missing_ok=True)
+
+    # 同一份報表 / 月份只留最新的一個檔
+    for old in path.parent.glob(f"{report}-{y}-{m:02d}-*.xlsx"):
+        if old != path:
+            old.unlink(missing_ok=True)
+    return path
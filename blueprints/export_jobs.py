@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+背景匯出工作：薪資報表 / 工時卡片總檔改在獨立行程裡產生，不佔住 gunicorn worker。
+
+  POST /admin/export/jobs  report=payroll|punch_all, ym=YYYY-MM  建立（或沿用）工作 → 狀態頁
+                           （只收 POST：預先載入、爬蟲的 GET 不會啟動匯出）
+  GET /admin/export/jobs/<id>                                   狀態頁（?format=json 回 JSON）
+  GET /admin/export/jobs/<id>/download                          下載結果
+
+- 每個 worker 一個 ProcessPoolExecutor（最多 EXPORT_WORKERS 個行程，spawn 啟動，
+  子行程自己 create_app()，不沿用父行程的 DB 連線）
+- 工作狀態與結果檔都放在 EXPORT_JOB_DIR（本機磁碟），所有 worker 共用：
+    <id>.json 狀態、<id>.xlsx 結果、<report>-<ym>.lock 進行中的工作
+- 同一份 (報表, 月份) 已在排隊或執行中時直接回傳那一個工作，不重複產生；
+  .lock 以 os.link 建立（已存在即失敗），跨 worker 也不會重複
+- 送出工作的 worker 已經不在時，排隊 / 執行中的工作視為失敗，可重新送出
+- 超過 EXPORT_JOB_KEEP_SEC 的狀態與結果檔在建立新工作時順手清掉
+- 結果取自匯出快取（export.cached_export）；快取裡已有同一份資料的檔案時
+  不排隊，建立工作時就直接是「已完成」
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from flask import (Blueprint, abort, current_app, jsonify, redirect, render_template_string,
+                   request, send_file, url_for)
+
+from . import CSS
+from .export import BUILDERS, REPORT_NAMES, XLSX_MIME, cache_path, cached_export, parse_ym
+from .metrics import cache_event
+
+job_bp = Blueprint("jobs", __name__, url_prefix="/admin")
+
+REPORT_TITLES = {
+    "payroll": "員工薪資報表",
+    "punch_all": "工時卡片總檔",
+}
+ACTIVE = ("queued", "running")
+JOB_ID = re.compile(r"[\w-]+")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_pid = 0
+_pool_lock = threading.Lock()
+
+# 子行程內的 Flask app（_init_worker 建立）
+_worker_app = None
+
+
+# ────────────────────── 子行程 ──────────────────────
+def _init_worker() -> None:
+    global _worker_app
+    from app import create_app      # 子行程才 import，避免循環引用
+    _worker_app = create_app()
+
+
+def _run(job_dir: str, job_id: str, report: str, y: int, m: int) -> int:
+    """Build one report into <job_id>.xlsx; runs in a pool process."""
+
+    path = Path(job_dir) / f"{job_id}.xlsx"
+    part = path.with_suffix(".part")
+    _update(Path(job_dir), job_id, state="running", started=time.time(), worker=os.getpid())
+    with _worker_app.app_context():
+        src = cached_export(report, y, m)
+    _link(src, part)
+    os.replace(part, path)
+    return path.stat().st_size
+
+
+def _link(src: Path, dst: Path) -> None:
+    # 快取檔之後可能被新版取代，工作結果另外留一個硬連結（不同磁碟則複製）
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# ────────────────────── 狀態檔 ──────────────────────
+def _job_dir() -> Path:
+    d = Path(current_app.config["EXPORT_JOB_DIR"])
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _write(job_dir: Path, job: dict) -> None:
+    tmp = job_dir / f".{job['id']}.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(job, ensure_ascii=False))
+    os.replace(tmp, job_dir / f"{job['id']}.json")
+
+
+def _read(job_dir: Path, job_id: str) -> dict | None:
+    try:
+        return json.loads((job_dir / f"{job_id}.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _update(job_dir: Path, job_id: str, **changes) -> dict | None:
+    job = _read(job_dir, job_id)
+    if job is None:
+        return None
+    job.update(changes)
+    _write(job_dir, job)
+    return job
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _check(job_dir: Path, job: dict | None) -> dict | None:
+    """Mark an active job whose submitting worker is gone as failed."""
+
+    if job and job["state"] in ACTIVE and not _alive(job["owner"]):
+        job = _update(job_dir, job["id"], state="error", error="匯出行程已結束，請重新送出",
+                      finished=time.time())
+        _unlock(job_dir, job)
+    return job
+
+
+def _lock_path(job_dir: Path, report: str, y: int, m: int) -> Path:
+    return job_dir / f"{report}-{y}-{m:02d}.lock"
+
+
+def _unlock(job_dir: Path, job: dict) -> None:
+    lock = _lock_path(job_dir, job["report"], job["y"], job["m"])
+    try:
+        if lock.read_text() == job["id"]:
+            lock.unlink()
+    except OSError:
+        pass
+
+
+def _prune(job_dir: Path, keep_sec: int) -> None:
+    cutoff = time.time() - keep_sec
+    for p in job_dir.glob("*.json"):
+        job = _read(job_dir, p.stem)
+        if job is None or job["state"] in ACTIVE or job.get("finished", 0) > cutoff:
+            continue
+        for suffix in (".xlsx", ".part", ".json"):
+            (job_dir / f"{p.stem}{suffix}").unlink(missing_ok=True)
+
+
+# ────────────────────── 送出 / 完成 ──────────────────────
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(
+                    max_workers=max(1, int(current_app.config.get("EXPORT_WORKERS", 2))),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard_pool(pool) -> None:
+    """Drop a pool whose process died so the next job starts a fresh one."""
+
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(report: str, y: int, m: int) -> dict:
+    """Queue (report, y, m), or return the identical job already queued/running."""
+
+    job_dir = _job_dir()
+    _prune(job_dir, int(current_app.config.get("EXPORT_JOB_KEEP_SEC", 86400)))
+    lock = _lock_path(job_dir, report, y, m)
+
+    job = {
+        "id": f"{report}-{y}{m:02d}-{uuid.uuid4().hex[:8]}",
+        "report": report, "y": y, "m": m,
+        "state": "queued", "owner": os.getpid(),
+        "created": time.time(), "error": None, "size": None,
+    }
+
+    # 快取命中：不必排隊
+    result = job_dir / f"{job['id']}.xlsx"
+    try:
+        _link(cache_path(report, y, m), result)
+    except FileNotFoundError:
+        pass
+    else:
+        cache_event(report, "hit")
+        job.update(state="done", size=result.stat().st_size, finished=job["created"])
+        _write(job_dir, job)
+        return job
+
+    _write(job_dir, job)
+    tmp = job_dir / f".{job['id']}.lock"
+    tmp.write_text(job["id"])
+    try:
+        for _ in range(3):
+            try:
+                os.link(tmp, lock)
+                break
+            except FileExistsError:
+                try:
+                    other = _check(job_dir, _read(job_dir, lock.read_text()))
+                except OSError:
+                    continue                         # 另一個工作剛結束，再試一次
+                if other and other["state"] in ACTIVE:
+                    (job_dir / f"{job['id']}.json").unlink(missing_ok=True)
+                    return other
+                lock.unlink(missing_ok=True)         # 殘留的 lock
+        else:
+            raise RuntimeError(f"could not lock export job {lock.name}")
+    finally:
+        tmp.unlink(missing_ok=True)
+
+    try:
+        try:
+            pool = _get_pool()
+            future = pool.submit(_run, str(job_dir), job["id"], report, y, m)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            pool = _get_pool()
+            future = pool.submit(_run, str(job_dir), job["id"], report, y, m)
+    except Exception as e:
+        job = _update(job_dir, job["id"], state="error", error=str(e), finished=time.time())
+        _unlock(job_dir, job)
+        return job
+    future.add_done_callback(lambda f: _finish(job_dir, job["id"], f, pool))
+    return job
+
+
+def _finish(job_dir: Path, job_id: str, future, pool) -> None:
+    err = future.exception()
+    if isinstance(err, BrokenProcessPool):
+        _discard_pool(pool)
+    if err is None:
+        job = _update(job_dir, job_id, state="done", size=future.result(), finished=time.time())
+    else:
+        job = _update(job_dir, job_id, state="error", error=str(err) or type(err).__name__,
+                      finished=time.time())
+        (job_dir / f"{job_id}.part").unlink(missing_ok=True)
+    if job is not None:
+        _unlock(job_dir, job)
+
+
+# ────────────────────── 路由 ──────────────────────
+STATUS_HTML = """<!doctype html><html><head>{{ css|safe }}
+{% if job.state in active %}<meta http-equiv="refresh" content="2">{% endif %}</head><body>
+<h2>{{ title }}　{{ job.y }}/{{ '%02d' % job.m }}</h2>
+{% if job.state == 'done' %}
+  <p>已完成。<a href="{{ url_for('jobs.download', job_id=job.id) }}">下載 {{ name }}</a></p>
+{% elif job.state == 'error' %}
+  <p>匯出失敗：{{ job.error }}</p>
+  <form method="post" action="{{ url_for('jobs.create') }}">
+  <input type="hidden" name="report" value="{{ job.report }}">
+  <input type="hidden" name="ym" value="{{ '%d-%02d' % (job.y, job.m) }}">
+  <button type="submit">重新匯出</button></form>
+{% else %}
+  <p>{{ '排隊中' if job.state == 'queued' else '產生中' }}…（頁面每 2 秒自動更新）</p>
+{% endif %}
+<p><a href="{{ url_for('rec.show_records', ym='%d-%02d' % (job.y, job.m)) }}">返回出勤卡查詢</a></p>
+</body></html>"""
+
+
+@job_bp.route("/export/jobs", methods=["POST"])
+def create():
+    report = request.values.get("report", "")
+    if report not in BUILDERS:
+        return abort(400, "未知的報表種類")
+    y, m = parse_ym(request.values.get("ym"))
+    job = submit(report, y, m)
+    if request.values.get("format") == "json":
+        return jsonify(job), 202
+    return redirect(url_for("jobs.status", job_id=job["id"]))
+
+
+@job_bp.route("/export/jobs/<job_id>")
+def status(job_id):
+    job_dir = _job_dir()
+    job = _check(job_dir, _read(job_dir, job_id)) if JOB_ID.fullmatch(job_id) else None
+    if job is None:
+        return abort(404)
+    if request.args.get("format") == "json":
+        return jsonify(job)
+    return render_template_string(
+        STATUS_HTML, css=CSS, job=job, active=ACTIVE, title=REPORT_TITLES[job["report"]],
+        name=REPORT_NAMES[job["report"]].format(y=job["y"], m=job["m"]),
+    )
+
+
+@job_bp.route("/export/jobs/<job_id>/download")
+def download(job_id):
+    job_dir = _job_dir()
+    job = _read(job_dir, job_id) if JOB_ID.fullmatch(job_id) else None
+    if job is None or job["state"] != "done":
+        return abort(404)
+    return send_file(
+        job_dir / f"{job_id}.xlsx",
+        as_attachment=True,
+        download_name=REPORT_NAMES[job["report"]].format(y=job["y"], m=job["m"]),
+        mimetype=XLSX_MIME,
+    )
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+打卡定位圍欄的空間索引。
+
+PUNCH_GEOFENCE_POINTS 只在座標清單（或半徑）改變時才重新解析，
+預先建成「經緯度格網 → 地點索引」；查詢時先用格網挑出附近候選點，
+再以 NumPy 一次算完候選點的大圓距離，地點數上百也不必逐點計算。
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+
+import numpy as np
+from flask import current_app
+
+EARTH_R_M = 6371000.0
+M_PER_DEG_LAT = 111320.0
+
+
+def _haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distances (m) from one point to arrays of points, all in degrees."""
+
+    p1 = math.radians(lat)
+    p2 = np.radians(lats)
+    d_lat = p2 - p1
+    d_lon = np.radians(lons - lon)
+    a = np.sin(d_lat / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_R_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class GeofenceIndex:
+    """Grid-bucketed site list with vectorized distance queries."""
+
+    def __init__(self, points, radius_m: float):
+        clean: list[tuple[float, float]] = []
+        for p in points or []:
+            try:
+                lat, lon = p
+                clean.append((float(lat), float(lon)))
+            except Exception:
+                continue
+
+        self.points = clean
+        self.radius_m = float(radius_m)
+        self._lats = np.array([p[0] for p in clean], dtype=float)
+        self._lons = np.array([p[1] for p in clean], dtype=float)
+
+        # 格子邊長 ≈ 半徑（緯度方向）；經度方向查詢時依緯度放寬格數
+        self._cell = max(self.radius_m, 1.0) / M_PER_DEG_LAT
+        grid: dict[tuple[int, int], list[int]] = {}
+        for i, (lat, lon) in enumerate(clean):
+            grid.setdefault(self._key(lat, lon), []).append(i)
+        self._grid = {k: np.array(v, dtype=int) for k, v in grid.items()}
+
+    def _key(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self._cell), math.floor(lon / self._cell)
+
+    def _candidates(self, lat: float, lon: float, reach_m: float) -> np.ndarray:
+        ci, cj = self._key(lat, lon)
+        cell_m = self._cell * M_PER_DEG_LAT
+        span_i = math.ceil(reach_m / cell_m)
+        span_j = math.ceil(reach_m / (cell_m * max(math.cos(math.radians(lat)), 0.01))) + 1
+        hits = [
+            self._grid[(i, j)]
+            for i in range(ci - span_i, ci + span_i + 1)
+            for j in range(cj - span_j, cj + span_j + 1)
+            if (i, j) in self._grid
+        ]
+        return np.concatenate(hits) if hits else np.empty(0, dtype=int)
+
+    def nearest_m(self, lat: float, lon: float) -> float | None:
+        """Distance to the nearest site; only scans every site when none is close."""
+
+        if not self.points:
+            return None
+        idx = self._candidates(lat, lon, self.radius_m)
+        if idx.size:
+            d = float(_haversine_m(lat, lon, self._lats[idx], self._lons[idx]).min())
+            if d <= self.radius_m:
+                return d
+        return float(_haversine_m(lat, lon, self._lats, self._lons).min())
+
+    def nearby(self, lat: float, lon: float, margin_m: float = 0.0) -> list[tuple[float, float]]:
+        """Sites within radius + margin of the given position."""
+
+        reach = self.radius_m + max(margin_m, 0.0)
+        idx = self._candidates(lat, lon, reach)
+        if not idx.size:
+            return []
+        d = _haversine_m(lat, lon, self._lats[idx], self._lons[idx])
+        return [self.points[i] for i in np.sort(idx[d <= reach])]
+
+
+_lock = threading.Lock()
+_cached: tuple = ((), None, None)   # (座標內容副本, 半徑, 索引)
+
+
+def get_index() -> GeofenceIndex:
+    """Return the index for the current config, rebuilding only if it changed."""
+
+    global _cached
+    points = current_app.config.get("PUNCH_GEOFENCE_POINTS") or ()
+    radius = float(current_app.config.get("PUNCH_ALLOW_RADIUS_M", 100))
+    # 逐點比對內容而非清單物件：換了物件但內容相同時沿用原索引，
+    # 原地改了座標（長度不變）也會重建
+    content = tuple(tuple(p) for p in points)
+    copy, rad, index = _cached
+    if copy == content and rad == radius:
+        return index
+    with _lock:
+        copy, rad, index = _cached
+        if copy != content or rad != radius:
+            index = GeofenceIndex(content, radius)
+            _cached = (content, radius, index)
+    return index
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+每月工時計算（月表、薪資報表、工時卡片總檔共用）。
+
+一次取出整個月的打卡，轉成「員工 × 日」陣列後整批計算：
+  - 凌晨下班歸前一日（各畫面的分界點不同，由 cutoff 參數決定）
+  - 上午 / 下午 / 加班三段，進位規則同 roundup()，跨 13:00 扣午休同 calc_hours()
+  - 每日依序分配正班 ≤ 8、加班 ≤ 2、加班 > 2
+算出的數字與逐日呼叫 calc_hours() 完全相同（含浮點誤差）。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+import calendar
+
+import numpy as np
+import pandas as pd
+
+from models import Checkin
+from . import NIGHT_END, LUNCH_POINT
+
+SEGMENTS = ("am-in", "am-out", "pm-in", "pm-out", "ot-in", "ot-out")
+LEAVE_PTYPE = "lv"
+
+_NE_H, _NE_M = map(int, NIGHT_END.split(":")[:2])
+NIGHT_END_SEC = _NE_H * 3600 + _NE_M * 60
+
+# 凌晨下班歸前日的分界（當日秒數 < cutoff 即歸前日）
+RECORDS_CUTOFF = 3 * 3600               # 月表：00:00–02:59
+PAYROLL_CUTOFF = NIGHT_END_SEC + 60     # 薪資報表：HH:MM ≤ NIGHT_END
+CARD_CUTOFF = NIGHT_END_SEC + 1         # 工時卡片：時間 ≤ NIGHT_END:00
+
+
+@dataclass
+class MonthHours:
+    """Per employee × day results for one month; rows follow *eids*."""
+
+    y: int
+    m: int
+    eids: list
+    days: int
+    is_hol: np.ndarray                  # (D,)   週六日
+    times: np.ndarray                   # (6, E, D) 'HH:MM' 或 ''，順序同 SEGMENTS
+    reg: np.ndarray                     # (E, D)
+    ot2: np.ndarray
+    otx: np.ndarray
+    leave: dict = field(default_factory=dict)     # eid → {'DD': 假別}
+    remarks: dict = field(default_factory=dict)   # eid → {'DD': [備註…]}
+
+    def __post_init__(self):
+        self._pos = {eid: i for i, eid in enumerate(self.eids)}
+
+    @property
+    def hol(self) -> np.ndarray:
+        return np.where(self.is_hol, self.reg + self.ot2 + self.otx, 0.0)
+
+    @property
+    def worked(self) -> np.ndarray:
+        return (self.reg != 0) | (self.ot2 != 0) | (self.otx != 0)
+
+    def row(self, eid) -> int:
+        return self._pos[eid]
+
+
+def load_rows(y: int, m: int, eids=None):
+    """All check-ins of the month plus the 1st of next month (for night outs)."""
+
+    first = date(y, m, 1)
+    nxt = (first + timedelta(days=32)).replace(day=1)
+    q = (
+        Checkin.query
+        .with_entities(Checkin.employee_id, Checkin.work_date,
+                       Checkin.p_type, Checkin.ts, Checkin.note)
+        .filter(Checkin.work_day.between(first, nxt))
+    )
+    if eids is not None:
+        q = q.filter(Checkin.employee_id.in_(list(eids)))
+    return q.all()
+
+
+def _round1(a: np.ndarray) -> np.ndarray:
+    # 與內建 round(x, 1) 逐值一致（np.round 的進位方式不同）
+    uniq, inv = np.unique(a, return_inverse=True)
+    return np.array([round(float(v), 1) for v in uniq])[inv].reshape(a.shape)
+
+
+def _segment(start, end, present, brk, skip_break) -> np.ndarray:
+    """Vectorized sum(calc_hours(start, end, brk, skip_break=...)); 0 where absent."""
+
+    h, mi = np.divmod(start, 60)
+    ih = np.where(mi == 0, h, np.where(mi >= 40, h + 1, h + 0.5))
+    h, mi = np.divmod(end, 60)
+    oh = np.where(mi < 25, h, np.where(mi < 55, h + 0.5, h + 1))
+    oh = np.where(oh <= ih, oh + 24, oh)
+
+    take_break = (ih < LUNCH_POINT) & (oh > LUNCH_POINT) & ~skip_break
+    total = np.maximum(oh - ih - np.where(take_break, brk, 0.0), 0)
+
+    reg = _round1(np.minimum(total, 8))
+    ot2 = _round1(np.minimum(np.maximum(total - 8, 0), 2))
+    otx = _round1(np.maximum(total - 10, 0))
+    return np.where(present, reg + ot2 + otx, 0.0)
+
+
+def compute_month(rows, y: int, m: int, eids: list, breaks: list, *,
+                  cutoff: int) -> MonthHours:
+    """Compute the employees × days matrix for (y, m) from *rows*.
+
+    rows: (employee_id, work_date, p_type, ts, note) as returned by load_rows().
+    breaks: default_break per employee, aligned with *eids*.
+    cutoff: seconds of day; an out punch earlier than this counts for the previous day.
+    """
+
+    days = calendar.monthrange(y, m)[1]
+    first = date(y, m, 1)
+    n_emp = len(eids)
+    is_hol = np.array([date(y, m, d).weekday() >= 5 for d in range(1, days + 1)])
+
+    minutes = np.full((len(SEGMENTS), n_emp, days), -1, dtype=np.int64)
+    times = np.full((len(SEGMENTS), n_emp, days), "", dtype=object)
+    leave: dict = {}
+    remarks: dict = {}
+
+    df = pd.DataFrame(list(rows), columns=["eid", "work_date", "p_type", "ts", "note"])
+    index = pd.Series(np.arange(n_emp), index=pd.Index(eids))
+    df["e"] = df["eid"].map(index)
+    df = df[df["e"].notna()]
+
+    if len(df):
+        hm = df["ts"].str.slice(11, 16)
+        sec = (
+            df["ts"].str.slice(11, 13).astype(int) * 3600
+            + df["ts"].str.slice(14, 16).astype(int) * 60
+            + pd.to_numeric(df["ts"].str.slice(17, 19), errors="coerce").fillna(0).astype(int)
+        )
+        wd = pd.to_datetime(df["work_date"], format="%Y-%m-%d")
+        raw_day = (wd - pd.Timestamp(first)).dt.days.to_numpy()
+        sec_np = sec.to_numpy()
+
+        is_out = df["p_type"].str.endswith("-out").to_numpy()
+        shift = is_out & (sec_np < cutoff)
+        day_no = raw_day - shift
+        # 下月 1 日只收 NIGHT_END 前、歸到本月最後一天的下班
+        from_next = raw_day >= days
+        keep = (day_no >= 0) & (day_no < days) & ~(from_next & (sec_np >= NIGHT_END_SEC))
+
+        df = df.assign(d=day_no, hm=hm, sec=sec)[keep]
+
+        # 同一天同類型有多筆時，work_date（其次 ts）較晚者為準
+        df = df.sort_values(["e", "work_date", "ts"], kind="stable")
+        seg = df[df["p_type"].isin(SEGMENTS)].drop_duplicates(["e", "d", "p_type"], keep="last")
+        p = seg["p_type"].map({t: i for i, t in enumerate(SEGMENTS)}).to_numpy()
+        e = seg["e"].to_numpy(dtype=np.int64)
+        d = seg["d"].to_numpy()
+        minutes[p, e, d] = (seg["sec"].to_numpy() // 60)
+        times[p, e, d] = seg["hm"].to_numpy()
+
+        for r in df[(df["p_type"] == LEAVE_PTYPE) | df["note"].notna()].itertuples():
+            dd = f"{r.d + 1:02d}"
+            note = r.note if isinstance(r.note, str) else None     # pandas 以 NaN 表示空值
+            if r.p_type == LEAVE_PTYPE:
+                leave.setdefault(r.eid, {})[dd] = note or "請假"
+                remarks.setdefault(r.eid, {}).setdefault(dd, []).append(note or "請假")
+            elif note:
+                remarks.setdefault(r.eid, {}).setdefault(dd, []).append(note)
+
+    am_in, am_out, pm_in, pm_out, ot_in, ot_out = minutes
+    has = minutes >= 0
+    brk = np.array([b or 0.0 for b in breaks], dtype=float).reshape(n_emp, 1)
+    always = np.ones_like(has[0])
+
+    # 上午：沒有上午下班時以下午下班收尾；有下午上班就不扣午休
+    am_end = np.where(has[1], am_out, pm_out)
+    h_am = _segment(am_in, am_end, has[0] & (has[1] | has[3]), brk, has[2])
+    h_pm = _segment(pm_in, pm_out, has[2] & has[3], brk, always)
+    h_ot = _segment(ot_in, ot_out, has[4] & has[5], brk, always)
+
+    reg = np.zeros((n_emp, days))
+    ot2 = np.zeros((n_emp, days))
+    otx = np.zeros((n_emp, days))
+    for h in (h_am, h_pm):
+        take_reg = np.minimum(h, 8 - reg)
+        reg = reg + take_reg
+        remain = h - take_reg
+        take2 = np.minimum(remain, 2 - ot2)
+        ot2 = ot2 + take2
+        otx = otx + (remain - take2)
+    take2 = np.minimum(h_ot, 2 - ot2)
+    ot2 = ot2 + take2
+    otx = otx + (h_ot - take2)
+
+    return MonthHours(y, m, list(eids), days, is_hol, times, reg, ot2, otx, leave, remarks)
+
+
+def running_total(a: np.ndarray) -> np.ndarray:
+    """Row sums accumulated day by day (same rounding as a Python += loop)."""
+
+    if a.shape[-1] == 0:
+        return np.zeros(a.shape[:-1])
+    return np.add.accumulate(a, axis=-1)[..., -1]
@@ -0,0 +1,215 @@
+# blueprints/import_checkins.py
+# -*- coding: utf-8 -*-
+"""
+匯入歷史打卡（舊打卡鐘匯出的 csv / xls / xlsx）：/admin/import_checkins
+
+欄位：employee_id, p_type, ts（YYYY-MM-DD HH:MM[:SS]，請假 lv 可只給日期），note（選填）
+work_date 取 ts 的日期，與現場打卡相同。
+
+- 分批讀檔（IMPORT_CHUNK_ROWS 列一批，同匯入員工的 read_frames）
+- 每批整欄一起檢查（pandas）：員工編號、查無此員工、打卡類型、時間格式、
+  假別空白、備註過長、已結帳月份（含下月 1 日 NIGHT_END 前的下班）
+- 寫入靠 (employee_id, work_date, p_type) 唯一鍵略過重複：
+  Postgres 先 COPY 進暫存表再 INSERT … SELECT … ON CONFLICT DO NOTHING，
+  SQLite 以 executemany 執行 INSERT … ON CONFLICT DO NOTHING；
+  還沒有唯一鍵的資料庫逐筆先查再寫（punch_writer.insert_rows）
+- 每批各自一個交易：寫入、更新該批日子的每日摘要（daily_summary.refresh）、commit，
+  再清掉打卡結果頁的月摘要；不長時間佔住 SQLite 寫鎖，現場打卡不必排隊等整個檔案。
+  中途失敗時已 commit 的批次保留，重新匯入同一個檔案只會新增尚未寫入的列
+- 回報新增 / 重複 / 退回筆數，退回的列列出原因（最多 REJECT_SHOW 筆）
+"""
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from flask import Blueprint, current_app, request, render_template_string, url_for
+from sqlalchemy import text
+from sqlalchemy.dialects import sqlite
+
+from extensions import db
+from models import Checkin, checkin_times
+from . import CSS, NIGHT_END
+from .card_summary import forget_days
+from .daily_summary import refresh
+from .directory import get_directory
+from .hours import SEGMENTS
+from .import_employees import MissingColumns, read_frames
+from .month_archive import closed_months
+from .punch_writer import has_unique_key, insert_rows
+
+ckimp_bp = Blueprint('ckimp', __name__, url_prefix='/admin')
+
+LEAVE_PTYPE = 'lv'   # 與 records.py 一致的請假類型
+P_TYPES = list(SEGMENTS) + [LEAVE_PTYPE]
+OUT_TYPES = ['am-out', 'pm-out', 'ot-out']
+COLUMNS = ['employee_id', 'p_type', 'ts']
+NOTE_MAX = Checkin.__table__.c.note.type.length
+
+# 頁面上最多列出幾筆退回的列
+REJECT_SHOW = 200
+
+_ck = Checkin.__table__
+_COPY_COLS = ('employee_id', 'work_date', 'p_type', 'ts', 'note', 'work_day', 'ts_at')
+
+
+def _validate(df: pd.DataFrame, known: set, closed: set) -> tuple[pd.DataFrame, np.ndarray]:
+    """(valid rows as checkin columns, rejection reason per row — '' if accepted)."""
+
+    eid = pd.to_numeric(df['employee_id'].str.strip(), errors='coerce')
+    ptype = df['p_type'].str.strip()
+    note = df['note'].str.strip() if 'note' in df else pd.Series('', index=df.index)
+    at = pd.to_datetime(df['ts'].str.strip(), errors='coerce', format='ISO8601').dt.floor('s')
+    is_lv = ptype == LEAVE_PTYPE
+    at = at.where(~is_lv, at.dt.normalize())        # 請假列的時間一律 00:00:00
+
+    # 下月 1 日 NIGHT_END 前的下班也屬於上個月
+    ym = at.dt.strftime('%Y-%m')
+    prev_ym = (at - pd.Timedelta(days=1)).dt.strftime('%Y-%m')
+    early = (at.dt.day == 1) & ptype.isin(OUT_TYPES) & (at.dt.strftime('%H:%M') < NIGHT_END)
+
+    reason = np.select([
+        eid.isna() | (eid % 1 != 0),
+        ~eid.isin(known),
+        ~ptype.isin(P_TYPES),
+        at.isna(),
+        is_lv & (note == ''),
+        note.str.len() > NOTE_MAX,
+        ym.isin(closed) | (early & prev_ym.isin(closed)),
+    ], [
+        '員工編號錯誤', '查無此員工', '打卡類型錯誤', '時間格式錯誤',
+        '假別不可空白', '備註過長', '月份已結帳',
+    ], default='')
+
+    ok = reason == ''
+    valid = pd.DataFrame({
+        'employee_id': eid[ok].astype('int64'),
+        'work_date': at[ok].dt.strftime('%Y-%m-%d'),
+        'p_type': ptype[ok],
+        'ts': at[ok].dt.strftime('%Y-%m-%dT%H:%M:%S'),
+        'note': note[ok],
+    })
+    return valid, reason
+
+
+def _records(valid: pd.DataFrame) -> list[dict]:
+    return [
+        {'employee_id': e, 'work_date': wd, 'p_type': pt, 'ts': ts, 'note': note or None,
+         **checkin_times(wd, ts)}
+        for e, wd, pt, ts, note in zip(
+            valid['employee_id'].tolist(), valid['work_date'].tolist(),
+            valid['p_type'].tolist(), valid['ts'].tolist(), valid['note'].tolist())
+    ]
+
+
+def _copy(conn, valid: pd.DataFrame) -> list[tuple]:
+    """Postgres: COPY into a temp table, then insert the new rows; returns their keys."""
+
+    cur = conn.connection.driver_connection.cursor()
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS checkin_import ("
+        " employee_id integer, work_date varchar(10), p_type varchar(10), ts varchar(19),"
+        " note varchar(50), work_day date, ts_at timestamp) ON COMMIT DROP"
+    )
+    buf = io.StringIO()
+    valid.assign(work_day=valid['work_date'], ts_at=valid['ts'])[list(_COPY_COLS)] \
+        .to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cols = ', '.join(_COPY_COLS)
+    cur.copy_expert(f"COPY checkin_import ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+    rows = conn.execute(text(
+        f"INSERT INTO checkin ({cols}) SELECT {cols} FROM checkin_import "
+        "ON CONFLICT (employee_id, work_date, p_type) DO NOTHING "
+        "RETURNING employee_id, work_date"
+    )).all()
+    cur.execute("TRUNCATE checkin_import")
+    return [tuple(r) for r in rows]
+
+
+def _load(conn, valid: pd.DataFrame) -> tuple[int, list[tuple]]:
+    """Insert *valid*, skipping duplicates → (inserted count, (eid, work_date) to refresh)."""
+
+    if valid.empty:
+        return 0, []
+    if not has_unique_key(conn):
+        # 還沒有唯一鍵：逐筆先查再寫（insert_rows）
+        results = insert_rows(conn, _records(valid))
+        keys = zip(valid['employee_id'].tolist(), valid['work_date'].tolist())
+        return sum(results), [k for k, ok in zip(keys, results) if ok]
+    if conn.dialect.name == 'postgresql':
+        keys = _copy(conn, valid)
+        return len(keys), keys
+    keys = list(zip(valid['employee_id'].tolist(), valid['work_date'].tolist()))
+    if conn.dialect.name == 'sqlite':
+        # executemany；哪幾列是新的不得而知，整批的日子都重算（結果相同）
+        res = conn.execute(sqlite.insert(_ck).on_conflict_do_nothing(), _records(valid))
+        return res.rowcount, keys
+    results = insert_rows(conn, _records(valid))
+    return sum(results), [k for k, ok in zip(keys, results) if ok]
+
+
+PAGE_HTML = """<!doctype html><html><head>{{ css|safe }}</head><body>
+<h2>匯入歷史打卡</h2>
+<p>欄位：employee_id, p_type, ts（YYYY-MM-DD HH:MM），note（選填）</p>
+<p class='success'>{{ msg }}</p>
+<form method='post' enctype='multipart/form-data'>
+檔案：<input type='file' name='file' accept='.csv,.xls,.xlsx' required>
+<button type='submit'>匯入</button><a href='{{ back }}'>返回</a></form>
+{% if rejected %}
+<h3>退回的列</h3>
+<table><tr><th>列</th><th>employee_id</th><th>p_type</th><th>ts</th><th>原因</th></tr>
+{% for n, eid, pt, ts, why in rejected %}
+<tr><td>{{ n }}</td><td>{{ eid }}</td><td>{{ pt }}</td><td>{{ ts }}</td><td>{{ why }}</td></tr>
+{% endfor %}</table>
+{% endif %}
+</body></html>"""
+
+
+@ckimp_bp.route('/import_checkins', methods=['GET', 'POST'])
+def import_checkins():
+    msg = ''
+    rejected = []
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or file.filename == '':
+            msg = '請選擇檔案'
+        else:
+            started = time.perf_counter()
+            inserted = valid_n = total = 0
+            known = {e.id for e in get_directory().all()}
+            try:
+                closed = closed_months()
+                size = current_app.config.get('IMPORT_CHUNK_ROWS', 1000)
+                for df in read_frames(file, size, COLUMNS):
+                    valid, reason = _validate(df, known, closed)
+                    for pos in np.flatnonzero(reason != '')[:max(0, REJECT_SHOW - len(rejected))]:
+                        row = df.iloc[pos]
+                        rejected.append((total + int(pos) + 1, row['employee_id'], row['p_type'],
+                                         row['ts'], reason[pos]))
+                    conn = db.session.connection()
+                    n, keys = _load(conn, valid)
+                    changes = sorted(set(keys))
+                    refresh(conn, changes)
+                    db.session.commit()
+                    forget_days(changes)
+                    total += len(df)
+                    valid_n += len(valid)
+                    inserted += n
+            except MissingColumns:
+                db.session.rollback()
+                rejected = []
+                msg = '檔案欄位必須包含 employee_id, p_type, ts'
+            except Exception as e:
+                db.session.rollback()
+                rejected = []
+                msg = f'匯入失敗: {e}'
+                if total:
+                    msg += f'（前 {total} 列已匯入，新增 {inserted} 筆；修正後重新匯入同一個檔案即可）'
+            else:
+                elapsed = time.perf_counter() - started
+                rate = total / elapsed if elapsed > 0 else 0
+                msg = (f'新增 {inserted} 筆、重複 {valid_n - inserted} 筆、退回 {total - valid_n} 筆'
+                       f'（共 {total} 列，{elapsed:.2f} 秒，每秒 {rate:,.0f} 列）')
+
+    return render_template_string(PAGE_HTML, css=CSS, msg=msg, rejected=rejected,
+                                  back=url_for('emp.list_employees'))
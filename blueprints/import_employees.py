@@ -1,55 +1,177 @@
 # blueprints/import_employees.py
 # -*- coding: utf-8 -*-
-from flask import Blueprint, request, render_template_string, url_for
+"""
+匯入員工（csv / xls / xlsx，欄位 id, name, area, default_break）
+
+- 分批解析（IMPORT_CHUNK_ROWS 列一批，read_frames 打卡匯入共用）：csv 用
+  pd.read_csv(chunksize)，xlsx 用 openpyxl read_only 逐列讀，xls 整檔讀入後再切批
+- 每批以一個 IN 查詢找出已存在的 ID，新員工整批 INSERT
+- 勾選「更新已存在的員工」時，已存在的 ID 整批更新 name / area / default_break；
+  午休時數有變的員工重算已建好的每日摘要（同 edit_employee）
+- 每批各自 commit，不長時間佔住 SQLite 寫鎖（現場打卡只等得了幾秒）；
+  中途失敗時已 commit 的批次保留，訊息列出已匯入的列數
+- 結果表逐列保留，並顯示每秒處理列數
+"""
+import time
+
+from flask import Blueprint, current_app, request, render_template_string, url_for
 import pandas as pd
+from sqlalchemy import insert, select, update
 from extensions import db
 from models import Employee
 from . import CSS
+from .daily_summary import refresh_employees
+from .directory import get_directory
 
 import_bp = Blueprint('imp', __name__, url_prefix='/admin')
 
+COLUMNS = ['id', 'name', 'area', 'default_break']
+
+
+class MissingColumns(Exception):
+    """The file's header lacks one of the required columns."""
+
+
+def read_frames(file, size: int, required):
+    """Yield the uploaded sheet as DataFrames of *size* rows, every cell a str.
+
+    Empty cells are ''. Raises MissingColumns when a *required* column is absent.
+    """
+
+    fname = file.filename.lower()
+    if fname.endswith('.csv'):
+        with pd.read_csv(file, chunksize=size, dtype=str, keep_default_na=False) as reader:
+            for df in reader:
+                if not set(required).issubset(df.columns):
+                    raise MissingColumns
+                yield df
+        return
+
+    if fname.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else '' for h in next(rows, ())]
+            if not set(required).issubset(header):
+                raise MissingColumns
+            batch = []
+            for values in rows:
+                if all(v is None or v == '' for v in values):
+                    continue                    # 空白列
+                batch.append(['' if v is None else str(v) for v in values])
+                if len(batch) >= size:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+        finally:
+            wb.close()
+        return
+
+    df = pd.read_excel(file, dtype=str).fillna('')
+    if not set(required).issubset(df.columns):
+        raise MissingColumns
+    for i in range(0, len(df), size):
+        yield df.iloc[i:i + size]
+
+
+def _parse(row: dict) -> dict:
+    """One row → Employee column values; ValueError / TypeError when malformed."""
+
+    eid = float(row['id'])
+    if not eid.is_integer():
+        raise ValueError(row['id'])
+    brk = row['default_break']
+    return {
+        'id': int(eid),
+        'name': str(row['name']).strip(),
+        'area': str(row['area']).strip(),
+        'default_break': float(brk) if str(brk).strip() else 0.0,
+    }
+
+
 @import_bp.route('/import_employees', methods=['GET', 'POST'])
 def import_employees():
     msg = ''
     results = []
+    upsert = bool(request.form.get('upsert'))
     if request.method == 'POST':
         file = request.files.get('file')
         if not file or file.filename == '':
             msg = '請選擇檔案'
         else:
+            started = time.perf_counter()
+            inserted = updated = total = 0
+            seen = set()
             try:
-                if file.filename.lower().endswith('.csv'):
-                    df = pd.read_csv(file)
-                else:
-                    df = pd.read_excel(file)
-            except Exception as e:
-                msg = f'讀取檔案失敗: {e}'
-            else:
-                required = {'id', 'name', 'area', 'default_break'}
-                if not required.issubset(df.columns):
-                    msg = '檔案欄位必須包含 id, name, area, default_break'
-                else:
-                    inserted = 0
-                    for _, row in df.iterrows():
+                size = current_app.config.get('IMPORT_CHUNK_ROWS', 1000)
+                for df in read_frames(file, size, COLUMNS):
+                    chunk = df.to_dict('records')
+                    parsed = []          # (結果表位置, 欄位值)
+                    for row in chunk:
                         try:
-                            eid = int(row['id'])
-                            name = str(row['name']).strip()
-                            area = str(row['area']).strip()
-                            brk = float(row['default_break']) if row['default_break'] != '' else 0.0
+                            rec = _parse(row)
                         except (ValueError, TypeError):
                             results.append((row.get('id', ''), '格式錯誤'))
                             continue
-
-                        if Employee.query.get(eid):
-                            results.append((eid, 'ID 已存在'))
+                        if rec['id'] in seen:
+                            results.append((rec['id'], 'ID 已存在'))
                             continue
+                        seen.add(rec['id'])
+                        parsed.append((len(results), rec))
+                        results.append(None)
+                    if not parsed:
+                        total += len(chunk)
+                        continue
+
+                    # 一次查出這批已存在的 ID（與目前的午休時數）
+                    existing = dict(db.session.execute(
+                        select(Employee.id, Employee.default_break)
+                        .where(Employee.id.in_([r['id'] for _, r in parsed]))
+                    ).all())
+                    new, old = [], []
+                    for pos, r in parsed:
+                        if r['id'] not in existing:
+                            new.append(r)
+                            results[pos] = (r['id'], 'ok')
+                        elif upsert:
+                            old.append(r)
+                            results[pos] = (r['id'], '已更新')
+                        else:
+                            results[pos] = (r['id'], 'ID 已存在')
 
-                        emp = Employee(id=eid, name=name, area=area, default_break=brk)
-                        db.session.add(emp)
-                        inserted += 1
-                        results.append((eid, 'ok'))
+                    if new:
+                        db.session.execute(insert(Employee), new)
+                        inserted += len(new)
+                    if old:
+                        db.session.execute(update(Employee), old)
+                        updated += len(old)
+                        # 午休時數影響工時：重算這些員工已建好的每日摘要
+                        changed = [r['id'] for r in old if r['default_break'] != existing[r['id']]]
+                        if changed:
+                            refresh_employees(db.session.connection(), changed)
                     db.session.commit()
-                    msg = f'成功匯入 {inserted} 筆'
+                    total += len(chunk)
+                    if new or old:
+                        get_directory().invalidate()
+            except MissingColumns:
+                db.session.rollback()
+                results = []
+                msg = '檔案欄位必須包含 id, name, area, default_break'
+            except Exception as e:
+                db.session.rollback()
+                results = []
+                msg = f'讀取檔案失敗: {e}'
+                if total:
+                    msg += f'（前 {total} 列已匯入：新增 {inserted} 筆、更新 {updated} 筆）'
+            else:
+                elapsed = time.perf_counter() - started
+                rate = total / elapsed if elapsed > 0 else 0
+                msg = f'成功匯入 {inserted} 筆'
+                if upsert:
+                    msg += f'、更新 {updated} 筆'
+                msg += f'（共 {total} 列，{elapsed:.2f} 秒，每秒 {rate:,.0f} 列）'
 
     rows = ''.join(f"<tr><td>{eid}</td><td>{res}</td></tr>" for eid, res in results)
     table = f"<table><tr><th>ID</th><th>結果</th></tr>{rows}</table>" if results else ''
@@ -58,6 +180,8 @@ def import_employees():
 <p class='success'>{msg}</p>""" +
         "<form method='post' enctype='multipart/form-data'>"+
         "檔案：<input type='file' name='file' accept='.csv,.xls,.xlsx' required>"+
+        f"<label><input type='checkbox' name='upsert' value='1' {'checked' if upsert else ''}>"
+        "更新已存在的員工（姓名、區域、預設午休）</label>"+
         "<button type='submit'>匯入</button>"+
         f"<a href='{url_for('emp.list_employees')}'>返回</a></form>"+
         table+
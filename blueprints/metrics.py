@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+打卡流程的分段耗時與結果計數，/admin/metrics 以 Prometheus 文字格式輸出。
+
+每個 worker 在記憶體累計，請求結束後（最多每秒一次）把快照寫到
+METRICS_DIR/metrics-<pid>.json；/admin/metrics 讀取所有快照加總，
+因此不論請求落在哪個 gunicorn worker，看到的都是全部 worker 的合計。
+
+@counted(view) 計算一個 view 送出的 SQL 次數，放在 X-Query-Count 標頭，
+並累計在 view_queries_total / view_requests_total，用來確認匯出等報表的查詢數不隨人數成長。
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import Blueprint, Response, current_app, make_response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+metrics_bp = Blueprint("metrics", __name__, url_prefix="/admin")
+
+# 直方圖上界（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+FLUSH_EVERY_SEC = 1.0
+
+HELP = {
+    "punch_stage_seconds": "Time spent in each stage of the punch pipeline.",
+    "punch_outcomes_total": "Punch pipeline outcomes by view.",
+    "employee_directory_hits_total": "Employee directory cache hits.",
+    "employee_directory_misses_total": "Employee directory cache misses (reloads).",
+    "view_queries_total": "SQL statements executed by counted views.",
+    "view_requests_total": "Requests served by counted views.",
+    "export_cache_total": "Export file cache lookups by report and result.",
+}
+
+
+class Metrics:
+    """Per-process counters and fixed-bucket histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.hists: dict[tuple, list[float]] = {}   # 各桶次數 + [sum, count]
+
+    def inc(self, name: str, labels: dict, n: float = 1) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, name: str, labels: dict, value: float) -> None:
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = [0.0] * (len(BUCKETS) + 2)
+            for i, le in enumerate(BUCKETS):
+                if value <= le:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[n, list(map(list, l)), v] for (n, l), v in self.counters.items()],
+                "hists": [[n, list(map(list, l)), list(h)] for (n, l), h in self.hists.items()],
+            }
+
+
+_metrics = Metrics()
+_pid = os.getpid()
+_last_flush = 0.0
+
+
+def _current() -> Metrics:
+    # fork 出來的 worker 不沿用 master 的累計值
+    global _metrics, _pid
+    if _pid != os.getpid():
+        _metrics, _pid = Metrics(), os.getpid()
+    return _metrics
+
+
+def outcome(view: str, code: str) -> None:
+    _current().inc("punch_outcomes_total", {"view": view, "outcome": code})
+
+
+def cache_event(report: str, result: str) -> None:
+    _current().inc("export_cache_total", {"report": report, "result": result})
+
+
+@contextmanager
+def stage(view: str, name: str):
+    """Time a block into punch_stage_seconds{view, stage}."""
+
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current().observe("punch_stage_seconds", {"view": view, "stage": name},
+                           time.perf_counter() - t0)
+
+
+_queries = threading.local()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    n = getattr(_queries, "n", None)
+    if n is not None:
+        _queries.n = n + 1
+
+
+def counted(view: str):
+    """Decorator: count SQL statements run by a view, reported as X-Query-Count."""
+
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            prev = getattr(_queries, "n", None)
+            _queries.n = 0
+            try:
+                resp = make_response(fn(*args, **kwargs))
+                n = _queries.n
+            finally:
+                _queries.n = prev
+            resp.headers["X-Query-Count"] = str(n)
+            m = _current()
+            m.inc("view_queries_total", {"view": view}, n)
+            m.inc("view_requests_total", {"view": view})
+            return resp
+
+        return wrapper
+
+    return deco
+
+
+def _flush(force: bool = False) -> None:
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_EVERY_SEC:
+        return
+    _last_flush = now
+
+    m = _current()
+    directory = current_app.extensions.get("emp_directory")
+    if directory is not None:
+        m.set("employee_directory_hits_total", {}, directory.hits)
+        m.set("employee_directory_misses_total", {}, directory.misses)
+
+    out = Path(current_app.config["METRICS_DIR"])
+    out.mkdir(parents=True, exist_ok=True)
+    tmp = out / f".metrics-{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(m.snapshot()))
+    os.replace(tmp, out / f"metrics-{os.getpid()}.json")
+
+
+@metrics_bp.after_app_request
+def _flush_after_request(resp):
+    try:
+        _flush()
+    except OSError:
+        current_app.logger.warning("metrics flush failed", exc_info=True)
+    return resp
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render_prometheus() -> str:
+    """Merge every worker's snapshot and render Prometheus text format."""
+
+    _flush(force=True)
+    counters: dict[tuple, float] = {}
+    hists: dict[tuple, list[float]] = {}
+    for path in Path(current_app.config["METRICS_DIR"]).glob("metrics-*.json"):
+        try:
+            snap = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for n, l, v in snap["counters"]:
+            key = (n, tuple(map(tuple, l)))
+            counters[key] = counters.get(key, 0) + v
+        for n, l, h in snap["hists"]:
+            key = (n, tuple(map(tuple, l)))
+            acc = hists.setdefault(key, [0.0] * len(h))
+            for i, v in enumerate(h):
+                acc[i] += v
+
+    lines: list[str] = []
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for (n, l), v in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(l)} {v:g}")
+    for name in sorted({n for n, _ in hists}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (n, l), h in sorted(hists.items()):
+            if n != name:
+                continue
+            cum = 0.0
+            for le, c in zip(BUCKETS, h):
+                cum += c
+                lines.append(f"{name}_bucket{_fmt_labels(l + (('le', f'{le:g}'),))} {cum:g}")
+            lines.append(f"{name}_bucket{_fmt_labels(l + (('le', '+Inf'),))} {h[-1]:g}")
+            lines.append(f"{name}_sum{_fmt_labels(l)} {h[-2]:.6f}")
+            lines.append(f"{name}_count{_fmt_labels(l)} {h[-1]:g}")
+    return "\n".join(lines) + "\n"
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
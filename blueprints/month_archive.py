@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+已結帳月份的封存快照：ARCHIVE_DIR/<YYYY-MM>/ 下一組欄式 .npy 檔，唯讀 mmap 開啟。
+
+flask summary close YYYY-MM 把該月的打卡與每日工時結果凍結成快照，並在
+summary_month.closed_at 標記已結帳（daily_summary.close_month）；之後
+  - 薪資報表（month_hours）直接讀快照裡的結果矩陣
+  - 月表、工時卡片總檔（card_hours）與打卡結果頁（card_summary）讀快照裡的原始打卡
+  - 會影響該月的單筆編輯一律拒絕（closed_for）
+都不再掃描 checkin / daily_summary。
+
+檔案內容（E 位員工 × D 天，N 筆打卡）：
+  meta.json                     月份、結帳時間、p_type 名稱、假別、備註
+  eids / breaks                 (E,)   員工編號（遞增）與結帳當時的預設午休
+  minutes                       (6,E,D) int16 六段時間（分鐘，-1 = 無）
+  reg / ot2 / otx               (E,D)  float64 工時
+  raw_eid / raw_day / raw_ts / raw_ptype   (N,) 原始打卡，依員工、日期、時間排序
+原始打卡只留會影響本月的：本月全部，加上下月 1 日 NIGHT_END 前的下班。
+
+np.load(mmap_mode="r") 只把實際取用的員工列讀進記憶體；每個 process 開一次，
+meta.json 的結帳時間必須與資料庫的 closed_at 相同才會採用，本機沒有快照
+（例如在另一台主機結帳）或已取消結帳時退回讀資料庫，結果相同。
+"""
+
+from __future__ import annotations
+
+import calendar
+import json
+import os
+import shutil
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from extensions import db
+from models import SummaryMonth
+from . import NIGHT_END
+from .hours import SEGMENTS, MonthHours, compute_month, load_rows
+
+_sm = SummaryMonth.__table__
+
+OUT_TYPES = ("am-out", "pm-out", "ot-out")
+
+# card_hours 以 IN 篩選員工的上限
+_IN_MAX = 500
+
+# 分鐘 → 'HH:MM'（索引 0 是「無」）
+_HM = np.array([""] + [f"{h:02d}:{mi:02d}" for h in range(24) for mi in range(60)], dtype=object)
+
+_snaps: dict[str, "MonthSnapshot"] = {}
+_snaps_lock = threading.Lock()
+
+
+def _ym(y: int, m: int) -> str:
+    return f"{y}-{m:02d}"
+
+
+def _root() -> Path:
+    return Path(current_app.config["ARCHIVE_DIR"])
+
+
+def closed_at(y: int, m: int, conn=None) -> str | None:
+    """closed_at of (y, m) in summary_month; None while the month is open."""
+
+    q = select(_sm.c.closed_at).where(_sm.c.ym == _ym(y, m))
+    return (conn or db.session).execute(q).scalar()
+
+
+def closed_months(conn=None) -> set[str]:
+    """Every closed 'YYYY-MM'."""
+
+    q = select(_sm.c.ym).where(_sm.c.closed_at.is_not(None))
+    return set((conn or db.session).execute(q).scalars())
+
+
+def closed_for(work_date: str, p_type: str, ts: str | None) -> str | None:
+    """The closed month a check-in row belongs to, if any ('YYYY-MM')."""
+
+    d = date.fromisoformat(work_date)
+    if closed_at(d.year, d.month):
+        return _ym(d.year, d.month)
+    # 下月 1 日 NIGHT_END 前的下班算在上個月
+    if d.day == 1 and p_type in OUT_TYPES and ts and ts < f"{work_date}T{NIGHT_END}:00":
+        prev = d - timedelta(days=1)
+        if closed_at(prev.year, prev.month):
+            return _ym(prev.year, prev.month)
+    return None
+
+
+# ────────────────────── 寫入 ──────────────────────
+def write_snapshot(y: int, m: int, mh: MonthHours, breaks: list, rows, stamp: str) -> Path:
+    """Freeze *mh* (every employee, by id) and the month's raw *rows* to disk.
+
+    rows: (employee_id, work_date, p_type, ts, note) already limited to the
+    month plus next month's early outs, ordered by employee, date, time.
+    """
+
+    ym = _ym(y, m)
+    root = _root()
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / ym
+    tmp = root / f".{ym}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+
+    ptypes = sorted({r[2] for r in rows})
+    code = {t: i for i, t in enumerate(ptypes)}
+    hm = np.zeros(mh.times.shape, dtype=np.int16)
+    for k in range(len(SEGMENTS)):
+        for e in range(len(mh.eids)):
+            hm[k, e] = [int(t[:2]) * 60 + int(t[3:5]) if t else -1 for t in mh.times[k, e]]
+
+    arrays = {
+        "eids": np.array(mh.eids, dtype=np.int64),
+        "breaks": np.array([b or 0.0 for b in breaks], dtype=np.float64),
+        "minutes": hm,
+        "reg": mh.reg, "ot2": mh.ot2, "otx": mh.otx,
+        "raw_eid": np.array([r[0] for r in rows], dtype=np.int64),
+        "raw_day": np.array([r[1] for r in rows], dtype="datetime64[D]"),
+        "raw_ts": np.array([r[3] for r in rows], dtype="datetime64[s]"),
+        "raw_ptype": np.array([code[r[2]] for r in rows], dtype=np.int8),
+    }
+    for name, a in arrays.items():
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(a))
+    meta = {
+        "ym": ym, "closed_at": stamp, "ptypes": ptypes,
+        "leave": {str(eid): v for eid, v in mh.leave.items()},
+        "notes": {str(i): r[4] for i, r in enumerate(rows) if r[4]},
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False))
+
+    # 換上新目錄；舊快照（重新結帳時）先移開再刪
+    old = root / f".{ym}.{os.getpid()}.old"
+    if path.exists():
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def remove_snapshot(y: int, m: int) -> None:
+    shutil.rmtree(_root() / _ym(y, m), ignore_errors=True)
+
+
+# ────────────────────── 讀取 ──────────────────────
+class MonthSnapshot:
+    """One closed month opened read-only; arrays are memory-mapped."""
+
+    def __init__(self, path: Path, key: tuple):
+        meta = json.loads((path / "meta.json").read_text())
+        self.key = key
+        self.closed_at = meta["closed_at"]
+        self.y, self.m = map(int, meta["ym"].split("-"))
+        self.days = calendar.monthrange(self.y, self.m)[1]
+        self.ptypes = meta["ptypes"]
+        self.leave = {int(k): v for k, v in meta["leave"].items()}
+        self.notes = {int(k): v for k, v in meta["notes"].items()}
+
+        def load(name):
+            return np.load(path / f"{name}.npy", mmap_mode="r")
+
+        self.eids, self.breaks, self.minutes = load("eids"), load("breaks"), load("minutes")
+        self.reg, self.ot2, self.otx = load("reg"), load("ot2"), load("otx")
+        self.raw_eid, self.raw_day = load("raw_eid"), load("raw_day")
+        self.raw_ts, self.raw_ptype = load("raw_ts"), load("raw_ptype")
+
+    def _find(self, eids) -> tuple[np.ndarray, np.ndarray]:
+        """(positions, found mask) of *eids* in the snapshot's employee list."""
+
+        ids = np.array(list(eids), dtype=np.int64)
+        if not len(self.eids):
+            return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.eids, ids), len(self.eids) - 1)
+        return pos, self.eids[pos] == ids
+
+    def month_hours(self, eids: list) -> MonthHours:
+        """Same result as daily_summary.month_hours at the time of closing."""
+
+        n, days = len(eids), self.days
+        pos, found = self._find(eids)
+        sel = pos[found]
+        minutes = np.full((len(SEGMENTS), n, days), -1, dtype=np.int16)
+        reg, ot2, otx = np.zeros((n, days)), np.zeros((n, days)), np.zeros((n, days))
+        if len(sel):
+            minutes[:, found] = self.minutes[:, sel]
+            reg[found], ot2[found], otx[found] = self.reg[sel], self.ot2[sel], self.otx[sel]
+        leave = {eid: dict(self.leave[eid]) for eid in eids if eid in self.leave}
+        is_hol = np.array([date(self.y, self.m, d).weekday() >= 5 for d in range(1, days + 1)])
+        return MonthHours(self.y, self.m, list(eids), days, is_hol, _HM[minutes + 1],
+                          reg, ot2, otx, leave, {})
+
+    def breaks_of(self, eids, default: list) -> list:
+        """default_break at closing time for *eids* (*default* for later hires)."""
+
+        pos, found = self._find(eids)
+        return [float(self.breaks[p]) if f else d for p, f, d in zip(pos, found, default)]
+
+    def _rows(self, idx: np.ndarray) -> list[tuple]:
+        eid = self.raw_eid[idx].tolist()
+        day = np.datetime_as_string(self.raw_day[idx]).tolist()
+        ts = np.datetime_as_string(self.raw_ts[idx], unit="s").tolist()
+        ptype = [self.ptypes[c] for c in self.raw_ptype[idx].tolist()]
+        return [(e, d, p, t, self.notes.get(int(i)))
+                for i, e, d, p, t in zip(idx.tolist(), eid, day, ptype, ts)]
+
+    def rows(self, eids=None) -> list[tuple]:
+        """(employee_id, work_date, p_type, ts, note) rows like hours.load_rows()."""
+
+        if eids is None:
+            return self._rows(np.arange(len(self.raw_eid)))
+        return self._rows(np.flatnonzero(np.isin(self.raw_eid, np.array(list(eids), dtype=np.int64))))
+
+    def employee_rows(self, eid) -> list[tuple]:
+        lo, hi = (int(np.searchsorted(self.raw_eid, int(eid), side=s)) for s in ("left", "right"))
+        return self._rows(np.arange(lo, hi))
+
+
+def snapshot(y: int, m: int) -> MonthSnapshot | None:
+    """The snapshot of a closed (y, m), or None (open month / not on this host)."""
+
+    ym = _ym(y, m)
+    path = _root() / ym
+    try:
+        st = os.stat(path / "meta.json")
+    except OSError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns)
+    snap = _snaps.get(ym)
+    if snap is None or snap.key != key:
+        with _snaps_lock:
+            snap = _snaps.get(ym)
+            if snap is None or snap.key != key:
+                snap = _snaps[ym] = MonthSnapshot(path, key)
+    # 資料庫的結帳時間對得上才算數（取消結帳或在別台重新結帳後，這份已作廢）
+    return snap if closed_at(y, m) == snap.closed_at else None
+
+
+def card_hours(y: int, m: int, eids: list, breaks: list, *, cutoff: int) -> MonthHours:
+    """compute_month over the month's check-ins, read from the snapshot if closed."""
+
+    snap = snapshot(y, m)
+    if snap is None:
+        # 少數員工（單人 / 單區）只取他們的打卡；人多時整月取出，免得 IN 清單過長
+        rows = load_rows(y, m, eids if len(eids) <= _IN_MAX else None)
+        return compute_month(rows, y, m, eids, breaks, cutoff=cutoff)
+    return compute_month(snap.rows(eids), y, m, eids, snap.breaks_of(eids, breaks), cutoff=cutoff)
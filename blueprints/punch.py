@@ -8,19 +8,29 @@
 # ???亙葆?振 F5嚗P ?寡???gate ??嚗?/punch/use ?＊蝷箝??Ｗ仃??
 # ???喳??踵 token 敹???游 /punch嚗? IP嚗ate ?芸?蝥?
 
-from flask import Blueprint, render_template_string, request, redirect, url_for, current_app, session
+from flask import Blueprint, render_template_string, request, redirect, url_for, current_app, session, make_response, jsonify, abort
 from calendar import monthrange
-import re, io, base64, qrcode, math, json
+import re, io, qrcode, json
 from datetime import datetime, date, timedelta
 
-from extensions import db
-from models import Employee, Checkin
-from . import NIGHT_END, merge_night
+from . import merge_night
+from .punch_writer import record_punch
+from .punch_store import get_store
+from .geofence import get_index
+from .directory import get_directory
+from .card_summary import load_month, note_checkin
+from .metrics import stage, outcome
+from .admission import admit
 
-import time, secrets, hashlib
+import time, secrets, hashlib, functools
 
 QR_VER_KEY  = "QR_VER_DELTA"  # QR ?身?見??宏
 QR_VER_SPAN = 6
+QR_ERROR_LEVEL = qrcode.constants.ERROR_CORRECT_H
+
+# QR 圖片快取（LRU）：(網址, 版本, 容錯等級) → (PNG, ETag)；regen 時清空。
+# 網址取自 PUNCH_QR_BASE_URL，沒設時依請求的 Host，故限制筆數免得被亂填的 Host 撐大
+QR_CACHE_MAX = 16
 
 # ???????????????????????? ???? CSS ????????????????????????
 CSS = r"""
@@ -57,6 +67,8 @@ punch_bp = Blueprint("punch", __name__, url_prefix="/punch")
 ADMIN_QR_PWD = "hr1234"      # ?湔撖Ⅳ嚗? QR ?嚗?
 QR_CONFIG_KEY = "QR_TEXT"
 
+PUNCH_TYPES = ("am-in", "am-out", "pm-in", "pm-out", "ot-in", "ot-out")
+
 # ???????????????????????? 撌亙 ????????????????????????
 def _client_ip() -> str:
     # ?亙??隞??敺遣霅啣 app factory ??ProxyFix嚗ㄐ?? remote_addr嚗??剁?
@@ -71,17 +83,34 @@ def _bind_fingerprint() -> str:
     base = "|".join(parts)
     return hashlib.sha1(base.encode("utf-8")).hexdigest() if base else ""
 
+def _sid(create: bool = False) -> str:
+    """Opaque per-browser id kept in the cookie; gate/token live in the store."""
+
+    sid = session.get("punch_sid")
+    if not sid and create:
+        sid = session["punch_sid"] = secrets.token_urlsafe(16)
+    return sid or ""
+
+def _load_gate() -> dict | None:
+    sid = _sid()
+    return get_store().get(f"gate:{sid}") if sid else None
+
+def _load_token() -> dict:
+    sid = _sid()
+    return (get_store().get(f"tok:{sid}") if sid else None) or {}
+
 def _issue_or_refresh_gate_same_ip() -> dict:
     """Return gate info tied to current client IP, issuing or refreshing as needed."""
 
     now = int(time.time())
     ttl = int(current_app.config.get("PUNCH_GATE_TTL_SEC", 120))
     cur_ip = _client_ip()
-    gate = session.get("punch_gate")
+    key = f"gate:{_sid(create=True)}"
+    gate = get_store().get(key)
 
     if not gate:
         gate = {"ip": cur_ip, "exp": now + ttl}
-        session["punch_gate"] = gate
+        get_store().put(key, gate, ttl)
         return gate
 
     if gate.get("ip") != cur_ip:
@@ -89,7 +118,7 @@ def _issue_or_refresh_gate_same_ip() -> dict:
 
     if now > int(gate.get("exp", 0)):
         gate = {"ip": cur_ip, "exp": now + ttl}
-        session["punch_gate"] = gate
+        get_store().put(key, gate, ttl)
         return gate
 
     return gate
@@ -104,69 +133,91 @@ def _new_token() -> dict:
         "exp": now + ttl,
         "fp": _bind_fingerprint(),
     }
-    session["punch_token"] = tok
+    get_store().put(f"tok:{_sid(create=True)}", tok, ttl)
     return tok
 
 def _check_token_alive() -> tuple[bool, int]:
-    """Return (is_valid, seconds_left) for the session token."""
+    """Return (is_valid, seconds_left) for the pending token."""
 
-    tok = session.get("punch_token") or {}
+    tok = _load_token()
     left = int(tok.get("exp", 0)) - int(time.time())
     return (bool(tok) and left > 0 and tok.get("fp") == _bind_fingerprint(), max(0, left))
 
 def _consume_token(token_from_form: str) -> bool:
-    """Validate and consume the pending session token regardless of outcome."""
+    """Atomically consume the pending token; it is invalidated regardless of outcome."""
+
+    sid = _sid()
+    if not sid:
+        return False
+    key = f"tok:{sid}"
+    tok = get_store().consume(key, "value", token_from_form) if token_from_form else None
+    if tok is None:
+        get_store().delete(key)
+        return False
+    return int(time.time()) <= int(tok.get("exp", 0)) and tok.get("fp") == _bind_fingerprint()
 
-    try:
-        tok = session.get("punch_token") or {}
-        ok = (
-            token_from_form
-            and tok.get("value") == token_from_form
-            and int(time.time()) <= int(tok.get("exp", 0))
-            and tok.get("fp") == _bind_fingerprint()
-        )
-        return bool(ok)
-    finally:
-        session.pop("punch_token", None)
-
-def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    r = 6371000.0
-    p1 = math.radians(lat1)
-    p2 = math.radians(lat2)
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-    a = math.sin(d_lat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(d_lon / 2) ** 2
-    return 2 * r * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-def _geofence_points() -> list[tuple[float, float]]:
-    points = current_app.config.get("PUNCH_GEOFENCE_POINTS") or []
-    clean: list[tuple[float, float]] = []
-    for p in points:
-        try:
-            lat, lon = p
-            clean.append((float(lat), float(lon)))
-        except Exception:
-            continue
-    return clean
+# ????????????????????????  QR Code ?Ｙ??? ????????????????????????
+def _qr_text() -> str:
+    """URL encoded in the QR: PUNCH_QR_BASE_URL + the punch path, else the request's host."""
 
-def _nearest_distance_m(lat: float, lon: float, points: list[tuple[float, float]]) -> float | None:
-    if not points:
-        return None
-    return min(_haversine_m(lat, lon, p_lat, p_lon) for p_lat, p_lon in points)
+    base = current_app.config.get("PUNCH_QR_BASE_URL")
+    if base:
+        return base.rstrip("/") + url_for("punch.form")
+    return url_for("punch.form", _external=True)
 
-# ????????????????????????  QR Code ?Ｙ??? ????????????????????????
-@punch_bp.route("/qrcode", methods=["GET", "POST"])
-def qrcode_view():
-    qr_text = url_for('punch.form', _external=True)
-    order_tool_url = url_for('order_tool.index')
+@functools.lru_cache(maxsize=QR_CACHE_MAX)
+def _qr_min_version(qr_text: str, level: int = QR_ERROR_LEVEL) -> int:
+    """Smallest QR version that fits *qr_text* at the configured error level."""
 
-    qr_auto = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_H,
-                            box_size=10, border=2)
+    qr_auto = qrcode.QRCode(version=None, error_correction=level, box_size=10, border=2)
     qr_auto.add_data(qr_text)
     qr_auto.make(fit=True)
-    min_ver = qr_auto.version
+    return qr_auto.version
+
+def _qr_use_version(qr_text: str) -> int:
+    """QR version currently in use: min version shifted by QR_VER_DELTA."""
 
+    min_ver = _qr_min_version(qr_text)
     delta = int(current_app.config.get(QR_VER_KEY, 0))
+    max_ver = min(min_ver + QR_VER_SPAN - 1, 40)
+    span = max_ver - min_ver + 1
+    if span <= 0: span = 1
+    return min_ver + (delta % span)
+
+@functools.lru_cache(maxsize=QR_CACHE_MAX)
+def _qr_png(qr_text: str, version: int, level: int = QR_ERROR_LEVEL) -> tuple[bytes, str]:
+    """Return (png_bytes, etag) for the QR image, rendering it once per key."""
+
+    qr = qrcode.QRCode(version=version, error_correction=level, box_size=10, border=2)
+    qr.add_data(qr_text)
+    qr.make(fit=False)
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    buf = io.BytesIO(); img.save(buf, format="PNG")
+    png = buf.getvalue()
+    return png, hashlib.sha1(png).hexdigest()
+
+@punch_bp.route("/qrcode.png")
+def qrcode_png():
+    qr_text = _qr_text()
+    use_ver = _qr_use_version(qr_text)
+    png, etag = _qr_png(qr_text, use_ver)
+
+    resp = make_response(png)
+    resp.mimetype = "image/png"
+    resp.set_etag(etag)
+    # 網址帶的版本與目前一致時可長期快取；版本一換網址就跟著變
+    if request.args.get("v") == str(use_ver):
+        resp.headers["Cache-Control"] = "public, max-age=86400, immutable"
+    else:
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@punch_bp.route("/qrcode", methods=["GET", "POST"])
+def qrcode_view():
+    qr_text = _qr_text()
+    order_tool_url = url_for('order_tool.index')
+
     verified = False
     msg = ""
 
@@ -181,23 +232,12 @@ def qrcode_view():
                 msg = "管理密碼錯誤，請再試一次。"
 
         if verified and request.form.get("action") == "regen":
-            delta += 1
-            current_app.config[QR_VER_KEY] = delta
+            # 只有 regen 才作廢快取的圖片
+            _qr_png.cache_clear()
+            current_app.config[QR_VER_KEY] = int(current_app.config.get(QR_VER_KEY, 0)) + 1
             msg = "已更新 QR 版本並重新產生圖片，請重新下載。"
 
-    max_ver = min(min_ver + QR_VER_SPAN - 1, 40)
-    span = max_ver - min_ver + 1
-    if span <= 0: span = 1
-    use_ver = min_ver + (delta % span)
-
-    qr = qrcode.QRCode(version=use_ver, error_correction=qrcode.constants.ERROR_CORRECT_H,
-                       box_size=10, border=2)
-    qr.add_data(qr_text)
-    qr.make(fit=False)
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    buf = io.BytesIO(); img.save(buf, format="PNG")
-    b64 = base64.b64encode(buf.getvalue()).decode()
+    png_url = url_for('punch.qrcode_png', v=_qr_use_version(qr_text))
 
     tpl = "\n".join([
         '<!doctype html>',
@@ -221,7 +261,7 @@ def qrcode_view():
         '    <div class="wrap">',
         '      <h2>打卡 QR Code</h2>',
         '      <div class="card">',
-        '        <div class="qr"><img src="data:image/png;base64,{{ b64 }}" alt="QR Code"></div>',
+        '        <div class="qr"><img src="{{ png_url }}" alt="QR Code"></div>',
         '        <div class="row" style="margin-bottom:16px;">',
         '          <a class="btn primary" href="{{ qr_text }}" target="_blank" rel="noopener">前往線上打卡表單</a>',
         '          <a class="btn" href="{{ order_tool_url }}" target="_blank" rel="noopener">前往叫貨專區</a>',
@@ -238,7 +278,7 @@ def qrcode_view():
         '        <form method="post" class="row" style="margin-top:4px;">',
         '          <input type="hidden" name="verified" value="1">',
         '          <button class="btn primary" type="submit" name="action" value="regen">產生新 QR 圖片</button>',
-        '          <a class="btn" download="punch_qr.png" href="data:image/png;base64,{{ b64 }}">下載 QR 圖片</a>',
+        '          <a class="btn" download="punch_qr.png" href="{{ png_url }}">下載 QR 圖片</a>',
         '        </form>',
         '        {% endif %}',
         '        {% if msg %}<div class="msg">{{ msg }}</div>{% endif %}',
@@ -249,10 +289,11 @@ def qrcode_view():
     ])
 
 
-    return render_template_string(tpl, HEAD=HEAD, b64=b64, qr_text=qr_text, order_tool_url=order_tool_url)
+    return render_template_string(tpl, HEAD=HEAD, png_url=png_url, qr_text=qr_text, order_tool_url=order_tool_url)
 
 # ????????????????????????  ?亙嚗? QR ???圈ㄐ嚗?甈∠? token 銝血???/use嚗?????????????????????????
 @punch_bp.route("/", methods=["GET"])
+@admit("form", _client_ip, _sid, on_reject=outcome)
 def form():
     gate = _issue_or_refresh_gate_same_ip()
     if gate.get("invalid"):
@@ -264,15 +305,21 @@ def form():
             "<p><a href='/admin/login'>管理登入</a></p></body></html>"
         )
 
-    tok = _new_token()  # 瘥活???賜? token
+    # 重整時沿用仍有效（且剩餘時間夠用）的 token，不必每次重簽
+    ok_tok, left = _check_token_alive()
+    reuse = ok_tok and left >= int(current_app.config.get("PUNCH_TOKEN_REUSE_MIN_SEC", 30))
+    tok = _load_token() if reuse else _new_token()
     return redirect(url_for(".use", tk=tok["value"]))
 
 # ????????????????????????  憿舐內銵典嚗?亙????Ｙ???token嚗?????????????????????????
 @punch_bp.route("/use", methods=["GET"])
+@admit("use", _client_ip, _sid, on_reject=outcome)
 def use():
     tk = request.args.get("tk", "")
-    tok = session.get("punch_token") or {}
+    with stage("use", "token"):
+        tok = _load_token()
     if not tk or tk != tok.get("value"):
+        outcome("use", "invalid_token")
         return render_template_string(
             f"<!doctype html><html><head>{HEAD}</head><body>"
             "<p class='error'>無效的憑證，請重新掃描 QR Code。</p>"
@@ -281,12 +328,15 @@ def use():
         )
 
     # gate 敹?隞???& IP ?芾?嚗oken 敹?隞???
-    gate = session.get("punch_gate")
-    now = int(time.time())
-    ok_gate = gate and gate.get("ip") == _client_ip() and now <= int(gate.get("exp", 0))
-    ok_tok, left = _check_token_alive()
+    with stage("use", "gate"):
+        gate = _load_gate()
+        now = int(time.time())
+        ok_gate = gate and gate.get("ip") == _client_ip() and now <= int(gate.get("exp", 0))
+    with stage("use", "token"):
+        ok_tok, left = _check_token_alive()
 
     if not ok_gate or not ok_tok:
+        outcome("use", "expired")
         return render_template_string(
             f"<!doctype html><html><head>{HEAD}</head><body>"
             "<p class='error'>此連線已失效，請重新掃描 QR Code。</p>"
@@ -297,149 +347,252 @@ def use():
     geofence_enabled = bool(current_app.config.get("PUNCH_GEOFENCE_ENABLED", False))
     allow_radius_m = float(current_app.config.get("PUNCH_ALLOW_RADIUS_M", 100))
     require_accuracy_m = float(current_app.config.get("PUNCH_REQUIRE_ACCURACY_M", 150))
-    points = _geofence_points()
+    # 地點多時不整份塞進頁面：定位後再向 /punch/sites 取附近地點
+    index = get_index()
+    inline_max = int(current_app.config.get("PUNCH_GEOFENCE_INLINE_MAX", 20))
+    points = index.points if len(index.points) <= inline_max else []
+    sites_url = url_for(".sites") if len(index.points) > inline_max else ""
 
     # 憿舐內銵典嚗idden 撣?token嚗?? left 蝘??寧 f-string嚗?? % ?澆???
-    return render_template_string(
-        f"<!doctype html><html><head>{HEAD}</head><body>"
-        "<h2>線上打卡</h2>"
-        "<form method='post' action='/punch/'>"
-        "<input name='eid' placeholder='員工編號' required autofocus>"
-        "<select name='type'>"
-        "<option value='am-in'>1. 上午上班</option>"
-        "<option value='am-out'>2. 上午下班</option>"
-        "<option value='pm-in'>3. 下午上班</option>"
-        "<option value='pm-out'>4. 下午下班</option>"
-        "<option value='ot-in'>5. 加班上班</option>"
-        "<option value='ot-out'>6. 加班下班</option>"
-        "</select>"
-        "<input type='hidden' id='geoLat' name='lat'>"
-        "<input type='hidden' id='geoLng' name='lng'>"
-        "<input type='hidden' id='geoAcc' name='acc'>"
-        f"<input type='hidden' name='token' value='{tok['value']}'>"
-        f"<div class='ttl'>此頁面將在 <span id='sec'>{left}</span> 秒後失效，請儘速提交。</div>"
-        "<div class='ttl' id='geoStatus'>定位中，請稍候…</div>"
-        "<button id='submitBtn' disabled>送出打卡</button>"
-        "</form>"
-        "<p><a href='/admin/login'>管理登入</a></p>"
-        "<script>(function(){"
-        f"var sec={left};"
-        f"var geofenceEnabled={json.dumps(geofence_enabled)};"
-        f"var allowRadius={allow_radius_m};"
-        f"var requireAccuracy={require_accuracy_m};"
-        f"var points={json.dumps(points)};"
-        "var s=document.getElementById('sec');"
-        "var btn=document.getElementById('submitBtn');"
-        "var st=document.getElementById('geoStatus');"
-        "var latInput=document.getElementById('geoLat');"
-        "var lngInput=document.getElementById('geoLng');"
-        "var accInput=document.getElementById('geoAcc');"
-        "function setReady(ok,msg){"
-        "  st.textContent=msg;"
-        "  if(ok){btn.removeAttribute('disabled');btn.classList.remove('disabled');}"
-        "  else{btn.setAttribute('disabled','disabled');btn.classList.add('disabled');}"
-        "}"
-        "function toRad(d){return d*Math.PI/180;}"
-        "function distM(lat1,lon1,lat2,lon2){"
-        "  var R=6371000;"
-        "  var dLat=toRad(lat2-lat1);"
-        "  var dLon=toRad(lon2-lon1);"
-        "  var a=Math.sin(dLat/2)*Math.sin(dLat/2)+Math.cos(toRad(lat1))*Math.cos(toRad(lat2))*Math.sin(dLon/2)*Math.sin(dLon/2);"
-        "  return 2*R*Math.atan2(Math.sqrt(a),Math.sqrt(1-a));"
-        "}"
-        "function nearest(lat,lon){"
-        "  if(!points.length){return null;}"
-        "  var m=Infinity;"
-        "  for(var i=0;i<points.length;i++){"
-        "    var p=points[i];"
-        "    var d=distM(lat,lon,p[0],p[1]);"
-        "    if(d<m){m=d;}"
-        "  }"
-        "  return m;"
-        "}"
-        "var t=setInterval(function(){"
-        "  sec=Math.max(0,sec-1); s.textContent=sec;"
-        "  if(sec<=0){clearInterval(t); btn.setAttribute('disabled','disabled'); btn.classList.add('disabled');}"
-        "},1000);"
-        "if(!geofenceEnabled){setReady(true,'可打卡（未啟用定位限制）');return;}"
-        "if(!points.length){setReady(false,'未設定打卡地點，請聯絡管理員。');return;}"
-        "if(!navigator.geolocation){setReady(false,'此裝置不支援定位。');return;}"
-        "navigator.geolocation.getCurrentPosition(function(pos){"
-        "  var lat=pos.coords.latitude;"
-        "  var lng=pos.coords.longitude;"
-        "  var acc=pos.coords.accuracy || 9999;"
-        "  latInput.value=String(lat);"
-        "  lngInput.value=String(lng);"
-        "  accInput.value=String(acc);"
-        "  if(acc>requireAccuracy){setReady(false,'定位精度不足（'+Math.round(acc)+'m），請移動到空曠處再試。');return;}"
-        "  var d=nearest(lat,lng);"
-        "  if(d!==null && d<=allowRadius){setReady(true,'可打卡（距離最近地點 '+Math.round(d)+'m）');}"
-        "  else{setReady(false,'不在打卡範圍內（最近 '+Math.round(d||0)+'m）');}"
-        "},function(){"
-        "  setReady(false,'請允許定位權限後重試。');"
-        "},{enableHighAccuracy:true,timeout:10000,maximumAge:0});"
-        "})();</script>"
-        "</body></html>"
-    )
+    outcome("use", "ok")
+    with stage("use", "render"):
+        page = render_template_string(
+            f"<!doctype html><html><head>{HEAD}</head><body>"
+            "<h2>線上打卡</h2>"
+            "<form method='post' action='/punch/' id='punchForm'>"
+            "<input name='eid' placeholder='員工編號' required autofocus>"
+            "<select name='type'>"
+            "<option value='am-in'>1. 上午上班</option>"
+            "<option value='am-out'>2. 上午下班</option>"
+            "<option value='pm-in'>3. 下午上班</option>"
+            "<option value='pm-out'>4. 下午下班</option>"
+            "<option value='ot-in'>5. 加班上班</option>"
+            "<option value='ot-out'>6. 加班下班</option>"
+            "</select>"
+            "<input type='hidden' id='geoLat' name='lat'>"
+            "<input type='hidden' id='geoLng' name='lng'>"
+            "<input type='hidden' id='geoAcc' name='acc'>"
+            f"<input type='hidden' name='token' value='{tok['value']}'>"
+            f"<div class='ttl'>此頁面將在 <span id='sec'>{left}</span> 秒後失效，請儘速提交。</div>"
+            "<div class='ttl' id='geoStatus'>定位中，請稍候…</div>"
+            "<button id='submitBtn' disabled>送出打卡</button>"
+            "</form>"
+            "<p><a href='/admin/login'>管理登入</a></p>"
+            "<script>(function(){"
+            f"var sec={left};"
+            f"var geofenceEnabled={json.dumps(geofence_enabled)};"
+            f"var allowRadius={allow_radius_m};"
+            f"var requireAccuracy={require_accuracy_m};"
+            f"var points={json.dumps(points)};"
+            f"var sitesUrl={json.dumps(sites_url)};"
+            f"var apiUrl={json.dumps(url_for('.api'))};"
+            f"var formUrl={json.dumps(url_for('.form'))};"
+            "var s=document.getElementById('sec');"
+            "var btn=document.getElementById('submitBtn');"
+            "var st=document.getElementById('geoStatus');"
+            "var latInput=document.getElementById('geoLat');"
+            "var lngInput=document.getElementById('geoLng');"
+            "var accInput=document.getElementById('geoAcc');"
+            "function setReady(ok,msg){"
+            "  st.textContent=msg;"
+            "  if(ok){btn.removeAttribute('disabled');btn.classList.remove('disabled');}"
+            "  else{btn.setAttribute('disabled','disabled');btn.classList.add('disabled');}"
+            "}"
+            "function toRad(d){return d*Math.PI/180;}"
+            "function distM(lat1,lon1,lat2,lon2){"
+            "  var R=6371000;"
+            "  var dLat=toRad(lat2-lat1);"
+            "  var dLon=toRad(lon2-lon1);"
+            "  var a=Math.sin(dLat/2)*Math.sin(dLat/2)+Math.cos(toRad(lat1))*Math.cos(toRad(lat2))*Math.sin(dLon/2)*Math.sin(dLon/2);"
+            "  return 2*R*Math.atan2(Math.sqrt(a),Math.sqrt(1-a));"
+            "}"
+            "function nearest(lat,lon){"
+            "  if(!points.length){return null;}"
+            "  var m=Infinity;"
+            "  for(var i=0;i<points.length;i++){"
+            "    var p=points[i];"
+            "    var d=distM(lat,lon,p[0],p[1]);"
+            "    if(d<m){m=d;}"
+            "  }"
+            "  return m;"
+            "}"
+            "var t=setInterval(function(){"
+            "  sec=Math.max(0,sec-1); s.textContent=sec;"
+            "  if(sec<=0){clearInterval(t); btn.setAttribute('disabled','disabled'); btn.classList.add('disabled');}"
+            "},1000);"
+            "var form=document.getElementById('punchForm');"
+            "var labels={'am-in':'上午上班','am-out':'上午下班','pm-in':'下午上班','pm-out':'下午下班','ot-in':'加班上班','ot-out':'加班下班'};"
+            "function showResult(j){"
+            "  clearInterval(t);"
+            "  var h='<h3 class=\"'+j.st+'\"></h3><table><tr><th>時段</th><th>時間</th></tr>';"
+            "  for(var k in labels){h+='<tr><td>'+labels[k]+'</td><td>'+(j.today[k]||'-')+'</td></tr>';}"
+            "  h+='</table>';"
+            "  if(j.card_url){h+='<p><a href=\"'+j.card_url+'\">查看本月出勤</a></p>';}"
+            "  h+='<p>如需再次打卡，請重新掃描 QR Code。</p>';"
+            "  form.innerHTML=h; form.querySelector('h3').textContent=j.msg;"
+            "}"
+            "function showError(msg){"
+            "  clearInterval(t);"
+            "  form.innerHTML='<p class=\"error\"></p><p><a href=\"'+formUrl+'\">重新整理</a></p>';"
+            "  form.querySelector('p').textContent=msg;"
+            "}"
+            "form.addEventListener('submit',function(ev){"
+            "  if(!window.fetch||!window.FormData){return;}"
+            "  ev.preventDefault();"
+            "  setReady(false,'送出中…');"
+            # 只有確定請求沒送出去（離線）才改用表單送出；一旦送到伺服器，token 可能已用掉，
+            # 再送一次只會得到「Token 已失效」，改請使用者重新整理後確認結果
+            "  if(navigator.onLine===false){form.submit();return;}"
+            "  fetch(apiUrl,{method:'POST',body:new FormData(form),credentials:'same-origin'})"
+            "    .then(function(r){"
+            "      return r.json().then(showResult,function(){"
+            "        showError('伺服器忙碌（'+r.status+'），無法確認是否已打卡，請重新整理後查看本月出勤。');"
+            "      });"
+            "    },function(){"
+            "      showError('網路中斷，無法確認是否已打卡，請重新整理後查看本月出勤。');"
+            "    });"
+            "});"
+            "if(!geofenceEnabled){setReady(true,'可打卡（未啟用定位限制）');return;}"
+            "if(!points.length && !sitesUrl){setReady(false,'未設定打卡地點，請聯絡管理員。');return;}"
+            "if(!navigator.geolocation){setReady(false,'此裝置不支援定位。');return;}"
+            "navigator.geolocation.getCurrentPosition(function(pos){"
+            "  var lat=pos.coords.latitude;"
+            "  var lng=pos.coords.longitude;"
+            "  var acc=pos.coords.accuracy || 9999;"
+            "  latInput.value=String(lat);"
+            "  lngInput.value=String(lng);"
+            "  accInput.value=String(acc);"
+            "  if(acc>requireAccuracy){setReady(false,'定位精度不足（'+Math.round(acc)+'m），請移動到空曠處再試。');return;}"
+            "  function check(){"
+            "    var d=nearest(lat,lng);"
+            "    if(d!==null && d<=allowRadius){setReady(true,'可打卡（距離最近地點 '+Math.round(d)+'m）');}"
+            "    else{setReady(false,'不在打卡範圍內（最近 '+Math.round(d||0)+'m）');}"
+            "  }"
+            "  if(!sitesUrl){check();return;}"
+            "  fetch(sitesUrl+'?lat='+lat+'&lng='+lng,{credentials:'same-origin'})"
+            "    .then(function(r){return r.json();})"
+            "    .then(function(j){points=j.points||[];check();})"
+            "    .catch(function(){setReady(false,'無法取得打卡地點，請重試。');});"
+            "},function(){"
+            "  setReady(false,'請允許定位權限後重試。');"
+            "},{enableHighAccuracy:true,timeout:10000,maximumAge:0});"
+            "})();</script>"
+            "</body></html>"
+        )
+    return page
+
+# ────────────  附近打卡地點（地點太多時由 /use 頁面定位後查詢） ────────────
+@punch_bp.route("/sites", methods=["GET"])
+def sites():
+    gate = _load_gate()
+    if not gate or gate.get("ip") != _client_ip() or int(time.time()) > int(gate.get("exp", 0)):
+        return jsonify(points=[]), 403
+    try:
+        lat = float(request.args["lat"])
+        lng = float(request.args["lng"])
+    except (KeyError, ValueError):
+        return jsonify(points=[]), 400
+    margin = float(current_app.config.get("PUNCH_REQUIRE_ACCURACY_M", 150))
+    return jsonify(points=get_index().nearby(lat, lng, margin))
 
 # ????????????????????????  ?漱嚗OST嚗?????????????????????????
-@punch_bp.route("/", methods=["POST"])
-def punch():
-    eid = request.form["eid"].strip()
-    typ = request.form["type"]
-    token = (request.form.get("token") or "").strip()
-
-    # gate 敹?隞???IP ?芾?銝??嚗?
-    gate = session.get("punch_gate")
-    now = int(time.time())
-    if not gate or gate.get("ip") != _client_ip() or now > int(gate.get("exp", 0)):
-        return redirect(url_for(".form", err="連線已失效，請重新掃描 QR Code。"))
-
-    # token ?格活撽?
-    if not _consume_token(token):
-        return redirect(url_for(".form", err="Token 已失效，請重新掃描 QR Code。"))
+def _run_punch(view: str, eid: str, typ: str, token: str,
+               lat: str, lng: str, acc: str) -> tuple[str, str, str]:
+    """Validate gate/token/geofence and write one punch; return (st, code, msg)."""
+
+    # gate 必須仍有效且 IP 一致
+    with stage(view, "gate"):
+        gate = _load_gate()
+        now = int(time.time())
+        ok_gate = gate and gate.get("ip") == _client_ip() and now <= int(gate.get("exp", 0))
+    if not ok_gate:
+        return "error", "gate_expired", "連線已失效，請重新掃描 QR Code。"
+
+    # token 單次驗證
+    with stage(view, "token"):
+        ok_tok = _consume_token(token)
+    if not ok_tok:
+        return "error", "token_expired", "Token 已失效，請重新掃描 QR Code。"
+
+    if typ not in PUNCH_TYPES:
+        return "error", "bad_type", "打卡類型錯誤。"
 
     # 位置圍欄後端二次驗證
     if current_app.config.get("PUNCH_GEOFENCE_ENABLED", False):
         try:
-            lat = float((request.form.get("lat") or "").strip())
-            lng = float((request.form.get("lng") or "").strip())
-            acc = float((request.form.get("acc") or "").strip())
+            lat_f = float((lat or "").strip())
+            lng_f = float((lng or "").strip())
+            acc_f = float((acc or "").strip())
         except Exception:
-            return redirect(url_for(".card", eid=eid, st="error", msg="定位資料無效，請重新操作。"))
+            return "error", "bad_location", "定位資料無效，請重新操作。"
 
         max_acc = float(current_app.config.get("PUNCH_REQUIRE_ACCURACY_M", 150))
-        if acc > max_acc:
-            return redirect(url_for(".card", eid=eid, st="error", msg="定位精度不足，請移動到空曠處再試。"))
-
-        points = _geofence_points()
-        if not points:
-            return redirect(url_for(".card", eid=eid, st="error", msg="尚未設定打卡地點。"))
-
-        allow_radius_m = float(current_app.config.get("PUNCH_ALLOW_RADIUS_M", 100))
-        nearest_m = _nearest_distance_m(lat, lng, points)
-        if nearest_m is None or nearest_m > allow_radius_m:
-            return redirect(url_for(".card", eid=eid, st="error", msg="不在打卡範圍內。"))
-
-    # ???瘚?
+        if acc_f > max_acc:
+            return "error", "low_accuracy", "定位精度不足，請移動到空曠處再試。"
+
+        with stage(view, "geofence"):
+            index = get_index()
+            nearest_m = index.nearest_m(lat_f, lng_f) if index.points else None
+        if not index.points:
+            return "error", "no_sites", "尚未設定打卡地點。"
+        if nearest_m is None or nearest_m > index.radius_m:
+            return "error", "outside_fence", "不在打卡範圍內。"
+
+    # 寫入打卡
     now_dt = datetime.now()
     wd = now_dt.date().isoformat()
     ts = now_dt.isoformat(timespec="seconds")
 
-    emp = Employee.query.get(eid)
+    with stage(view, "employee"):
+        emp = get_directory().get(eid)
     if not emp:
-        return redirect(url_for(".card", eid=eid, st="error", msg="查無此員工。"))
-
-    dup = Checkin.query.filter_by(employee_id=eid, work_date=wd, p_type=typ).first()
-    if dup:
-        msg, st = "本時段已打卡，請勿重複。", "warn"
-    else:
-        db.session.add(Checkin(employee_id=eid, work_date=wd, p_type=typ, ts=ts))
-        db.session.commit()
-        msg, st = "打卡完成。", "success"
+        return "error", "unknown_employee", "查無此員工。"
+
+    # 靠唯一鍵判斷重複（INSERT … ON CONFLICT DO NOTHING），併入 group commit
+    with stage(view, "write"):
+        is_new = record_punch(emp.id, wd, typ, ts)
+        if is_new:
+            note_checkin(emp.id, wd, typ, ts)
+    if is_new:
+        return "success", "ok", "打卡完成。"
+    if is_new is None:
+        return "warn", "pending", "打卡已送出，系統忙碌中尚未確認，請稍後在打卡結果頁確認。"
+    return "warn", "duplicate", "本時段已打卡，請勿重複。"
 
+@punch_bp.route("/", methods=["POST"])
+def punch():
+    eid = request.form["eid"].strip()
+    with stage("punch", "total"):
+        st, code, msg = _run_punch(
+            "punch", eid, request.form["type"], (request.form.get("token") or "").strip(),
+            request.form.get("lat"), request.form.get("lng"), request.form.get("acc"),
+        )
+    outcome("punch", code)
+    if code in ("gate_expired", "token_expired"):
+        return redirect(url_for(".form", err=msg))
     return redirect(url_for(".card", eid=eid, st=st, msg=msg))
 
+# ────────────  JSON 打卡 API：驗證、寫入、回傳今日打卡，一次往返 ────────────
+@punch_bp.route("/api", methods=["POST"])
+def api():
+    data = request.get_json(silent=True) or request.form
+    eid = str(data.get("eid") or "").strip()
+    with stage("api", "total"):
+        st, code, msg = _run_punch(
+            "api", eid, str(data.get("type") or ""), str(data.get("token") or "").strip(),
+            str(data.get("lat") or ""), str(data.get("lng") or ""), str(data.get("acc") or ""),
+        )
+    outcome("api", code)
+
+    today = {}
+    if st in ("success", "warn"):
+        d = date.today()
+        wd = d.isoformat()
+        today = {typ: hm for day, typ, hm in load_month(int(eid), d.year, d.month)
+                 if day == wd and typ in PUNCH_TYPES}
+    return jsonify(ok=st != "error", st=st, code=code, msg=msg, eid=eid, today=today,
+                   card_url=url_for(".card", eid=eid) if eid else None)
+
 # ????????????????????????  ?∪極???蝬剜??見嚗?????????????????????????
 @punch_bp.route("/result/<eid>")
 def card(eid: str):
@@ -460,27 +613,16 @@ def card(eid: str):
         ym_opts.append(f'<option value="{ym_val}" {sel}>{ym_lab}</option>')
         cursor = (cursor - timedelta(days=1)).replace(day=1)
 
-    emp = Employee.query.get_or_404(eid)
+    with stage("card", "employee"):
+        emp = get_directory().get(eid)
+    if not emp:
+        outcome("card", "not_found")
+        abort(404)
     days_in_month = monthrange(y, m)[1]
-    next_m = (date(y, m, 1) + timedelta(days=32)).replace(day=1)
-
-    rows = (
-        Checkin.query
-        .with_entities(Checkin.work_date, Checkin.p_type, Checkin.ts)
-        .filter(Checkin.employee_id == eid)
-        .filter(
-            (Checkin.work_date.like(f"{y}-{m:02d}%")) |
-            (
-                (Checkin.work_date == next_m.isoformat()) &
-                (Checkin.p_type.in_({"am-out", "pm-out", "ot-out"})) &
-                (Checkin.ts < f"{next_m}T{NIGHT_END}:00")
-            )
-        )
-        .order_by(Checkin.work_date, Checkin.p_type)
-        .all()
-    )
 
-    recs = merge_night([(r.work_date, r.p_type, r.ts[11:16]) for r in rows])
+    # 每人每月摘要：打卡 / 編輯時就地更新，不存在時才查資料庫重建
+    with stage("card", "summary"):
+        recs = merge_night(load_month(emp.id, y, m))
 
     body = "".join(
         f"<tr><td>{m:02d}-{d:02d}</td>"
@@ -495,22 +637,25 @@ def card(eid: str):
 
     st, msg = request.args.get("st"), request.args.get("msg")
     status_html = f"<h3 class='{st}'>{msg}</h3>" if st else ""
-    return render_template_string(
-        f"<!doctype html><html><head>{HEAD}</head><body>"
-        f"{status_html}"
-        f"<h3>{emp.name}（員工編號：{eid}，單位：{emp.area}） {y}/{m}</h3>"
-        "<form method='get' id='ymForm'>"
-        f"<input type='hidden' name='eid' value='{eid}'>"
-        "<label for='ymSelect'>選擇月份：</label>"
-        "<select id='ymSelect' name='ym' onchange='ymForm.submit()'>"
-        f"{''.join(ym_opts)}</select></form>"
-        "<table>"
-        "<tr><th>日期</th><th>上午上班</th><th>上午下班</th>"
-        "<th>下午上班</th><th>下午下班</th>"
-        "<th>加班上班</th><th>加班下班</th></tr>"
-        f"{body}"
-        "</table>"
-        f"<p><a href='{url_for('.form')}'>返回線上打卡</a></p>"
-        "</body></html>"
-    )
+    outcome("card", "ok")
+    with stage("card", "render"):
+        page = render_template_string(
+            f"<!doctype html><html><head>{HEAD}</head><body>"
+            f"{status_html}"
+            f"<h3>{emp.name}（員工編號：{eid}，單位：{emp.area}） {y}/{m}</h3>"
+            "<form method='get' id='ymForm'>"
+            f"<input type='hidden' name='eid' value='{eid}'>"
+            "<label for='ymSelect'>選擇月份：</label>"
+            "<select id='ymSelect' name='ym' onchange='ymForm.submit()'>"
+            f"{''.join(ym_opts)}</select></form>"
+            "<table>"
+            "<tr><th>日期</th><th>上午上班</th><th>上午下班</th>"
+            "<th>下午上班</th><th>下午下班</th>"
+            "<th>加班上班</th><th>加班下班</th></tr>"
+            f"{body}"
+            "</table>"
+            f"<p><a href='{url_for('.form')}'>返回線上打卡</a></p>"
+            "</body></html>"
+        )
+    return page
 
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+打卡 gate / 一次性 token（以及打卡結果頁月摘要）的伺服器端 TTL 存放區。
+
+Cookie 只存一個不透明的 punch_sid，實際狀態放在這裡：
+  - MemoryStore ：單一行程用（開發 / 單 worker）
+  - SQLiteStore ：本機 SQLite 檔，gunicorn 多個 worker 共用同一份狀態
+以 PUNCH_STORE = "memory" | "sqlite" 選擇，SQLite 檔案位置為 PUNCH_STORE_PATH。
+consume() 為原子化的「比對後刪除」，平行送出的同一張 token 只會有一個成功；
+add() 只在 key 不存在（或已過期）時寫入。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+# 過期資料清理間隔（秒）
+PURGE_EVERY_SEC = 60
+
+
+class MemoryStore:
+    """In-process TTL store; state is private to one worker."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def _purge(self, now: float) -> None:
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_EVERY_SEC
+        for k in [k for k, (_, exp) in self._data.items() if exp < now]:
+            del self._data[k]
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            hit = self._data.get(key)
+            if not hit or hit[1] < now:
+                return None
+            return json.loads(hit[0])
+
+    def put(self, key: str, value: dict, ttl: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._data[key] = (json.dumps(value), now + ttl)
+
+    def add(self, key: str, value: dict, ttl: int) -> bool:
+        """Store *value* only if *key* is missing or expired; True if stored."""
+
+        now = time.time()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and hit[1] >= now:
+                return False
+            self._data[key] = (json.dumps(value), now + ttl)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def consume(self, key: str, field: str, expected) -> dict | None:
+        """Delete *key* only if value[field] == expected; return the value."""
+
+        now = time.time()
+        with self._lock:
+            hit = self._data.get(key)
+            if not hit or hit[1] < now:
+                return None
+            value = json.loads(hit[0])
+            if value.get(field) != expected:
+                return None
+            del self._data[key]
+            return value
+
+    def update(self, key: str, fn, ttl: int) -> bool:
+        """Atomically replace an existing value with fn(value); False if missing.
+
+        fn may return None to leave the value (and its expiry) untouched.
+        """
+
+        now = time.time()
+        with self._lock:
+            hit = self._data.get(key)
+            if not hit or hit[1] < now:
+                return False
+            value = fn(json.loads(hit[0]))
+            if value is not None:
+                self._data[key] = (json.dumps(value), now + ttl)
+            return True
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for k in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[k]
+
+
+class SQLiteStore:
+    """TTL store in a local SQLite file shared by every worker on the host."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        self._next_purge = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        # 連線不可跨 fork / 執行緒共用：依 (pid, thread) 各開一條
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv "
+            "(k TEXT PRIMARY KEY, v TEXT NOT NULL, exp REAL NOT NULL)"
+        )
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        row = self._conn().execute(
+            "SELECT v FROM kv WHERE k = ? AND exp >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: dict, ttl: int) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO kv (k, v, exp) VALUES (?, ?, ?) "
+            "ON CONFLICT(k) DO UPDATE SET v = excluded.v, exp = excluded.exp",
+            (key, json.dumps(value), now + ttl),
+        )
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_EVERY_SEC
+            conn.execute("DELETE FROM kv WHERE exp < ?", (now,))
+
+    def add(self, key: str, value: dict, ttl: int) -> bool:
+        """Store *value* only if *key* is missing or expired; True if stored."""
+
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO kv (k, v, exp) VALUES (?, ?, ?) "
+            "ON CONFLICT(k) DO UPDATE SET v = excluded.v, exp = excluded.exp WHERE kv.exp < ?",
+            (key, json.dumps(value), now + ttl, now),
+        )
+        return cur.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE k = ?", (key,))
+
+    def consume(self, key: str, field: str, expected) -> dict | None:
+        """Delete *key* only if value[field] == expected; return the value."""
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT v FROM kv WHERE k = ? AND exp >= ?", (key, time.time())
+            ).fetchone()
+            value = json.loads(row[0]) if row else None
+            if value is None or value.get(field) != expected:
+                value = None
+            else:
+                conn.execute("DELETE FROM kv WHERE k = ?", (key,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def update(self, key: str, fn, ttl: int) -> bool:
+        """Atomically replace an existing value with fn(value); False if missing.
+
+        fn may return None to leave the value (and its expiry) untouched.
+        """
+
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT v FROM kv WHERE k = ? AND exp >= ?", (key, now)
+            ).fetchone()
+            value = fn(json.loads(row[0])) if row else None
+            if value is not None:
+                conn.execute(
+                    "UPDATE kv SET v = ?, exp = ? WHERE k = ?",
+                    (json.dumps(value), now + ttl, key),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(row)
+
+    def delete_prefix(self, prefix: str) -> None:
+        self._conn().execute(
+            "DELETE FROM kv WHERE k >= ? AND k < ?", (prefix, prefix + "\uffff")
+        )
+
+
+def get_store():
+    """Return the store configured for the current app (created once)."""
+
+    app = current_app._get_current_object()
+    store = app.extensions.get("punch_store")
+    if store is None:
+        if app.config.get("PUNCH_STORE", "sqlite") == "memory":
+            store = MemoryStore()
+        else:
+            store = SQLiteStore(app.config["PUNCH_STORE_PATH"])
+        store = app.extensions.setdefault("punch_store", store)
+    return store
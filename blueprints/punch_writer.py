@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+打卡寫入器：把同一時間湧入的打卡合併成短批次一起 commit（group commit）。
+
+- 每筆打卡以 INSERT … ON CONFLICT DO NOTHING 寫入，
+  依 (employee_id, work_date, p_type) 唯一鍵判斷是否重複，不再先查再寫。
+  資料庫還沒有這個唯一鍵（未跑 migration f3c8a5d2e1b7）時退回先查再寫。
+- 背景執行緒收集 PUNCH_GROUP_COMMIT_MS 毫秒內（最多 PUNCH_GROUP_COMMIT_MAX 筆）
+  的打卡，一次交易寫入；每位呼叫者仍各自拿到「新增 / 重複」結果。
+  整批交易失敗時逐筆重寫，只有自己寫不進去的那筆回報錯誤。
+- 等超過 RESULT_TIMEOUT_SEC 還沒 commit 時回傳 None（尚未確認），打卡仍留在佇列裡；
+  之後寫入成功的話由寫入器補更新打卡結果頁摘要（card_summary）。
+- PUNCH_GROUP_COMMIT_MS = 0 時直接在請求內寫入（單筆交易）。
+- daily_summary 與打卡在同一個交易內更新（daily_summary.refresh，checkin_month 同時 +1）：
+  group commit 時整批新增的日子一起重算。打卡 commit 了摘要就跟著更新，
+  行程中止也不會留下沒重算的日子。
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeout
+
+from flask import current_app
+from sqlalchemy import exists, insert, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Checkin, checkin_times
+from .card_summary import note_checkin
+from .daily_summary import refresh
+
+# 等待背景寫入結果的上限（秒），避免請求無限卡住
+RESULT_TIMEOUT_SEC = 10
+
+_UNIQUE_COLS = {"employee_id", "work_date", "p_type"}
+_unique_key: dict[str, bool] = {}       # 資料庫 URL → 是否有唯一鍵（跑完 migration 後重啟生效）
+_ck = Checkin.__table__
+
+
+def has_unique_key(conn) -> bool:
+    """Whether checkin has the (employee_id, work_date, p_type) key ON CONFLICT relies on."""
+
+    url = str(conn.engine.url)
+    if url not in _unique_key:
+        insp = inspect(conn)
+        keys = [c["column_names"] for c in insp.get_unique_constraints("checkin")]
+        keys += [i["column_names"] for i in insp.get_indexes("checkin") if i["unique"]]
+        _unique_key[url] = any(set(k) == _UNIQUE_COLS for k in keys)
+    return _unique_key[url]
+
+
+def _insert_stmt(dialect_name: str):
+    """Return an INSERT that silently skips rows hitting a unique constraint."""
+
+    if dialect_name == "sqlite":
+        return sqlite.insert(Checkin).on_conflict_do_nothing()
+    if dialect_name == "postgresql":
+        return postgresql.insert(Checkin).on_conflict_do_nothing()
+    return None
+
+
+def _changes(rows: list[dict], results: list[bool]) -> list[tuple]:
+    return [(r["employee_id"], r["work_date"]) for r, ok in zip(rows, results) if ok]
+
+
+def insert_rows(conn, rows: list[dict]) -> list[bool]:
+    """Insert *rows* one by one, skipping duplicates; True means the row was new."""
+
+    if not has_unique_key(conn):
+        # 沒有唯一鍵：同舊版先查再寫（同批前面剛寫入的也查得到）
+        results = []
+        for row in rows:
+            dup = conn.execute(select(exists().where(
+                _ck.c.employee_id == row["employee_id"], _ck.c.work_date == row["work_date"],
+                _ck.c.p_type == row["p_type"],
+            ))).scalar()
+            if not dup:
+                conn.execute(insert(Checkin), row)
+            results.append(not dup)
+        return results
+
+    stmt = _insert_stmt(conn.dialect.name)
+    if stmt is not None:
+        return [conn.execute(stmt, row).rowcount == 1 for row in rows]
+
+    # 其他資料庫：逐筆 SAVEPOINT，撞唯一鍵視為重複
+    results = []
+    for row in rows:
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(Checkin), row)
+            results.append(True)
+        except IntegrityError:
+            results.append(False)
+    return results
+
+
+class PunchWriter:
+    """Collect concurrent punches into short group commits on a worker thread."""
+
+    def __init__(self, app, window_ms: float, max_batch: int):
+        self._app = app
+        self._window = max(window_ms, 0) / 1000.0
+        self._max_batch = max(int(max_batch), 1)
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_thread(self) -> None:
+        # gunicorn fork 之後執行緒不會跟著過去，依 pid 判斷是否要重啟
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, name="punch-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, row: dict) -> bool | None:
+        """Queue one punch and block until its batch is committed (None on timeout)."""
+
+        self._ensure_thread()
+        fut: Future = Future()
+        self._queue.put((row, fut))
+        try:
+            return fut.result(timeout=RESULT_TIMEOUT_SEC)
+        except FutureTimeout:
+            # cancel 失敗表示剛好寫完，照常回結果；成功則由寫入器事後補更新摘要
+            if fut.cancel():
+                return None
+            return fut.result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows: list[dict]) -> list[bool]:
+        with self._app.app_context():
+            with db.engine.begin() as conn:
+                results = insert_rows(conn, rows)
+                refresh(conn, _changes(rows, results))
+        return results
+
+    def _done(self, row: dict, fut: Future, ok: bool) -> None:
+        try:
+            fut.set_result(ok)
+            return
+        except InvalidStateError:       # 呼叫者已逾時離開（cancel）
+            pass
+        if ok:
+            # 打卡結果頁摘要改由這裡更新
+            with self._app.app_context():
+                note_checkin(row["employee_id"], row["work_date"], row["p_type"], row["ts"])
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                results = self._write([row for row, _ in batch])
+            except Exception:  # noqa: BLE001
+                self._app.logger.exception("punch batch of %d failed; retrying one by one", len(batch))
+                results = None
+            if results is not None:
+                for (row, fut), ok in zip(batch, results):
+                    self._done(row, fut, ok)
+                continue
+            # 一筆壞資料不拖累同批其他人的打卡
+            for row, fut in batch:
+                try:
+                    ok = self._write([row])[0]
+                except Exception as exc:  # noqa: BLE001
+                    self._app.logger.exception("punch %s failed", row)
+                    try:
+                        fut.set_exception(exc)
+                    except InvalidStateError:
+                        pass
+                    continue
+                self._done(row, fut, ok)
+
+
+def record_punch(employee_id: int, work_date: str, p_type: str, ts: str) -> bool | None:
+    """Write one punch; return True if it was new, False if it was a duplicate.
+
+    None means the group commit did not finish within RESULT_TIMEOUT_SEC: the
+    punch is still queued and may yet be written.
+    """
+
+    row = {"employee_id": employee_id, "work_date": work_date, "p_type": p_type, "ts": ts,
+           **checkin_times(work_date, ts)}
+    app = current_app._get_current_object()
+    window_ms = float(app.config.get("PUNCH_GROUP_COMMIT_MS", 0))
+
+    if window_ms <= 0:
+        with db.engine.begin() as conn:
+            ok = insert_rows(conn, [row])[0]
+            refresh(conn, _changes([row], [ok]))
+        return ok
+
+    writer = app.extensions.get("punch_writer")
+    if writer is None:
+        writer = app.extensions.setdefault(
+            "punch_writer",
+            PunchWriter(app, window_ms, app.config.get("PUNCH_GROUP_COMMIT_MAX", 64)),
+        )
+    return writer.submit(row)
@@ -3,13 +3,21 @@
 行政後台：出勤月表與單筆編輯（六段獨立上下班）
 | 日期 | 上午上 | 上午下 | 下午上 | 下午下 | 加班上 | 加班下 | 備註 | 正班 | 加班≤2 | 加班>2 | 假日 |
 """
-from flask import Blueprint, render_template_string, request, redirect, url_for, abort
-from datetime import date, timedelta, datetime
+from flask import (Blueprint, Response, render_template_string, request, redirect, url_for,
+                   abort, stream_with_context)
+from datetime import date, timedelta
 import re
 
+import numpy as np
+
 from extensions import db
-from models import Employee, Checkin
-from . import CSS, merge_night, calc_hours
+from models import Checkin, checkin_times
+from . import CSS
+from .directory import get_directory
+from .card_summary import note_checkin, drop_checkin
+from .hours import SEGMENTS, RECORDS_CUTOFF, running_total
+from .daily_summary import refresh
+from .month_archive import card_hours, closed_for
 
 rec_bp = Blueprint("rec", __name__, url_prefix="/admin")
 
@@ -40,13 +48,12 @@ def show_records():
         ym = f"{y}-{m:02d}"
 
     # 2. 下拉選單 ------------------------------------------------------------
-    areas = db.session.query(Employee.area).distinct().order_by(Employee.area).all()
+    directory = get_directory()
     area_opts = "".join(
-        f'<option value="{a.area}" {"selected" if a.area == area else ""}>{a.area}</option>'
-        for a in areas
+        f'<option value="{a}" {"selected" if a == area else ""}>{a}</option>'
+        for a in directory.areas()
     )
-    emp_q = Employee.query.filter_by(area=area) if area else Employee.query
-    emp_ls = emp_q.order_by(Employee.id).all()
+    emp_ls = directory.in_area(area) if area else directory.all()
     emp_opts = "".join(
         f'<option value="{e.id}" {"selected" if str(e.id) == eid else ""}>{e.id}-{e.name}</option>'
         for e in emp_ls
@@ -60,7 +67,7 @@ def show_records():
     # 3. 決定顯示對象 --------------------------------------------------------
     single_mode = bool(eid)
     if single_mode:
-        targets = [Employee.query.get_or_404(eid)]
+        targets = [directory.get(eid) or abort(404)]
     elif area:
         targets = emp_ls
     else:
@@ -93,140 +100,78 @@ document.getElementById('ymSel').addEventListener('change', () => {{
             f"<h2>出勤卡查詢</h2>{form_html}</body></html>"
         )
 
-    html_parts = [form_html]
-
     # 4. 逐員工產表 ----------------------------------------------------------
-    for emp in targets:
-        brk = emp.default_break or 0.0
-        first = date(y, m, 1)
-        days_in_m = (
-            (first.replace(day=28) + timedelta(days=4)).replace(day=1) - first
-        ).days
-        next_m = (first + timedelta(days=32)).replace(day=1)
-
-        # 4.1 取原始打卡資料 -------------------------------------------------
-        raws = (
-            Checkin.query.with_entities(
-                Checkin.work_date, Checkin.p_type, Checkin.ts, Checkin.note
-            )
-            .filter_by(employee_id=emp.id)
-            .filter(
-                Checkin.work_date >= first.isoformat(),
-                Checkin.work_date <= (next_m + timedelta(days=1)).isoformat(),
-            )
-            .order_by(Checkin.work_date, Checkin.p_type)
-            .all()
-        )
-
-        # 4.2 00:00–02:59 下班 → 歸前一天 ------------------------------------
-        def adj(r):
-            """回傳 (YYYY-MM-DD, p_type, HH:MM)，凌晨下班歸前日"""
-            ts_dt = datetime.fromisoformat(r.ts)
-            early_out = r.p_type in {"am-out", "pm-out", "ot-out"} and 0 <= ts_dt.hour <= 2
-            adj_date = (
-                (ts_dt.date() - timedelta(days=1)).isoformat()
-                if early_out
-                else ts_dt.date().isoformat()
+    # 整區一次算好（凌晨 03:00 前下班歸前日，已結帳的月份讀快照），再逐員工串流輸出
+    mh = card_hours(y, m, [e.id for e in targets], [e.default_break for e in targets],
+                    cutoff=RECORDS_CUTOFF)
+    hol_all = mh.hol
+    reg_sums = running_total(np.where(mh.is_hol, 0.0, mh.reg))
+    ot2_sums = running_total(np.where(mh.is_hol, 0.0, mh.ot2))
+    otx_sums = running_total(np.where(mh.is_hol, 0.0, mh.otx))
+    hol_sums = running_total(hol_all)
+    wdays = mh.worked.sum(axis=1)
+
+    def export_btn(report: str, label: str) -> str:
+        # 建立匯出工作只收 POST（連結會被預先載入 / 爬蟲觸發）
+        return (f"<form method='post' action=\"{url_for('jobs.create')}\" style='display:inline'>"
+                f"<input type='hidden' name='report' value='{report}'>"
+                f"<input type='hidden' name='ym' value='{ym}'>"
+                f"<button type='submit'>{label}</button></form>")
+
+    def generate():
+        yield f"<!doctype html><html><head>{CSS}</head><body>{form_html}"
+        for emp in targets:
+            i = mh.row(emp.id)
+            times = {pt: mh.times[k, i].tolist() for k, pt in enumerate(SEGMENTS)}
+            regs, ot2s, otxs, hols = (
+                mh.reg[i].tolist(), mh.ot2[i].tolist(), mh.otx[i].tolist(), hol_all[i].tolist()
             )
-            return adj_date, r.p_type, ts_dt.strftime("%H:%M")
+            notes = mh.leave.get(emp.id, {})
+            wday = float(wdays[i])
 
-        recs = merge_night([adj(r) for r in raws])
+            cols = list(SEGMENTS)
+            rows_html = ""
 
-        # 備註／假別 ---------------------------------------------------------
-        notes = {
-            r.work_date[8:10]: (r.note or "請假")
-            for r in raws
-            if r.p_type == LEAVE_PTYPE
-        }
-
-        cols = ["am-in", "am-out", "pm-in", "pm-out", "ot-in", "ot-out"]
-        wday = reg_sum = ot2_sum = otx_sum = hol_sum = 0.0
-        rows_html = ""
+            # 回到同一頁狀態 -------------------------------------------------
+            back = url_for(
+                "rec.show_records", area=area, eid=(emp.id if single_mode else ""), ym=ym
+            )
 
-        # 回到同一頁狀態 -----------------------------------------------------
-        back = url_for(
-            "rec.show_records", area=area, eid=(emp.id if single_mode else ""), ym=ym
-        )
+            # 4.3 逐日輸出 ---------------------------------------------------
+            for d in range(1, mh.days + 1):
+                dd = f"{d:02d}"
+                is_hol = bool(mh.is_hol[d - 1])
+                reg, ot2, otx, hol = regs[d - 1], ot2s[d - 1], otxs[d - 1], hols[d - 1]
+
+                note = notes.get(dd, "")
+                style = (
+                    ' style="background:#FFF2CC"'
+                    if note
+                    else ' style="background:#DDDDDD"' if is_hol else ""
+                )
 
-        # 4.3 逐日計算 -------------------------------------------------------
-        for d in range(1, days_in_m + 1):
-            dd = f"{d:02d}"
-            is_hol = date(y, m, d).weekday() >= 5
-            reg = ot2 = otx = 0.0
-
-            # 早班
-            s_am = recs.get((dd, "am-in"))
-            e_am = recs.get((dd, "am-out")) or recs.get((dd, "pm-out"))
-            has_pm_in = recs.get((dd, "pm-in")) is not None
-            if s_am and e_am:
-                h = sum(calc_hours(s_am, e_am, brk, skip_break=has_pm_in))
-                take_reg = min(h, 8 - reg)
-                reg += take_reg
-                remain = h - take_reg
-                take2 = min(remain, 2 - ot2)
-                ot2 += take2
-                otx += remain - take2
-
-            # 午班
-            s_pm = recs.get((dd, "pm-in"))
-            e_pm = recs.get((dd, "pm-out"))
-            if s_pm and e_pm:
-                h = sum(calc_hours(s_pm, e_pm, brk, skip_break=True))
-                take_reg = min(h, 8 - reg)
-                reg += take_reg
-                remain = h - take_reg
-                take2 = min(remain, 2 - ot2)
-                ot2 += take2
-                otx += remain - take2
-
-            # 加班
-            s_ot = recs.get((dd, "ot-in"))
-            e_ot = recs.get((dd, "ot-out"))
-            if s_ot and e_ot:
-                h = sum(calc_hours(s_ot, e_ot, brk, skip_break=True))
-                take2 = min(h, 2 - ot2)
-                ot2 += take2
-                otx += h - take2
-
-            # 假日時數
-            hol = reg + ot2 + otx if is_hol else 0.0
-            if is_hol:
-                hol_sum += hol
-            else:
-                reg_sum += reg
-                ot2_sum += ot2
-                otx_sum += otx
-            if reg or ot2 or otx:
-                wday += 1
-
-            note = notes.get(dd, "")
-            style = (
-                ' style="background:#FFF2CC"'
-                if note
-                else ' style="background:#DDDDDD"' if is_hol else ""
-            )
+                def link(pt, val):
+                    day = f"{y}-{m:02d}-{dd}"
+                    url = url_for("rec.edit_record", emp=emp.id, date=day, typ=pt, back=back)
+                    return f'<a href="{url}">{val}</a>'
 
-            def link(pt, val):
-                day = f"{y}-{m:02d}-{dd}"
-                url = url_for("rec.edit_record", emp=emp.id, date=day, typ=pt, back=back)
-                return f'<a href="{url}">{val}</a>'
+                cells = "".join(
+                    f"<td>{link(pt, times[pt][d - 1] or '-')}</td>" for pt in cols
+                )
+                rows_html += (
+                    f"<tr{style}><td>{m:02d}-{dd}</td>{cells}"
+                    f"<td>{link(LEAVE_PTYPE, note or '-')}</td>"
+                    f"<td>{reg or ''}</td><td>{ot2 or ''}</td><td>{otx or ''}</td><td>{hol or ''}</td></tr>"
+                )
 
-            cells = "".join(
-                f"<td>{link(pt, recs.get((dd, pt)) or '-')}</td>" for pt in cols
-            )
-            rows_html += (
-                f"<tr{style}><td>{m:02d}-{dd}</td>{cells}"
-                f"<td>{link(LEAVE_PTYPE, note or '-')}</td>"
-                f"<td>{reg or ''}</td><td>{ot2 or ''}</td><td>{otx or ''}</td><td>{hol or ''}</td></tr>"
+            total_row = (
+                "<tr><th>總計</th><th colspan=\"7\"></th>"
+                f"<th>{float(reg_sums[i])}</th><th>{float(ot2_sums[i])}</th>"
+                f"<th>{float(otx_sums[i])}</th><th>{float(hol_sums[i])}</th></tr>"
             )
 
-        total_row = (
-            "<tr><th>總計</th><th colspan=\"7\"></th>"
-            f"<th>{reg_sum}</th><th>{ot2_sum}</th><th>{otx_sum}</th><th>{hol_sum}</th></tr>"
-        )
-
-        html_parts.append(
-            f"""
+            yield (
+                f"""
 <h2>{emp.name}（{emp.id}） 區域：{emp.area}　{y}/{m}</h2>
 <h3>出勤天數：{wday}</h3>
 <table>
@@ -236,17 +181,16 @@ document.getElementById('ymSel').addEventListener('change', () => {{
 {rows_html}{total_row}</table>
 
 <p>
-  <a href="{url_for('exp.export', ym=ym)}">匯出員工薪資報表</a> |
-  <a href="{url_for('exp.export_punch_all', ym=ym)}">匯出工時卡片總檔</a> |
+  {export_btn('payroll', '匯出員工薪資報表')} |
+  {export_btn('punch_all', '匯出工時卡片總檔')} |
   <a href="{url_for('emp.list_employees')}">返回員工管理</a>
 </p>
 <hr>"""
-        )
+            )
+        yield "</body></html>"
 
-    # 5. 回傳 ---------------------------------------------------------------
-    return render_template_string(
-        f"<!doctype html><html><head>{CSS}</head><body>{''.join(html_parts)}</body></html>"
-    )
+    # 5. 回傳（第一張卡片不必等整區算完）-----------------------------------
+    return Response(stream_with_context(generate()), mimetype="text/html")
 
 
 # ────────────────────── 單筆編輯 ──────────────────────
@@ -264,26 +208,39 @@ def edit_record():
     init_val = (rec.note if typ == LEAVE_PTYPE else rec.ts[11:16]) if rec else ""
 
     if request.method == "POST":
+        # 已結帳的月份唯讀（原值、新值任一落在已結帳月份都不行）
+        val = request.form.get("val", "").strip()
+        new_ts = f"{dt}T{val}:00" if re.fullmatch(r"\d{2}:\d{2}", val) else None
+        for ts in {rec.ts if rec else None, new_ts}:
+            closed = closed_for(dt, typ, ts)
+            if closed:
+                return abort(409, f"{closed} 已結帳，不能修改")
+
         if request.form.get("clear"):
             if rec:
                 db.session.delete(rec)
+                db.session.flush()
+                refresh(db.session.connection(), [(emp_id, dt)])
                 db.session.commit()
+                drop_checkin(emp_id, dt, typ)
             return redirect(back)
 
-        val = request.form.get("val", "").strip()
         if typ == LEAVE_PTYPE:
             if not val:
                 return abort(400, "假別不可空白")
+            ts = f"{dt}T00:00:00"
             if rec:
                 rec.note = val
+                ts = rec.ts
             else:
                 db.session.add(
                     Checkin(
                         employee_id=emp_id,
                         work_date=dt,
                         p_type=LEAVE_PTYPE,
-                        ts=f"{dt}T00:00:00",
+                        ts=ts,
                         note=val,
+                        **checkin_times(dt, ts),
                     )
                 )
         else:
@@ -292,11 +249,16 @@ def edit_record():
             ts = f"{dt}T{val}:00"
             if rec:
                 rec.ts = ts
+                rec.ts_at = checkin_times(dt, ts)["ts_at"]
             else:
                 db.session.add(
-                    Checkin(employee_id=emp_id, work_date=dt, p_type=typ, ts=ts)
+                    Checkin(employee_id=emp_id, work_date=dt, p_type=typ, ts=ts,
+                            **checkin_times(dt, ts))
                 )
+        db.session.flush()
+        refresh(db.session.connection(), [(emp_id, dt)])
         db.session.commit()
+        note_checkin(emp_id, dt, typ, ts)
         return redirect(back)
 
     title_map = {
@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+"""
+把新工作表直接串流寫進範本 xlsx 的副本。
+
+範本的每個 part 原封不動複製（公式快取值、佈景主題、印表設定都保留），
+只修補 workbook.xml / workbook.xml.rels / [Content_Types].xml / styles.xml：
+  - 新工作表以 xl/worksheets/sheetN.xml 逐列寫入 zip，記憶體裡只留「目前這一列」
+  - 欄寬、凍結窗格、合併格、樣式都是 metadata，不必逐格複製
+API 仿 xlsxwriter（add_format / add_worksheet / write / write_row / merge_range），
+但有兩個限制：列必須由上往下寫；set_column、freeze_panes 要在寫第一格前呼叫。
+
+範本解析結果（工作表名稱、下一個 sheetId / rId、樣式數量、要修補的四個 part）
+每個 process 只做一次，以檔案 mtime + 大小為鍵，檔案換掉後下一次匯出自動重新解析。
+不給範本（template=None）時從內建的空白活頁簿開始。
+
+add_sheets() 可把各工作表交給 process pool 各自寫成獨立的 sheetN.xml 暫存檔，
+再依原順序複製進 zip；樣式索引由主行程先配好，結果與逐張寫入完全相同。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import numbers
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from itertools import repeat
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WORKSHEET_REL = NS_REL + "/worksheet"
+WORKSHEET_CT = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+WORKBOOK = "xl/workbook.xml"
+WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+CONTENT_TYPES = "[Content_Types].xml"
+STYLES = "xl/styles.xml"
+PATCHED = (WORKBOOK, WORKBOOK_RELS, CONTENT_TYPES, STYLES)
+
+# XML 1.0 不允許的控制字元
+_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# Excel 工作表名稱禁用字元與長度上限
+_BAD_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+SHEET_NAME_MAX = 31
+
+# 空白活頁簿（沒有工作表、沒有佈景主題，只有預設樣式）
+_BLANK_PARTS = {
+    CONTENT_TYPES: (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    WORKBOOK: (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL}">'
+        '<bookViews><workbookView/></bookViews><sheets></sheets></workbook>'
+    ),
+    WORKBOOK_RELS: (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{NS_REL}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    STYLES: (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<styleSheet xmlns="{NS_MAIN}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+def col_name(col: int) -> str:
+    """0-based column index → Excel letters (0 → 'A')."""
+
+    name = ""
+    col += 1
+    while col:
+        col, rem = divmod(col - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+
+def _col_width(width: float) -> float:
+    # 與 xlsxwriter 寫入 <col width> 的換算相同（字元寬 → 含邊距的儲存值）
+    if width <= 0:
+        return 0.0
+    pixels = int(width * 12 + 0.5) if width < 1 else int(width * 7 + 0.5) + 5
+    return int(pixels / 7 * 256) / 256
+
+
+class Format:
+    """A cell style appended to the template's cellXfs; *index* is the xf id."""
+
+    # 只支援匯出用到的屬性：bold, font_size, border(1=thin), align, bg_color
+    def __init__(self, index: int, props: dict, themed: bool = True):
+        self.index = index
+        self.props = dict(props)
+        self.themed = themed
+
+    def font_xml(self) -> str:
+        p = self.props
+        bold = "<b/>" if p.get("bold") else ""
+        if not self.themed:     # 沒有 theme part 時不引用佈景主題的顏色 / 字型配置
+            return f'<font>{bold}<sz val="{p.get("font_size", 11)}"/><name val="Calibri"/><family val="2"/></font>'
+        return (f'<font>{bold}<sz val="{p.get("font_size", 11)}"/><color theme="1"/>'
+                '<name val="Calibri"/><family val="2"/><scheme val="minor"/></font>')
+
+    def fill_xml(self) -> str:
+        color = self.props.get("bg_color")
+        if not color:
+            return '<fill><patternFill patternType="none"/></fill>'
+        return ('<fill><patternFill patternType="solid">'
+                f'<fgColor rgb="FF{color.lstrip("#").upper()}"/><bgColor indexed="64"/>'
+                '</patternFill></fill>')
+
+    def border_xml(self) -> str:
+        if not self.props.get("border"):
+            return "<border><left/><right/><top/><bottom/><diagonal/></border>"
+        side = '<{0} style="thin"><color indexed="64"/></{0}>'
+        return ("<border>" + "".join(side.format(s) for s in ("left", "right", "top", "bottom"))
+                + "<diagonal/></border>")
+
+    def xf_xml(self, font_id: int, fill_id: int, border_id: int) -> str:
+        align = self.props.get("align")
+        inner = f'<alignment horizontal="{align}"/>' if align else ""
+        return (f'<xf numFmtId="0" fontId="{font_id}" fillId="{fill_id}" borderId="{border_id}" '
+                'xfId="0" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1">'
+                f"{inner}</xf>")
+
+
+class StreamSheet:
+    """One worksheet written row by row into the open zip entry."""
+
+    def __init__(self, fh, name: str):
+        self.fh = fh
+        self.name = name
+        self._cols: list[tuple[int, int, float]] = []
+        self._freeze: tuple[int, int] | None = None
+        self._merges: list[str] = []
+        self._rows: dict[int, dict[int, str]] = {}
+        self._next_row = 0          # 已寫出的列 < _next_row
+        self._started = False
+
+    # ── 寫第一格前設定 ──
+    def set_column(self, first: int, last: int, width: float) -> None:
+        self._check_not_started("set_column")
+        self._cols.append((first, last, width))
+
+    def freeze_panes(self, row: int, col: int) -> None:
+        self._check_not_started("freeze_panes")
+        self._freeze = (row, col)
+
+    def _check_not_started(self, what: str) -> None:
+        if self._started:
+            raise RuntimeError(f"{what}() must be called before writing cells")
+
+    def _start(self) -> None:
+        self._started = True
+        view = '<sheetView workbookViewId="0">'
+        if self._freeze and any(self._freeze):
+            r, c = self._freeze
+            split = (f' xSplit="{c}"' if c else "") + (f' ySplit="{r}"' if r else "")
+            pane = "bottomRight" if r and c else ("bottomLeft" if r else "topRight")
+            view += (f'<pane{split} topLeftCell="{col_name(c)}{r + 1}" '
+                     f'activePane="{pane}" state="frozen"/>'
+                     f'<selection pane="{pane}"/>')
+        view += "</sheetView>"
+        head = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<worksheet xmlns="{NS_MAIN}" xmlns:r="{NS_REL}">'
+                f"<sheetViews>{view}</sheetViews>"
+                '<sheetFormatPr defaultRowHeight="15"/>')
+        if self._cols:
+            head += "<cols>" + "".join(
+                f'<col min="{a + 1}" max="{b + 1}" width="{_col_width(w)}" customWidth="1"/>'
+                for a, b, w in sorted(self._cols)
+            ) + "</cols>"
+        self.fh.write((head + "<sheetData>").encode("utf-8"))
+
+    # ── 儲存格 ──
+    def write(self, row: int, col: int, value, fmt: Format | None = None) -> None:
+        if not self._started:
+            self._start()
+        if row < self._next_row:
+            raise ValueError(f"row {row} already flushed; rows must be written in order")
+        self._flush_before(row)
+
+        ref = f"{col_name(col)}{row + 1}"
+        s = f' s="{fmt.index}"' if fmt is not None else ""
+        if type(value).__module__ == "numpy" and hasattr(value, "item"):
+            value = value.item()        # np.int64 / np.float32 / np.bool_ → 內建型別
+        if value is None or value == "":
+            if fmt is None:
+                return
+            cell = f'<c r="{ref}"{s}/>'
+        elif isinstance(value, bool):
+            cell = f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+        elif isinstance(value, numbers.Real):
+            if value != value or value in (float("inf"), float("-inf")):
+                cell = f'<c r="{ref}"{s}/>'
+            else:
+                # 浮點數與 xlsxwriter 相同取 16 位有效數字
+                num = int(value) if isinstance(value, numbers.Integral) else f"{float(value):.16G}"
+                cell = f'<c r="{ref}"{s}><v>{num}</v></c>'
+        else:
+            text = escape(_ILLEGAL.sub("", str(value)))
+            cell = f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+        self._rows.setdefault(row, {})[col] = cell
+
+    def write_row(self, row: int, col: int, values, fmt: Format | None = None) -> None:
+        for k, v in enumerate(values):
+            self.write(row, col + k, v, fmt)
+
+    def merge_range(self, first_row: int, first_col: int, last_row: int, last_col: int,
+                    data, fmt: Format | None = None) -> None:
+        for r in range(first_row, last_row + 1):
+            for c in range(first_col, last_col + 1):
+                self.write(r, c, data if (r, c) == (first_row, first_col) else None, fmt)
+        self._merges.append(f"{col_name(first_col)}{first_row + 1}:"
+                            f"{col_name(last_col)}{last_row + 1}")
+
+    def _flush_before(self, row: int) -> None:
+        for r in sorted(k for k in self._rows if k < row):
+            cells = self._rows.pop(r)
+            self.fh.write((f'<row r="{r + 1}">'
+                           + "".join(cells[c] for c in sorted(cells))
+                           + "</row>").encode("utf-8"))
+        self._next_row = max(self._next_row, row)
+
+    def close(self) -> None:
+        if not self._started:
+            self._start()
+        self._flush_before(float("inf"))
+        tail = "</sheetData>"
+        if self._merges:
+            tail += (f'<mergeCells count="{len(self._merges)}">'
+                     + "".join(f'<mergeCell ref="{m}"/>' for m in self._merges)
+                     + "</mergeCells>")
+        tail += ('<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" '
+                 'header="0.3" footer="0.3"/></worksheet>')
+        self.fh.write(tail.encode("utf-8"))
+        self.fh.close()
+
+
+def render_sheet(path: str, name: str, render, payload) -> str:
+    """Write one complete worksheet part to *path* with render(ws, payload).
+
+    Runs in a pool process for TemplateBook.add_sheets; *render* must be a
+    module-level function so it can be pickled.
+    """
+
+    ws = StreamSheet(open(path, "wb"), name)
+    render(ws, payload)
+    ws.close()
+    return path
+
+
+def check_sheet_name(name: str, existing) -> None:
+    """Raise ValueError for names Excel would reject (same rules as xlsxwriter)."""
+
+    if not name or len(name) > SHEET_NAME_MAX:
+        raise ValueError(f"sheet name must be 1-{SHEET_NAME_MAX} characters: {name!r}")
+    if _BAD_SHEET_CHARS.search(name) or name[0] == "'" or name[-1] == "'":
+        raise ValueError(f"invalid character in sheet name: {name!r}")
+    if name.lower() in (n.lower() for n in existing):
+        raise ValueError(f"duplicate sheet name: {name}")
+
+
+@dataclass(frozen=True)
+class TemplateInfo:
+    """What an export needs to know about the template, parsed once per file version."""
+
+    path: str
+    key: tuple                  # (st_mtime_ns, st_size)
+    digest: str                 # 檔案內容 sha256
+    parts: dict                 # PATCHED part → 原始 XML
+    sheetnames: tuple
+    next_sheet_id: int
+    next_rid: int
+    next_part: int
+    counts: dict                # fonts / fills / borders / cellXfs 數量
+    themed: bool                # 有沒有 xl/theme/（新樣式的字型是否引用佈景主題）
+
+
+_templates: dict[str, TemplateInfo] = {}
+_templates_lock = threading.Lock()
+_blank: tuple[bytes, TemplateInfo] | None = None
+
+
+def _count(xml: str, tag: str) -> int:
+    return int(re.search(rf'<{tag} count="(\d+)"', xml).group(1))
+
+
+def parse_template(fh, path: str, key: tuple) -> TemplateInfo:
+    """Parse the workbook metadata of an open template file."""
+
+    fh.seek(0)
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: fh.read(1 << 16), b""):
+        sha.update(chunk)
+    fh.seek(0)
+
+    with zipfile.ZipFile(fh) as z:
+        parts = {name: z.read(name).decode("utf-8") for name in PATCHED}
+        names = z.namelist()
+        taken = {n for n in names if n.startswith("xl/worksheets/sheet")}
+
+    sheets = ET.fromstring(parts[WORKBOOK]).find(f"{{{NS_MAIN}}}sheets")
+    rels = ET.fromstring(parts[WORKBOOK_RELS])
+    next_part = 1
+    while f"xl/worksheets/sheet{next_part}.xml" in taken:
+        next_part += 1
+
+    return TemplateInfo(
+        path=path,
+        key=key,
+        digest=sha.hexdigest(),
+        parts=parts,
+        sheetnames=tuple(s.get("name") for s in sheets),
+        next_sheet_id=max((int(s.get("sheetId")) for s in sheets), default=0) + 1,
+        next_rid=max(int(r.get("Id")[3:]) for r in rels
+                     if r.get("Id", "").startswith("rId")) + 1,
+        next_part=next_part,
+        counts={t: _count(parts[STYLES], t) for t in ("fonts", "fills", "borders", "cellXfs")},
+        themed=any(n.startswith("xl/theme/") for n in names),
+    )
+
+
+def blank_template() -> tuple[bytes, TemplateInfo]:
+    """The built-in empty workbook (zip bytes, parsed info), built once per process."""
+
+    global _blank
+    if _blank is None:
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+            for name, xml in _BLANK_PARTS.items():
+                z.writestr(name, xml.encode("utf-8"))
+        data = buf.getvalue()
+        _blank = (data, parse_template(io.BytesIO(data), "", ()))
+    return _blank
+
+
+def load_template(path, fh=None) -> TemplateInfo:
+    """Cached TemplateInfo for *path*; re-parsed when its mtime or size changes.
+
+    Pass the already-open *fh* so the key (and a re-parse) match the bytes being read.
+    """
+
+    path = os.fspath(path)
+    own = fh is None
+    if own:
+        fh = open(path, "rb")
+    try:
+        st = os.fstat(fh.fileno())
+        key = (st.st_mtime_ns, st.st_size)
+        info = _templates.get(path)
+        if info is not None and info.key == key:
+            return info
+        with _templates_lock:
+            info = _templates.get(path)
+            if info is None or info.key != key:
+                info = _templates[path] = parse_template(fh, path, key)
+            return info
+    finally:
+        if own:
+            fh.close()
+
+
+class TemplateBook:
+    """Copy of a template workbook with extra sheets streamed in; write to *out*.
+
+    *template* None starts from an empty workbook instead of a file.
+    """
+
+    def __init__(self, template, out):
+        if template is None:
+            data, self.template = blank_template()
+            self._fh = io.BytesIO(data)
+        else:
+            self._fh = open(template, "rb")
+            self.template = load_template(template, self._fh)
+        self._tpl = zipfile.ZipFile(self._fh)
+        self._zip = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED)
+
+        info = self.template
+        self.sheetnames = list(info.sheetnames)
+        self._next_sheet_id = info.next_sheet_id
+        self._next_rid = info.next_rid
+        self._next_part = info.next_part
+        self._formats: list[Format] = []
+        self._added: list[tuple[str, str, int, int]] = []    # (name, part, rId, sheetId)
+        self._sheet: StreamSheet | None = None
+
+    def add_format(self, props: dict) -> Format:
+        fmt = Format(self.template.counts["cellXfs"] + len(self._formats), props,
+                     self.template.themed)
+        self._formats.append(fmt)
+        return fmt
+
+    def _new_part(self, name: str):
+        check_sheet_name(name, self.sheetnames)
+        if self._sheet is not None:
+            self._sheet.close()
+            self._sheet = None
+        part = f"xl/worksheets/sheet{self._next_part}.xml"
+        self._next_part += 1
+        self._added.append((name, part, self._next_rid, self._next_sheet_id))
+        self._next_rid += 1
+        self._next_sheet_id += 1
+        self.sheetnames.append(name)
+        return self._zip.open(part, "w", force_zip64=True)
+
+    def add_worksheet(self, name: str) -> StreamSheet:
+        self._sheet = StreamSheet(self._new_part(name), name)
+        return self._sheet
+
+    def add_sheet_file(self, name: str, path) -> None:
+        """Add a worksheet part already rendered to *path* (see render_sheet)."""
+
+        with open(path, "rb") as src, self._new_part(name) as dst:
+            shutil.copyfileobj(src, dst, 1 << 16)
+
+    def add_sheets(self, render, sheets, pool=None, chunksize: int = 1) -> None:
+        """Add [(name, payload)] sheets in order, each drawn by render(ws, payload).
+
+        With a process *pool* the sheets are rendered to temp files in parallel
+        and copied in list order, so the workbook is the same as without one.
+        """
+
+        sheets = list(sheets)
+        if pool is None or len(sheets) < 2:
+            for name, payload in sheets:
+                render(self.add_worksheet(name), payload)
+            return
+
+        names = [name for name, _ in sheets]
+        seen = list(self.sheetnames)
+        for name in names:              # 先檢查名稱，不要算完才失敗
+            check_sheet_name(name, seen)
+            seen.append(name)
+
+        with tempfile.TemporaryDirectory(prefix="xlsx-") as tmp:
+            paths = [os.path.join(tmp, f"{k}.xml") for k in range(len(sheets))]
+            done = pool.map(render_sheet, paths, names, repeat(render),
+                            (payload for _, payload in sheets),
+                            chunksize=chunksize)
+            for name, path in zip(names, done):
+                self.add_sheet_file(name, path)
+                os.unlink(path)
+
+    def close(self) -> None:
+        if self._sheet is not None:
+            self._sheet.close()
+            self._sheet = None
+
+        for info in self._tpl.infolist():
+            if info.filename in PATCHED:
+                continue
+            with self._tpl.open(info) as src, self._zip.open(info.filename, "w") as dst:
+                shutil.copyfileobj(src, dst, 1 << 16)
+
+        parts = dict(self.template.parts)
+        parts[WORKBOOK] = parts[WORKBOOK].replace("</sheets>", "".join(
+            f'<sheet name={quoteattr(name)} sheetId="{sid}" r:id="rId{rid}"/>'
+            for name, _, rid, sid in self._added
+        ) + "</sheets>", 1)
+        parts[WORKBOOK_RELS] = parts[WORKBOOK_RELS].replace("</Relationships>", "".join(
+            f'<Relationship Id="rId{rid}" Type="{WORKSHEET_REL}" '
+            f'Target="{part[len("xl/"):]}"/>'
+            for _, part, rid, _ in self._added
+        ) + "</Relationships>", 1)
+        parts[CONTENT_TYPES] = parts[CONTENT_TYPES].replace("</Types>", "".join(
+            f'<Override PartName="/{part}" ContentType="{WORKSHEET_CT}"/>'
+            for _, part, _, _ in self._added
+        ) + "</Types>", 1)
+        parts[STYLES] = self._patch_styles(parts[STYLES])
+
+        for name in PATCHED:
+            self._zip.writestr(name, parts[name].encode("utf-8"))
+        self._zip.close()
+        self._tpl.close()
+        self._fh.close()
+
+    def _patch_styles(self, xml: str) -> str:
+        fonts, fills, borders = (self.template.counts[t] for t in ("fonts", "fills", "borders"))
+        n = len(self._formats)
+        add = {
+            "fonts": "".join(f.font_xml() for f in self._formats),
+            "fills": "".join(f.fill_xml() for f in self._formats),
+            "borders": "".join(f.border_xml() for f in self._formats),
+            "cellXfs": "".join(f.xf_xml(fonts + k, fills + k, borders + k)
+                               for k, f in enumerate(self._formats)),
+        }
+        for tag, extra in add.items():
+            xml = re.sub(rf'<{tag} count="(\d+)"',
+                         lambda mt: f'<{tag} count="{int(mt.group(1)) + n}"', xml, count=1)
+            xml = xml.replace(f"</{tag}>", extra + f"</{tag}>", 1)
+        return xml
@@ -18,9 +18,37 @@ class Config:
         "pool_recycle": 280,
     }
 
+    # 員工名單每頁筆數
+    EMP_PAGE_SIZE = int(os.getenv("EMP_PAGE_SIZE", "50"))
+
+    # 匯入員工 / 歷史打卡：每批解析 / 查詢 / 寫入的列數
+    IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+
+    # 員工名錄快取的版本戳記檔（員工異動時改寫，讓各 worker 重新載入）
+    EMP_DIRECTORY_STAMP = os.getenv("EMP_DIRECTORY_STAMP", os.path.join(BASE, "employee_dir.stamp"))
+
+    # 各 worker 的監控快照目錄（/admin/metrics 彙總）
+    METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(BASE, "metrics"))
+
+    # 背景匯出工作：結果與狀態檔目錄、每個 worker 的匯出行程數、結果保留秒數
+    EXPORT_JOB_DIR = os.getenv("EXPORT_JOB_DIR", os.path.join(BASE, "export_jobs"))
+    EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+    EXPORT_JOB_KEEP_SEC = int(os.getenv("EXPORT_JOB_KEEP_SEC", "86400"))
+
+    # 已結帳月份的封存快照目錄（flask summary close YYYY-MM）
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(BASE, "archive"))
+
+    # 產生好的匯出檔快取目錄（依月份資料 watermark 失效）
+    EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(BASE, "export_cache"))
+    # 匯出時分頭繪製工作表的行程數（1 = 不開 pool，在原行程逐張寫）
+    # 每個 gunicorn worker、每個背景匯出工作行程各開一個 pool，總行程數是兩者相乘，預設保持小
+    EXPORT_RENDER_WORKERS = int(os.getenv("EXPORT_RENDER_WORKERS", "2"))
+
     # ─────────────────────────────────────────────
     # 打卡頁「短效 gate / token」設定（IP/UA 綁定）
     # ─────────────────────────────────────────────
+    # 打卡 QR 內的網址開頭（例如 https://hr.example.com）；空白時依請求的 Host
+    PUNCH_QR_BASE_URL = os.getenv("PUNCH_QR_BASE_URL", "")
     # gate：視為「仍在現場」的有效視窗（秒）
     PUNCH_GATE_TTL_SEC = int(os.getenv("PUNCH_GATE_TTL_SEC", "120"))
     # 一次性 token 的時效（秒）
@@ -28,11 +56,33 @@ class Config:
     # 是否把 IP/UA 摻入驗證（降低轉傳風險）
     PUNCH_BIND_IP = os.getenv("PUNCH_BIND_IP", "1") == "1"
     PUNCH_BIND_UA = os.getenv("PUNCH_BIND_UA", "1") == "1"
+    # gate / token 存放區：memory（單一行程）或 sqlite（多 worker 共用本機檔案）
+    PUNCH_STORE = os.getenv("PUNCH_STORE", "sqlite")
+    PUNCH_STORE_PATH = os.getenv("PUNCH_STORE_PATH", os.path.join(BASE, "punch_store.db"))
+    # 重整 /punch 時，剩餘秒數不少於此值就沿用原 token
+    PUNCH_TOKEN_REUSE_MIN_SEC = int(os.getenv("PUNCH_TOKEN_REUSE_MIN_SEC", "30"))
+
+    # 打卡頁流量管制（只管 /punch、/punch/use；POST 打卡不受限）
+    # token bucket：每秒補充數 / 最大額度（每個 worker 各自計算）；IP 可能是整間公司共用，給得較寬
+    # FP 為每個瀏覽器（punch_sid cookie）的額度
+    PUNCH_IP_RATE = float(os.getenv("PUNCH_IP_RATE", "20"))
+    PUNCH_IP_BURST = float(os.getenv("PUNCH_IP_BURST", "60"))
+    PUNCH_FP_RATE = float(os.getenv("PUNCH_FP_RATE", "0.5"))
+    PUNCH_FP_BURST = float(os.getenv("PUNCH_FP_BURST", "6"))
+    # 每個 worker 同時處理的頁面請求上限；超過時回「請稍候」頁
+    PUNCH_PAGE_MAX_INFLIGHT = int(os.getenv("PUNCH_PAGE_MAX_INFLIGHT", "8"))
+    PUNCH_PAGE_RETRY_SEC = int(os.getenv("PUNCH_PAGE_RETRY_SEC", "3"))
+
+    # 打卡寫入 group commit：收集幾毫秒內的打卡一次 commit（0 = 每筆各自 commit）
+    PUNCH_GROUP_COMMIT_MS = float(os.getenv("PUNCH_GROUP_COMMIT_MS", "5"))
+    PUNCH_GROUP_COMMIT_MAX = int(os.getenv("PUNCH_GROUP_COMMIT_MAX", "64"))
 
     # 打卡定位圍欄（任一座標點半徑內可打卡）
     PUNCH_GEOFENCE_ENABLED = os.getenv("PUNCH_GEOFENCE_ENABLED", "1") == "1"
     PUNCH_ALLOW_RADIUS_M = float(os.getenv("PUNCH_ALLOW_RADIUS_M", "500"))
     PUNCH_REQUIRE_ACCURACY_M = float(os.getenv("PUNCH_REQUIRE_ACCURACY_M", "250"))
+    # 地點數超過此值時，打卡頁不內嵌全部座標，改於定位後查詢附近地點
+    PUNCH_GEOFENCE_INLINE_MAX = int(os.getenv("PUNCH_GEOFENCE_INLINE_MAX", "20"))
     PUNCH_GEOFENCE_POINTS = [
         (24.842556724831017, 121.2107761047848),    # t1
         (24.960056999676954, 121.30991556472662),   # 亦傑
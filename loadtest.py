@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+線上打卡壓力測試：模擬 N 位員工同時走完整個打卡流程。
+
+每位員工各自一份 cookie jar，依序：
+  GET /punch/ → GET /punch/use?tk=… → POST /punch/ → GET /punch/result/<eid>
+定位座標取自 PUNCH_GEOFENCE_POINTS，隨機落在允許半徑內。
+結束時輸出每秒打卡數、各步驟 p50/p95/p99，以及重複 / 錯誤比例。
+
+使用方式：
+1. 內建伺服器 + 暫存 SQLite（預設）
+     python loadtest.py -n 200 -c 50
+2. 本機 Postgres（建立測試員工、清掉上次的打卡）
+     python loadtest.py -n 500 -c 100 --database-url postgresql://… --reset
+3. 打已啟動的伺服器（如 gunicorn），資料庫與伺服器共用
+     python loadtest.py --url http://127.0.0.1:8000 --database-url sqlite:///… -n 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+STEPS = ("form", "use", "punch", "result")
+TOKEN_RE = re.compile(r"name='token' value='([^']+)'")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One simulated phone: own cookie jar and User-Agent."""
+
+    def __init__(self, base_url: str, eid: int, timeout: float):
+        self.base = base_url.rstrip("/")
+        self.eid = eid
+        self.timeout = timeout
+        self.ua = f"loadtest/{eid}"
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect
+        )
+
+    def request(self, path: str, data: dict | None = None) -> tuple[int, str, str]:
+        """Return (status, Location, body) without following redirects."""
+
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(
+            self.base + path, data=body, headers={"User-Agent": self.ua}
+        )
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, "", resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get("Location", ""), ""
+
+
+def _point_in_fence(points, radius_m: float) -> tuple[float, float]:
+    lat0, lng0 = random.choice(points)
+    d = random.uniform(0, radius_m * 0.5)
+    a = random.uniform(0, 2 * math.pi)
+    lat = lat0 + d * math.cos(a) / 111320.0
+    lng = lng0 + d * math.sin(a) / (111320.0 * math.cos(math.radians(lat0)))
+    return lat, lng
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lat: dict[str, list[float]] = defaultdict(list)
+        self.outcomes: Counter = Counter()
+
+    def add(self, step: str, sec: float) -> None:
+        with self._lock:
+            self.lat[step].append(sec)
+
+    def count(self, outcome: str) -> None:
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+
+def _timed(stats: Stats, step: str, fn, *args):
+    t0 = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        stats.add(step, time.perf_counter() - t0)
+
+
+def run_employee(client: Client, types: list[str], rounds: int, points, radius_m: float,
+                 stats: Stats) -> None:
+    """Run *rounds* full punch sequences for one employee."""
+
+    for i in range(rounds):
+        typ = types[i % len(types)]
+        try:
+            st, loc, _ = _timed(stats, "form", client.request, "/punch/")
+            if st == 429:
+                stats.count("throttled")
+                continue
+            if st != 302 or "tk=" not in loc:
+                stats.count("error:form")
+                continue
+            path = urllib.parse.urlsplit(loc)
+            st, _, page = _timed(stats, "use", client.request, f"{path.path}?{path.query}")
+            m = TOKEN_RE.search(page)
+            if st == 429:
+                stats.count("throttled")
+                continue
+            if st != 200 or not m:
+                stats.count("error:use")
+                continue
+
+            lat, lng = _point_in_fence(points, radius_m)
+            form = {"eid": client.eid, "type": typ, "token": m.group(1),
+                    "lat": f"{lat:.7f}", "lng": f"{lng:.7f}", "acc": "15"}
+            st, loc, _ = _timed(stats, "punch", client.request, "/punch/", form)
+            q = urllib.parse.parse_qs(urllib.parse.urlsplit(loc).query)
+            if st != 302:
+                stats.count("error:punch")
+                continue
+            if "st" not in q:
+                stats.count("error:expired")     # 被導回表單：gate / token 失效
+                continue
+            stats.count({"success": "success", "warn": "duplicate"}.get(q["st"][0], "error:punch"))
+
+            st, _, _ = _timed(stats, "result", client.request, f"/punch/result/{client.eid}")
+            if st != 200:
+                stats.count("error:result")
+        except (OSError, urllib.error.URLError):
+            stats.count("error:network")
+
+
+def _pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+def report(stats: Stats, elapsed: float) -> str:
+    punches = sum(v for k, v in stats.outcomes.items() if k in ("success", "duplicate"))
+    attempts = sum(stats.outcomes.values())
+    errors = sum(v for k, v in stats.outcomes.items() if k.startswith("error"))
+    lines = [
+        f"耗時 {elapsed:.2f}s，送出 {attempts} 次，完成打卡 {punches} 次",
+        f"吞吐量：{punches / elapsed if elapsed else 0:.1f} punches/s",
+        f"重複率：{stats.outcomes['duplicate'] / attempts if attempts else 0:.2%}　"
+        f"錯誤率：{errors / attempts if attempts else 0:.2%}　"
+        f"被限流：{stats.outcomes['throttled'] / attempts if attempts else 0:.2%}",
+        "",
+        f"{'step':<8}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for step in STEPS:
+        v = stats.lat.get(step, [])
+        lines.append(
+            f"{step:<8}{len(v):>7}"
+            + "".join(f"{_pct(v, p) * 1000:>10.1f}" for p in (50, 95, 99))
+        )
+    if errors:
+        lines.append("")
+        lines += [f"{k}: {v}" for k, v in sorted(stats.outcomes.items()) if k.startswith("error")]
+    return "\n".join(lines)
+
+
+def prepare_db(app, eids: list[int], reset: bool) -> None:
+    """Create the load-test employees; optionally drop their earlier punches."""
+
+    from extensions import db
+    from models import Employee, Checkin
+    from blueprints.card_summary import forget_employee
+    from blueprints.daily_summary import refresh
+    from blueprints.directory import get_directory
+
+    with app.app_context():
+        have = {e.id for e in Employee.query.filter(Employee.id.in_(eids))}
+        db.session.add_all(
+            Employee(id=e, name=f"LT{e}", area="loadtest", default_break=0.0)
+            for e in eids if e not in have
+        )
+        if reset:
+            # 與刪除員工相同：每日摘要重算（連帶 checkin_month +1），打卡結果頁月摘要清掉
+            mine = Checkin.query.filter(Checkin.employee_id.in_(eids))
+            changes = mine.with_entities(Checkin.employee_id, Checkin.work_date).distinct().all()
+            mine.delete(synchronize_session=False)
+            refresh(db.session.connection(), changes)
+        db.session.commit()
+        get_directory().invalidate()
+        if reset:
+            for e in eids:
+                forget_employee(e)
+
+
+def serve_in_background(app) -> str:
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # 不逐筆印 access log
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="線上打卡壓力測試")
+    ap.add_argument("-n", "--employees", type=int, default=100, help="模擬員工數")
+    ap.add_argument("-c", "--concurrency", type=int, default=20, help="同時連線數")
+    ap.add_argument("-r", "--rounds", type=int, default=1, help="每人打卡次數")
+    ap.add_argument("--types", default="am-in", help="打卡類型（逗號分隔，依序輪替）")
+    ap.add_argument("--eid-start", type=int, default=900000, help="測試員工編號起點")
+    ap.add_argument("--url", help="已啟動伺服器的網址；未指定則在本行程內啟動")
+    ap.add_argument("--database-url", help="資料庫連線字串（建立測試員工用）")
+    ap.add_argument("--reset", action="store_true", help="先刪除測試員工既有的打卡")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    args = ap.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif not args.url:
+        tmp = tempfile.mkdtemp(prefix="punch-loadtest-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'loadtest.db')}"
+        os.environ.setdefault("PUNCH_STORE_PATH", os.path.join(tmp, "punch_store.db"))
+        os.environ.setdefault("EMP_DIRECTORY_STAMP", os.path.join(tmp, "employee_dir.stamp"))
+        os.environ.setdefault("METRICS_DIR", os.path.join(tmp, "metrics"))
+
+    from app import create_app      # 需在設定環境變數之後載入
+
+    app = create_app()
+    eids = list(range(args.eid_start, args.eid_start + args.employees))
+    if args.database_url or not args.url:
+        prepare_db(app, eids, args.reset)
+    if not args.url:
+        # 本行程內啟動（含 --database-url）：模擬的手機全都來自 127.0.0.1，不套用每 IP 限流
+        app.config["PUNCH_IP_RATE"] = 0
+    base_url = args.url or serve_in_background(app)
+
+    points = app.config["PUNCH_GEOFENCE_POINTS"]
+    radius_m = float(app.config.get("PUNCH_ALLOW_RADIUS_M", 100))
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    stats = Stats()
+
+    print(f"目標 {base_url}：{args.employees} 人 × {args.rounds} 次，同時 {args.concurrency} 連線")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(run_employee, Client(base_url, eid, args.timeout),
+                        types, args.rounds, points, radius_m, stats)
+            for eid in eids
+        ]
+        for f in futures:
+            f.result()
+    print(report(stats, time.perf_counter() - t0))
+
+
+if __name__ == "__main__":
+    main()
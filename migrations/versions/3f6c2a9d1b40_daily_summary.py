@@ -0,0 +1,50 @@
+"""add daily_summary and summary_month
+
+Revision ID: 3f6c2a9d1b40
+Revises: e76227564f17
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2a9d1b40'
+down_revision = 'e76227564f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_summary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('employee_id', sa.Integer(), nullable=False),
+    sa.Column('work_day', sa.Date(), nullable=False),
+    sa.Column('am_in', sa.String(length=5), nullable=True),
+    sa.Column('am_out', sa.String(length=5), nullable=True),
+    sa.Column('pm_in', sa.String(length=5), nullable=True),
+    sa.Column('pm_out', sa.String(length=5), nullable=True),
+    sa.Column('ot_in', sa.String(length=5), nullable=True),
+    sa.Column('ot_out', sa.String(length=5), nullable=True),
+    sa.Column('reg', sa.Float(), nullable=False),
+    sa.Column('ot2', sa.Float(), nullable=False),
+    sa.Column('otx', sa.Float(), nullable=False),
+    sa.Column('is_holiday', sa.Boolean(), nullable=False),
+    sa.Column('leave_note', sa.String(length=50), nullable=True),
+    sa.ForeignKeyConstraint(['employee_id'], ['employee.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('employee_id', 'work_day')
+    )
+    op.create_index('ix_daily_summary_work_day', 'daily_summary', ['work_day', 'employee_id'], unique=False)
+    op.create_table('summary_month',
+    sa.Column('ym', sa.String(length=7), nullable=False),
+    sa.Column('built_at', sa.String(length=19), nullable=False),
+    sa.PrimaryKeyConstraint('ym')
+    )
+
+
+def downgrade():
+    op.drop_table('summary_month')
+    op.drop_index('ix_daily_summary_work_day', table_name='daily_summary')
+    op.drop_table('daily_summary')
@@ -9,20 +9,23 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '89e0b1a7a381'
-down_revision = None
+down_revision = '90d40742f620'
 branch_labels = None
 depends_on = None
 
 
 def upgrade():
-    op.alter_column('checkin', 'p_type',
-                    existing_type=sa.String(length=3),
-                    type_=sa.String(length=8),
-                    existing_nullable=False)
+    # batch：SQLite 不支援 ALTER COLUMN，改以重建資料表的方式變更
+    with op.batch_alter_table('checkin') as batch_op:
+        batch_op.alter_column('p_type',
+                              existing_type=sa.String(length=3),
+                              type_=sa.String(length=8),
+                              existing_nullable=False)
 
 
 def downgrade():
-    op.alter_column('checkin', 'p_type',
-                    existing_type=sa.String(length=8),
-                    type_=sa.String(length=3),
-                    existing_nullable=False)
\ No newline at end of file
+    with op.batch_alter_table('checkin') as batch_op:
+        batch_op.alter_column('p_type',
+                              existing_type=sa.String(length=8),
+                              type_=sa.String(length=3),
+                              existing_nullable=False)
\ No newline at end of file
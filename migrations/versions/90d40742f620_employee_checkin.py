@@ -0,0 +1,57 @@
+"""employee / checkin tables
+
+Restores the revision the bundled attendance.db is stamped with; the tables
+match that database (employees / checkins from the initial revision stay).
+Databases built by db.create_all() (no alembic_version yet) already have
+both tables; they are left as they are and the later revisions upgrade them.
+
+Revision ID: 90d40742f620
+Revises: 8b92ec97ac5c
+Create Date: 2025-07-10 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '90d40742f620'
+down_revision = '8b92ec97ac5c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'employee' not in existing:
+        _create_employee()
+    if 'checkin' not in existing:
+        _create_checkin()
+
+
+def _create_employee():
+    op.create_table('employee',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('area', sa.String(length=50), nullable=True),
+    sa.Column('default_break', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def _create_checkin():
+    op.create_table('checkin',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('employee_id', sa.Integer(), nullable=False),
+    sa.Column('work_date', sa.String(length=10), nullable=False),
+    sa.Column('p_type', sa.String(length=3), nullable=False),
+    sa.Column('ts', sa.String(length=19), nullable=False),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['employee_id'], ['employee.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('checkin')
+    op.drop_table('employee')
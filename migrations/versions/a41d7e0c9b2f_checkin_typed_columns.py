@@ -0,0 +1,74 @@
+"""checkin: typed work_day / ts_at columns and composite indexes
+
+Revision ID: a41d7e0c9b2f
+Revises: 3f6c2a9d1b40
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d7e0c9b2f'
+down_revision = '3f6c2a9d1b40'
+branch_labels = None
+depends_on = None
+
+BATCH = 5000
+
+checkin = sa.table(
+    'checkin',
+    sa.column('id', sa.Integer),
+    sa.column('work_date', sa.String),
+    sa.column('ts', sa.String),
+    sa.column('work_day', sa.Date),
+    sa.column('ts_at', sa.DateTime),
+)
+
+
+def upgrade():
+    op.add_column('checkin', sa.Column('work_day', sa.Date(), nullable=True))
+    op.add_column('checkin', sa.Column('ts_at', sa.DateTime(), nullable=True))
+
+    # 由字串欄位回填（分批，避免一次載入整張表）
+    bind = op.get_bind()
+    stmt = (
+        checkin.update()
+        .where(checkin.c.id == sa.bindparam('_id'))
+        .values(work_day=sa.bindparam('_day'), ts_at=sa.bindparam('_at'))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(checkin.c.id, checkin.c.work_date, checkin.c.ts)
+            .where(checkin.c.id > last_id)
+            .order_by(checkin.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(stmt, [
+            {'_id': r.id, '_day': date.fromisoformat(r.work_date),
+             '_at': datetime.fromisoformat(r.ts)}
+            for r in rows
+        ])
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('checkin') as batch_op:
+        batch_op.alter_column('work_day', existing_type=sa.Date(), nullable=False)
+        batch_op.alter_column('ts_at', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('ix_checkin_work_day_emp', 'checkin', ['work_day', 'employee_id'], unique=False)
+    op.create_index('ix_checkin_emp_day_type_ts', 'checkin',
+                    ['employee_id', 'work_day', 'p_type', 'ts_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_checkin_emp_day_type_ts', table_name='checkin')
+    op.drop_index('ix_checkin_work_day_emp', table_name='checkin')
+    with op.batch_alter_table('checkin') as batch_op:
+        batch_op.drop_column('ts_at')
+        batch_op.drop_column('work_day')
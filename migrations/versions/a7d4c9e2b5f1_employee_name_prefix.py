@@ -0,0 +1,29 @@
+"""employee: indexes for 1-2 character name search (from the 1st / 2nd character)
+
+The FTS5 trigram index needs at least 3 characters; most names are 2-3.
+Shorter queries are matched as ranges on name and on substr(name, 2).
+
+Revision ID: a7d4c9e2b5f1
+Revises: f3c8a5d2e1b7
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4c9e2b5f1'
+down_revision = 'f3c8a5d2e1b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_employee_name', 'employee', ['name'], unique=False)
+    op.create_index('ix_employee_name_tail', 'employee', [sa.text('substr(name, 2)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_employee_name_tail', table_name='employee')
+    op.drop_index('ix_employee_name', table_name='employee')
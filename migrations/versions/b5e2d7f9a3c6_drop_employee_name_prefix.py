@@ -0,0 +1,29 @@
+"""employee: drop the 1st / 2nd character name indexes
+
+1-2 character name queries are plain substring matches again (LIKE over the
+table, case-insensitive like the FTS5 path), so nothing reads these indexes.
+
+Revision ID: b5e2d7f9a3c6
+Revises: a7d4c9e2b5f1
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e2d7f9a3c6'
+down_revision = 'a7d4c9e2b5f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_employee_name_tail', table_name='employee')
+    op.drop_index('ix_employee_name', table_name='employee')
+
+
+def downgrade():
+    op.create_index('ix_employee_name', 'employee', ['name'], unique=False)
+    op.create_index('ix_employee_name_tail', 'employee', [sa.text('substr(name, 2)')], unique=False)
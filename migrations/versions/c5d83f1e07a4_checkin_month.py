@@ -0,0 +1,28 @@
+"""add checkin_month change counter
+
+Revision ID: c5d83f1e07a4
+Revises: a41d7e0c9b2f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d83f1e07a4'
+down_revision = 'a41d7e0c9b2f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('checkin_month',
+    sa.Column('ym', sa.String(length=7), nullable=False),
+    sa.Column('rev', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('ym')
+    )
+
+
+def downgrade():
+    op.drop_table('checkin_month')
@@ -0,0 +1,25 @@
+"""summary_month.closed_at for closed (archived) months
+
+Revision ID: d2e6b48a9c13
+Revises: c5d83f1e07a4
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2e6b48a9c13'
+down_revision = 'c5d83f1e07a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('summary_month', sa.Column('closed_at', sa.String(length=19), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('summary_month') as batch_op:
+        batch_op.drop_column('closed_at')
@@ -0,0 +1,70 @@
+"""employee list: (area, id) index and name search index
+
+SQLite: FTS5 trigram table employee_fts (external content, kept in sync by triggers).
+Postgres: pg_trgm GIN index on employee.name (ILIKE '%…%').
+Either one is skipped with a warning when the database lacks the feature
+(SQLite < 3.34, no permission to create pg_trgm); the list then falls back
+to a plain LIKE scan.
+
+Revision ID: e9b3f1a6c2d8
+Revises: d2e6b48a9c13
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b3f1a6c2d8'
+down_revision = 'd2e6b48a9c13'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.runtime.migration')
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE employee_fts USING fts5("
+    "name, content='employee', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER employee_fts_ai AFTER INSERT ON employee BEGIN "
+    "INSERT INTO employee_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER employee_fts_ad AFTER DELETE ON employee BEGIN "
+    "INSERT INTO employee_fts(employee_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER employee_fts_au AFTER UPDATE OF name ON employee BEGIN "
+    "INSERT INTO employee_fts(employee_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO employee_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO employee_fts(employee_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ix_employee_name_trgm ON employee USING gin (name gin_trgm_ops)",
+]
+
+
+def upgrade():
+    op.create_index('ix_employee_area_id', 'employee', ['area', 'id'], unique=False)
+
+    bind = op.get_bind()
+    stmts = {'sqlite': SQLITE_FTS, 'postgresql': POSTGRES_TRGM}.get(bind.dialect.name, [])
+    try:
+        # 沒有 FTS5 trigram（SQLite < 3.34）或沒有權限建 pg_trgm 時略過
+        with bind.begin_nested():
+            for stmt in stmts:
+                bind.exec_driver_sql(stmt)
+    except sa.exc.DBAPIError as e:
+        log.warning("employee name search index NOT created, name search scans the table: %s",
+                    e.orig)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for name in ('employee_fts_ai', 'employee_fts_ad', 'employee_fts_au'):
+            bind.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+        bind.exec_driver_sql("DROP TABLE IF EXISTS employee_fts")
+    elif bind.dialect.name == 'postgresql':
+        bind.exec_driver_sql("DROP INDEX IF EXISTS ix_employee_name_trgm")
+    op.drop_index('ix_employee_area_id', table_name='employee')
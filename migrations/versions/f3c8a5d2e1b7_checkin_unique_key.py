@@ -0,0 +1,65 @@
+"""checkin: drop duplicate punches, unique key (employee_id, work_date, p_type)
+
+Revision ID: f3c8a5d2e1b7
+Revises: e9b3f1a6c2d8
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from datetime import date, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a5d2e1b7'
+down_revision = 'e9b3f1a6c2d8'
+branch_labels = None
+depends_on = None
+
+# 同一 (employee_id, work_date, p_type) 只留最早寫入的一筆（舊版先查再寫也是留第一筆）
+DUPLICATES = """
+SELECT id, work_date FROM checkin
+WHERE id NOT IN (SELECT MIN(id) FROM checkin GROUP BY employee_id, work_date, p_type)
+"""
+
+
+def _months(work_dates) -> list[str]:
+    """YYYY-MM months whose summaries a deleted punch fed (day 1 also feeds the month before)."""
+
+    yms = set()
+    for wd in work_dates:
+        d = date.fromisoformat(wd)
+        for day in (d - timedelta(days=1), d):
+            yms.add(f'{day.year:04d}-{day.month:02d}')
+    return sorted(yms)
+
+
+def upgrade():
+    bind = op.get_bind()
+    dups = bind.execute(sa.text(DUPLICATES)).all()
+    if dups:
+        ids = [r.id for r in dups]
+        for i in range(0, len(ids), 500):
+            bind.execute(sa.text('DELETE FROM checkin WHERE id IN :ids')
+                         .bindparams(sa.bindparam('ids', expanding=True)), {'ids': ids[i:i + 500]})
+        # 未結帳月份的摘要作廢（下次查詢整月重建），打卡異動計數 +1 讓匯出快取過期
+        for ym in _months(r.work_date for r in dups):
+            closed = bind.execute(sa.text(
+                'SELECT closed_at FROM summary_month WHERE ym = :ym'), {'ym': ym}).scalar()
+            if closed is None:
+                bind.execute(sa.text('DELETE FROM summary_month WHERE ym = :ym'), {'ym': ym})
+                y, m = map(int, ym.split('-'))
+                bind.execute(sa.text(
+                    'DELETE FROM daily_summary WHERE work_day >= :a AND work_day < :b'),
+                    {'a': f'{ym}-01', 'b': f'{y + m // 12:04d}-{m % 12 + 1:02d}-01'})
+            if bind.execute(sa.text('UPDATE checkin_month SET rev = rev + 1 WHERE ym = :ym'),
+                            {'ym': ym}).rowcount == 0:
+                bind.execute(sa.text('INSERT INTO checkin_month (ym, rev) VALUES (:ym, 1)'),
+                             {'ym': ym})
+    op.create_index('uq_checkin_emp_date_type', 'checkin',
+                    ['employee_id', 'work_date', 'p_type'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_checkin_emp_date_type', table_name='checkin')
@@ -1,4 +1,6 @@
 # models.py
+from datetime import date, datetime
+
 from extensions import db
 
 class Employee(db.Model):
@@ -8,6 +10,11 @@ class Employee(db.Model):
     area          = db.Column(db.String(50))
     default_break = db.Column(db.Float, nullable=False, default=0.0)
 
+    # 員工名單依區域篩選、以 id 分頁（姓名搜尋的 FTS5 / pg_trgm 索引見 migration e9b3f1a6c2d8）
+    __table_args__ = (
+        db.Index('ix_employee_area_id', 'area', 'id'),
+    )
+
 class Checkin(db.Model):
     __tablename__ = 'checkin'    # 若你原本叫 checkins，請更新為一致
     id          = db.Column(db.Integer, primary_key=True)
@@ -16,7 +23,53 @@ class Checkin(db.Model):
     p_type      = db.Column(db.String(10), nullable=False)      
     ts          = db.Column(db.String(19), nullable=False)   
     note = db.Column(db.String(50))  # 允許輸入中文備註
-  
+    # 與 work_date / ts 同值的型別欄位：月份查詢走範圍索引（寫入時以 checkin_times() 一併填入）
+    work_day    = db.Column(db.Date, nullable=False)
+    ts_at       = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # 打卡重複判斷（INSERT … ON CONFLICT DO NOTHING）靠這個唯一鍵
+        db.Index('uq_checkin_emp_date_type', 'employee_id', 'work_date', 'p_type', unique=True),
+        db.Index('ix_checkin_work_day_emp', 'work_day', 'employee_id'),
+        db.Index('ix_checkin_emp_day_type_ts', 'employee_id', 'work_day', 'p_type', 'ts_at'),
+    )
+
+def checkin_times(work_date: str, ts: str) -> dict:
+    """work_day / ts_at values matching the string columns."""
+    return {"work_day": date.fromisoformat(work_date), "ts_at": datetime.fromisoformat(ts)}
+
+class DailySummary(db.Model):
+    """每人每日出勤摘要（由打卡寫入時同步維護，報表直接讀取）"""
+    __tablename__ = 'daily_summary'
+    id          = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    work_day    = db.Column(db.Date, nullable=False)
+    am_in       = db.Column(db.String(5))       # HH:MM（已套用凌晨下班歸前日）
+    am_out      = db.Column(db.String(5))
+    pm_in       = db.Column(db.String(5))
+    pm_out      = db.Column(db.String(5))
+    ot_in       = db.Column(db.String(5))
+    ot_out      = db.Column(db.String(5))
+    reg         = db.Column(db.Float, nullable=False, default=0.0)
+    ot2         = db.Column(db.Float, nullable=False, default=0.0)
+    otx         = db.Column(db.Float, nullable=False, default=0.0)
+    is_holiday  = db.Column(db.Boolean, nullable=False, default=False)
+    leave_note  = db.Column(db.String(50))
+
     __table_args__ = (
-        db.UniqueConstraint('employee_id', 'work_date', 'p_type'),
+        db.UniqueConstraint('employee_id', 'work_day'),
+        db.Index('ix_daily_summary_work_day', 'work_day', 'employee_id'),
     )
+
+class SummaryMonth(db.Model):
+    """已建好 daily_summary 的月份；未建的月份在第一次查詢時整月重建"""
+    __tablename__ = 'summary_month'
+    ym       = db.Column(db.String(7), primary_key=True)   # YYYY-MM
+    built_at = db.Column(db.String(19), nullable=False)
+    closed_at = db.Column(db.String(19))    # 已結帳（封存成 month_archive 快照、唯讀）的時間
+
+class CheckinMonth(db.Model):
+    """每月打卡資料的異動計數：該月打卡新增 / 編輯 / 刪除時 +1（匯出快取據此判斷是否過期）"""
+    __tablename__ = 'checkin_month'
+    ym  = db.Column(db.String(7), primary_key=True)   # YYYY-MM
+    rev = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+測試共用設定：每個測試各自一個暫存 SQLite 資料庫（create_all 建表，含唯一鍵）
+與暫存目錄；打卡存放區用 memory，打卡在請求內直接寫入（不經 group commit）。
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app                              # noqa: E402
+from blueprints.directory import get_directory          # noqa: E402
+from config import Config                               # noqa: E402
+from extensions import db                               # noqa: E402
+from models import Checkin, Employee, checkin_times     # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """make_app(db_path=None): an app on *db_path* (default: a new empty database)."""
+
+    settings = {
+        "EMP_DIRECTORY_STAMP": str(tmp_path / "employee_dir.stamp"),
+        "METRICS_DIR": str(tmp_path / "metrics"),
+        "EXPORT_JOB_DIR": str(tmp_path / "export_jobs"),
+        "EXPORT_CACHE_DIR": str(tmp_path / "export_cache"),
+        "EXPORT_RENDER_WORKERS": 1,
+        "ARCHIVE_DIR": str(tmp_path / "archive"),
+        "PUNCH_STORE": "memory",
+        "PUNCH_GROUP_COMMIT_MS": 0,
+        "PUNCH_GEOFENCE_ENABLED": False,
+    }
+    for key, value in settings.items():
+        monkeypatch.setattr(Config, key, value)
+
+    def make(db_path=None):
+        db_path = db_path or tmp_path / "attendance.db"
+        monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{db_path}")
+        app = create_app()
+        app.config["TESTING"] = True
+        return app
+
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def add_employees(app):
+    """add_employees((id, name, area, default_break), ...)"""
+
+    def add(*rows):
+        db.session.execute(insert(Employee), [
+            {"id": eid, "name": name, "area": area, "default_break": brk}
+            for eid, name, area, brk in rows
+        ])
+        db.session.commit()
+        get_directory().invalidate()
+
+    return add
+
+
+@pytest.fixture
+def add_checkins(app):
+    """add_checkins([(employee_id, work_date, p_type, ts, note), ...]) straight into checkin."""
+
+    def add(rows):
+        db.session.execute(insert(Checkin), [
+            {"employee_id": eid, "work_date": wd, "p_type": pt, "ts": ts, "note": note,
+             **checkin_times(wd, ts)}
+            for eid, wd, pt, ts, note in rows
+        ])
+        db.session.commit()
+
+    return add
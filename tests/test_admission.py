@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""打卡頁流量管制：token bucket（在 worker 記憶體，不寫 punch_store）、
+每個 IP / 每個瀏覽器（punch_sid）的額度"""
+from types import SimpleNamespace
+
+from blueprints import admission
+from blueprints.admission import take
+from blueprints.punch_store import get_store
+
+
+def test_bucket_burst_then_refill(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission, "time", SimpleNamespace(time=lambda: now[0]))
+
+    assert [take("rl:test", 1.0, 3) for _ in range(4)] == [True, True, True, False]
+    now[0] += 0.5
+    assert take("rl:test", 1.0, 3) is False
+    now[0] += 0.5
+    assert take("rl:test", 1.0, 3) is True
+    assert take("rl:test", 1.0, 3) is False
+    # 補充不超過 burst
+    now[0] += 60
+    assert [take("rl:test", 1.0, 3) for _ in range(4)] == [True, True, True, False]
+    # 別的 key 各算各的
+    assert take("rl:other", 1.0, 3) is True
+
+
+def test_buckets_stay_out_of_punch_store(app, monkeypatch):
+    writes = []
+    store = get_store()
+    monkeypatch.setattr(store, "update", lambda *a: writes.append(a) or False)
+    monkeypatch.setattr(store, "put", lambda *a: writes.append(a))
+
+    assert take("rl:ip:10.0.0.1", 1.0, 3) is True
+    assert writes == []
+
+
+def test_zero_rate_is_unlimited(app):
+    assert all(take("rl:off", 0, 1) for _ in range(20))
+
+
+def _get(client, ip="10.0.0.1"):
+    return client.get("/punch/", environ_base={"REMOTE_ADDR": ip})
+
+
+def test_per_browser_limit(app):
+    app.config.update(PUNCH_FP_RATE=0.001, PUNCH_FP_BURST=2,
+                      PUNCH_IP_RATE=0.001, PUNCH_IP_BURST=100)
+    first, second = app.test_client(), app.test_client()
+
+    # 第一次請求還沒有 punch_sid，只算 IP 額度；之後每個瀏覽器 2 次
+    codes = [_get(first).status_code for _ in range(4)]
+    assert codes == [302, 302, 302, 429]
+    # 同一個 IP 的另一支手機不受影響
+    assert [_get(second).status_code for _ in range(3)] == [302, 302, 302]
+
+    resp = _get(first)
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == str(app.config["PUNCH_PAGE_RETRY_SEC"])
+
+
+def test_per_ip_limit(app):
+    app.config.update(PUNCH_FP_RATE=0.001, PUNCH_FP_BURST=100,
+                      PUNCH_IP_RATE=0.001, PUNCH_IP_BURST=3)
+    clients = [app.test_client() for _ in range(5)]
+
+    codes = [_get(c).status_code for c in clients]
+    assert codes == [302, 302, 302, 429, 429]
+    # 其他 IP 另有額度
+    assert _get(clients[3], ip="10.0.0.2").status_code == 302
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""每日摘要重建：flask summary rebuild 修好過期的摘要，匯出快取的 watermark 也跟著變"""
+from sqlalchemy import text
+
+from blueprints.daily_summary import month_hours, watermark
+from blueprints.export import cache_path
+from extensions import db
+
+Y, M = 2025, 7
+
+
+def test_rebuild_moves_watermark(app, add_employees, add_checkins):
+    add_employees((1, "王小明", "A", 0.5))
+    add_checkins([
+        (1, "2025-07-08", "am-in", "2025-07-08T08:00:00", None),
+        (1, "2025-07-08", "pm-out", "2025-07-08T17:00:00", None),
+    ])
+    before = watermark(Y, M)
+    assert month_hours(Y, M, [1]).reg[0, 7] == 8.0
+    assert watermark(Y, M) == before                # 第一次建月份不算異動
+
+    # 摘要壞掉（例如手動改資料庫），匯出快取仍以舊的 watermark 為鍵
+    db.session.execute(text("UPDATE daily_summary SET reg = 0"))
+    db.session.commit()
+    stale = cache_path("punch_all", Y, M)
+
+    result = app.test_cli_runner().invoke(args=["summary", "rebuild", "2025-07"])
+    assert "2025-07 已重建" in result.output
+    assert month_hours(Y, M, [1]).reg[0, 7] == 8.0
+    assert watermark(Y, M)[1] == before[1] + 1
+    assert cache_path("punch_all", Y, M) != stale
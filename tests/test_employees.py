@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""員工名單：依 id 的 keyset 分頁（after / before）、區域篩選、ID 前綴與姓名子字串搜尋"""
+import re
+
+import pytest
+
+
+@pytest.fixture
+def staff(app, add_employees):
+    app.config["EMP_PAGE_SIZE"] = 4
+    names = ["王小明", "李小華", "陳大文", "王美玲", "林志明", "張小明", "黃大華", "王明", "Amy Lin", "吳明華"]
+    add_employees(*[(100 + i, name, "A" if i % 2 else "B", 0.0) for i, name in enumerate(names)])
+    add_employees((1000, "趙一", "A", 0.0), (1001, "錢二", "B", 0.0))
+
+
+def _page(client, **args):
+    html = client.get("/admin/", query_string=args).get_data(as_text=True)
+    ids = [int(i) for i in re.findall(r"<tr><td>(\d+)</td>", html)]
+    links = dict((label, dict(re.findall(r"(\w+)=([^&]*)", href.replace("&amp;", "&"))))
+                 for href, label in re.findall(r'<a href="[^"?]*\?([^"]*)">(上一頁|下一頁)</a>', html))
+    return ids, links
+
+
+def test_keyset_pages_forward_and_back(client, staff):
+    ids, links = _page(client)
+    assert ids == [100, 101, 102, 103] and set(links) == {"下一頁"}
+
+    ids, links = _page(client, after=links["下一頁"]["after"])
+    assert ids == [104, 105, 106, 107] and set(links) == {"上一頁", "下一頁"}
+
+    nxt = _page(client, after=links["下一頁"]["after"])
+    assert nxt[0] == [108, 109, 1000, 1001] and set(nxt[1]) == {"上一頁"}
+
+    ids, links = _page(client, before=nxt[1]["上一頁"]["before"])
+    assert ids == [104, 105, 106, 107] and set(links) == {"上一頁", "下一頁"}
+    ids, links = _page(client, before=links["上一頁"]["before"])
+    assert ids == [100, 101, 102, 103] and set(links) == {"下一頁"}
+
+
+def test_pages_keep_area_filter(client, staff):
+    ids, links = _page(client, area="A")
+    assert ids == [101, 103, 105, 107]
+    assert links["下一頁"]["area"] == "A"
+    ids, links = _page(client, **links["下一頁"])
+    assert ids == [109, 1000] and set(links) == {"上一頁"}
+
+
+def test_search(client, staff):
+    assert _page(client, q="10")[0] == [100, 101, 102, 103]        # ID 前綴
+    assert _page(client, q="100")[0] == [100, 1000, 1001]
+    assert _page(client, q="王")[0] == [100, 103, 107]
+    assert _page(client, q="明", area="A")[0] == [105, 107, 109]    # 1–2 字也是子字串
+    assert _page(client, q="明", area="B")[0] == [100, 104]
+    assert _page(client, q="小明")[0] == [100, 105]
+    assert _page(client, q="陳大文")[0] == [102]                    # 3 字以上
+    assert _page(client, q="AM")[0] == [108]                        # 不分大小寫
+    assert _page(client, q="amy l")[0] == [108]
+    assert _page(client, q="zz")[0] == []
+
+
+def test_long_digit_query(client, staff):
+    resp = client.get("/admin/", query_string={"q": "12345678901234567890"})
+    assert resp.status_code == 200
+    assert _page(client, q="12345678901234567890")[0] == []
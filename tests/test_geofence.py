@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""打卡定位圍欄索引：座標內容或半徑改變才重建，原地修改清單也會生效"""
+from blueprints.geofence import get_index
+
+
+def test_index_follows_config_contents(app):
+    points = [[25.0330, 121.5654], [24.1477, 120.6736]]
+    app.config.update(PUNCH_GEOFENCE_POINTS=points, PUNCH_ALLOW_RADIUS_M=200)
+    index = get_index()
+    assert index.nearest_m(25.0330, 121.5654) < 1
+
+    # 同樣內容的新清單物件：沿用原索引
+    app.config["PUNCH_GEOFENCE_POINTS"] = [list(p) for p in points]
+    assert get_index() is index
+
+    # 原地改座標、長度不變
+    app.config["PUNCH_GEOFENCE_POINTS"][0][:] = [22.6273, 120.3014]
+    moved = get_index()
+    assert moved is not index
+    assert moved.nearest_m(22.6273, 120.3014) < 1
+    assert moved.nearest_m(25.0330, 121.5654) > 1000
+
+    app.config["PUNCH_ALLOW_RADIUS_M"] = 300
+    assert get_index().radius_m == 300
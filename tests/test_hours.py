@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+工時引擎（hours.compute_month）：固定案例的預期值（依原本 calc_hours / roundup 的
+進位與扣午休規則手算），三種凌晨下班分界點各自比對；_segment 另與 calc_hours 逐格比對。
+"""
+import numpy as np
+import pytest
+
+from blueprints import calc_hours
+from blueprints.hours import CARD_CUTOFF, PAYROLL_CUTOFF, RECORDS_CUTOFF, _segment, compute_month
+
+Y, M = 2025, 7
+EIDS = [1, 2]
+BREAKS = [0.5, None]
+
+
+def _p(eid, ts, p_type, note=None):
+    return (eid, ts[:10], p_type, ts, note)
+
+
+ROWS = [
+    # 員工 1：白天班（午休 0.5）
+    _p(1, "2025-07-01T01:00:00", "ot-out"),            # 屬於 6 月 30 日，不算本月
+    _p(1, "2025-07-01T07:55:00", "am-in"),             # 8 → 17，跨 13:00 扣 0.5 = 8.5
+    _p(1, "2025-07-01T17:10:00", "pm-out"),
+    _p(1, "2025-07-02T08:20:00", "am-in"),             # 8.5 → 12 = 3.5（有下午上班不扣午休）
+    _p(1, "2025-07-02T12:00:00", "am-out"),
+    _p(1, "2025-07-02T13:00:00", "pm-in"),             # 13 → 18.5 = 5.5
+    _p(1, "2025-07-02T18:40:00", "pm-out"),
+    _p(1, "2025-07-03T09:00:00", "am-in"),             # 3
+    _p(1, "2025-07-03T12:00:00", "am-out"),
+    _p(1, "2025-07-04T08:00:00", "am-in"),             # 缺下班卡：0
+    _p(1, "2025-07-05T13:10:00", "pm-in"),             # 週六 13.5 → 17.5 = 4
+    _p(1, "2025-07-05T17:30:00", "pm-out"),
+    _p(1, "2025-07-07T08:00:00", "am-in"),             # 8 → 12.5，沒跨 13:00 不扣 = 4.5
+    _p(1, "2025-07-07T12:30:00", "pm-out"),
+    _p(1, "2025-07-08T06:50:00", "am-in"),             # 7 → 22，扣 0.5 = 14.5
+    _p(1, "2025-07-08T21:56:00", "pm-out"),
+    _p(1, "2025-07-09T12:44:00", "pm-in"),             # 13 → 13：視為跨日 = 24（原規則照舊）
+    _p(1, "2025-07-09T13:24:00", "pm-out"),
+    _p(1, "2025-07-10T08:00:00", "am-in"),             # 上午 4 + 加班 3
+    _p(1, "2025-07-10T12:00:00", "am-out"),
+    _p(1, "2025-07-10T18:00:00", "ot-in"),
+    _p(1, "2025-07-10T21:00:00", "ot-out"),
+    # 員工 2：20:00 加班，隔天凌晨下班，時間落在各分界點兩側
+    _p(2, "2025-07-14T20:00:00", "ot-in"),
+    _p(2, "2025-07-15T02:59:59", "ot-out"),
+    _p(2, "2025-07-16T20:00:00", "ot-in"),
+    _p(2, "2025-07-17T03:00:00", "ot-out"),
+    _p(2, "2025-07-18T20:00:00", "ot-in"),
+    _p(2, "2025-07-19T04:00:00", "ot-out"),
+    _p(2, "2025-07-21T20:00:00", "ot-in"),
+    _p(2, "2025-07-22T04:00:30", "ot-out"),
+    _p(2, "2025-07-23T20:00:00", "ot-in"),
+    _p(2, "2025-07-24T04:01:00", "ot-out"),
+    _p(2, "2025-07-25T18:00:00", "ot-in"),             # 當天 23:00 與隔天 01:00 兩筆下班：後者為準
+    _p(2, "2025-07-25T23:00:00", "ot-out"),
+    _p(2, "2025-07-26T01:00:00", "ot-out"),
+    _p(2, "2025-07-29T00:00:00", "lv", "特休"),
+    _p(2, "2025-07-31T20:00:00", "ot-in"),             # 月底加班到下月 1 日 03:30
+    _p(2, "2025-08-01T03:30:00", "ot-out"),
+    _p(2, "2025-08-01T08:00:00", "am-in"),             # 下個月的班
+]
+
+DAY_SHIFTS = {
+    (1, 1): (8, 0.5, 0), (1, 2): (8, 1, 0), (1, 3): (3, 0, 0), (1, 5): (4, 0, 0),
+    (1, 7): (4.5, 0, 0), (1, 8): (8, 2, 4.5), (1, 9): (8, 2, 14), (1, 10): (4, 2, 1),
+}
+
+# (員工, 日) → (正班, 加班≤2, 加班>2)；以及員工 2 的「加班下」落在哪一天
+EXPECTED = {
+    RECORDS_CUTOFF: (
+        {(2, 14): (0, 2, 5), (2, 25): (0, 2, 5)},
+        {14: "02:59", 17: "03:00", 19: "04:00", 22: "04:00", 24: "04:01", 25: "01:00"},
+    ),
+    PAYROLL_CUTOFF: (
+        {(2, 14): (0, 2, 5), (2, 16): (0, 2, 5), (2, 18): (0, 2, 6), (2, 21): (0, 2, 6),
+         (2, 25): (0, 2, 5), (2, 31): (0, 2, 5.5)},
+        {14: "02:59", 16: "03:00", 18: "04:00", 21: "04:00", 24: "04:01", 25: "01:00",
+         31: "03:30"},
+    ),
+    CARD_CUTOFF: (
+        {(2, 14): (0, 2, 5), (2, 16): (0, 2, 5), (2, 18): (0, 2, 6), (2, 25): (0, 2, 5),
+         (2, 31): (0, 2, 5.5)},
+        {14: "02:59", 16: "03:00", 18: "04:00", 22: "04:00", 24: "04:01", 25: "01:00",
+         31: "03:30"},
+    ),
+}
+
+
+@pytest.mark.parametrize("cutoff", [RECORDS_CUTOFF, PAYROLL_CUTOFF, CARD_CUTOFF],
+                         ids=["records", "payroll", "card"])
+def test_compute_month_fixed_cases(cutoff):
+    mh = compute_month(ROWS, Y, M, EIDS, BREAKS, cutoff=cutoff)
+    hours, night_outs = EXPECTED[cutoff]
+    want = {**DAY_SHIFTS, **hours}
+
+    got = {(eid, d + 1): (mh.reg[e, d], mh.ot2[e, d], mh.otx[e, d])
+           for e, eid in enumerate(EIDS) for d in range(mh.days)
+           if mh.reg[e, d] or mh.ot2[e, d] or mh.otx[e, d]}
+    assert got == want
+
+    ot_out = {d + 1: t for d, t in enumerate(mh.times[5, 1]) if t}
+    assert ot_out == night_outs
+    assert mh.times[5, 0, 0] == ""              # 7/1 01:00 的下班屬於 6 月
+    assert list(mh.times[:, 0, 1]) == ["08:20", "12:00", "13:00", "18:40", "", ""]
+    assert mh.hol[0, 4] == 4 and mh.hol[0, 0] == 0
+    assert mh.leave == {2: {"29": "特休"}}
+
+
+def test_remarks_and_default_leave_word():
+    rows = [
+        _p(1, "2025-07-03T00:00:00", "lv", "特休"),
+        _p(1, "2025-07-04T00:00:00", "lv"),
+        _p(1, "2025-07-05T08:00:00", "am-in", "補登"),
+    ]
+    mh = compute_month(rows, Y, M, [1], [0.0], cutoff=RECORDS_CUTOFF)
+    assert mh.leave == {1: {"03": "特休", "04": "請假"}}
+    assert mh.remarks[1] == {"03": ["特休"], "04": ["請假"], "05": ["補登"]}
+
+
+@pytest.mark.parametrize("brk", [0.0, 0.5, 1.0])
+def test_segment_matches_calc_hours(brk):
+    minutes = np.arange(0, 24 * 60, 7)
+    start, end = (a.ravel() for a in np.meshgrid(minutes, minutes, indexing="ij"))
+    present = np.ones_like(start, dtype=bool)
+    hm = [f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)]
+    for skip in (False, True):
+        got = _segment(start, end, present, brk, np.full(start.shape, skip))
+        want = [sum(calc_hours(hm[s], hm[e], brk, skip_break=skip)) for s, e in zip(start, end)]
+        np.testing.assert_allclose(got, want, atol=1e-9)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""匯入歷史打卡：退回原因、重複筆數（分批讀檔時跨批也算），已結帳月份不可匯入"""
+import io
+import re
+
+import pytest
+from sqlalchemy import select
+
+from blueprints.daily_summary import close_month, month_hours
+from extensions import db
+from models import Checkin
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(app):
+    app.config["IMPORT_CHUNK_ROWS"] = 3
+
+
+def _upload(client, url, csv_text, **form):
+    data = {"file": (io.BytesIO(csv_text.encode("utf-8")), "data.csv"), **form}
+    html = client.post(url, data=data, content_type="multipart/form-data").get_data(as_text=True)
+    msg = re.search(r"<p class='success'>(.*?)</p>", html).group(1)
+    return msg, html
+
+
+def _rejected(html):
+    return [(int(n), why) for n, why in
+            re.findall(r"<tr><td>(\d+)</td><td>[^<]*</td><td>[^<]*</td><td>[^<]*</td><td>([^<]*)</td></tr>",
+                       html)]
+
+
+def test_import_checkins(client, add_employees, add_checkins):
+    add_employees((1, "王小明", "A", 0.0), (2, "李小華", "A", 0.0))
+    add_checkins([(1, "2025-07-01", "am-in", "2025-07-01T08:00:00", None)])
+    msg, html = _upload(client, "/admin/import_checkins", (
+        "employee_id,p_type,ts,note\n"
+        "1,am-in,2025-07-01 08:10,\n"              # 1 與資料庫重複
+        "1,pm-out,2025-07-01 17:00,\n"             # 2
+        "x,am-in,2025-07-02 08:00,\n"              # 3 員工編號錯誤
+        "9,am-in,2025-07-02 08:00,\n"              # 4 查無此員工
+        "2,lunch,2025-07-02 12:00,\n"              # 5 打卡類型錯誤
+        "2,am-in,2025/99/02,\n"                    # 6 時間格式錯誤
+        "2,lv,2025-07-03,\n"                       # 7 假別不可空白
+        "2,lv,2025-07-03,特休\n"                   # 8
+        "2,am-in,2025-07-04 08:00," + "長" * 51 + "\n"   # 9 備註過長
+        "1,pm-out,2025-07-01 17:30,\n"             # 10 檔內重複（不同批）
+        "2,ot-in,2025-07-04 20:00,\n"              # 11
+        "2,ot-out,2025-07-05 02:00,\n"             # 12
+    ))
+    assert msg.startswith("新增 4 筆、重複 2 筆、退回 6 筆（共 12 列")
+    assert _rejected(html) == [
+        (3, "員工編號錯誤"), (4, "查無此員工"), (5, "打卡類型錯誤"), (6, "時間格式錯誤"),
+        (7, "假別不可空白"), (9, "備註過長"),
+    ]
+    ts = db.session.execute(select(Checkin.ts).where(
+        Checkin.employee_id == 1, Checkin.p_type == "pm-out")).scalar()
+    assert ts == "2025-07-01T17:00:00"
+
+    mh = month_hours(2025, 7, [1, 2])
+    assert mh.reg[0, 0] == 8.0 and mh.ot2[0, 0] == 1.0
+    assert mh.ot2[1, 3] == 2.0 and mh.otx[1, 3] == 4.0      # 凌晨下班歸前一天
+    assert mh.leave == {2: {"03": "特休"}}
+
+    # 同一個檔案再匯入一次：全部是重複
+    msg, _ = _upload(client, "/admin/import_checkins", (
+        "employee_id,p_type,ts\n1,pm-out,2025-07-01 17:00\n2,ot-in,2025-07-04 20:00\n"))
+    assert msg.startswith("新增 0 筆、重複 2 筆、退回 0 筆")
+
+
+def test_import_checkins_closed_month(client, add_employees, add_checkins):
+    add_employees((1, "王小明", "A", 0.0))
+    add_checkins([(1, "2025-03-31", "ot-in", "2025-03-31T20:00:00", None)])
+    close_month(2025, 3)
+
+    msg, html = _upload(client, "/admin/import_checkins", (
+        "employee_id,p_type,ts\n"
+        "1,am-in,2025-03-10 08:00\n"           # 已結帳月份
+        "1,ot-out,2025-04-01 02:00\n"          # 下月 1 日凌晨下班，屬於已結帳的 3 月
+        "1,am-in,2025-04-01 08:00\n"
+        "1,pm-out,2025-04-01 17:00\n"
+    ))
+    assert msg.startswith("新增 2 筆、重複 0 筆、退回 2 筆")
+    assert _rejected(html) == [(1, "月份已結帳"), (2, "月份已結帳")]
+
+
+def test_import_checkins_missing_columns(client):
+    msg, _ = _upload(client, "/admin/import_checkins", "employee_id,ts\n1,2025-07-01 08:00\n")
+    assert msg == "檔案欄位必須包含 employee_id, p_type, ts"
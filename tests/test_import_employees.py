@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""匯入員工：每列結果（新增 / 格式錯誤 / ID 已存在 / 已更新），分批讀檔時跨批也算重複"""
+import io
+import re
+
+import pytest
+
+from blueprints.daily_summary import month_hours
+from blueprints.directory import get_directory
+from extensions import db
+from models import Employee
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(app):
+    app.config["IMPORT_CHUNK_ROWS"] = 3
+
+
+def _upload(client, url, csv_text, **form):
+    data = {"file": (io.BytesIO(csv_text.encode("utf-8")), "data.csv"), **form}
+    html = client.post(url, data=data, content_type="multipart/form-data").get_data(as_text=True)
+    msg = re.search(r"<p class='success'>(.*?)</p>", html).group(1)
+    return msg, html
+
+
+def _results(html):
+    return re.findall(r"<tr><td>([^<]*)</td><td>([^<]*)</td></tr>", html)
+
+
+def test_import_employees(client, add_employees):
+    add_employees((1, "王小明", "A", 0.5))
+    msg, html = _upload(client, "/admin/import_employees", (
+        "id,name,area,default_break\n"
+        "1,王小明,B,1\n"        # 已存在
+        "2,李小華,A,0.5\n"
+        "abc,錯誤,A,0\n"        # 格式錯誤
+        "3,陳大文,B,\n"         # 午休空白 = 0
+        "2,李小華,A,0.5\n"      # 檔內重複（不同批）
+        "4.5,小數,A,0\n"
+        "5,林志明,A,x\n"
+    ))
+    assert msg.startswith("成功匯入 2 筆（共 7 列")
+    assert _results(html) == [
+        ("1", "ID 已存在"), ("2", "ok"), ("abc", "格式錯誤"), ("3", "ok"),
+        ("2", "ID 已存在"), ("4.5", "格式錯誤"), ("5", "格式錯誤"),
+    ]
+    assert [e.id for e in get_directory().all()] == [1, 2, 3]
+    assert db.session.get(Employee, 1).area == "A"
+    assert db.session.get(Employee, 3).default_break == 0.0
+
+
+def test_import_employees_upsert(client, add_employees, add_checkins):
+    add_employees((1, "王小明", "A", 0.5))
+    add_checkins([(1, "2025-07-01", "am-in", "2025-07-01T08:00:00", None),
+                  (1, "2025-07-01", "pm-out", "2025-07-01T17:00:00", None)])
+    assert month_hours(2025, 7, [1]).ot2[0, 0] == 0.5
+
+    msg, html = _upload(client, "/admin/import_employees",
+                        "id,name,area,default_break\n1,王大明,B,1\n2,李小華,A,0\n", upsert="1")
+    assert msg.startswith("成功匯入 1 筆、更新 1 筆")
+    assert _results(html) == [("1", "已更新"), ("2", "ok")]
+    assert db.session.get(Employee, 1).name == "王大明"
+    assert get_directory().get("1").area == "B"
+    # 午休時數改了，已建好的每日摘要跟著重算
+    assert month_hours(2025, 7, [1]).ot2[0, 0] == 0.0
+
+
+def test_import_employees_missing_columns(client):
+    msg, _ = _upload(client, "/admin/import_employees", "id,name\n1,王小明\n")
+    assert msg == "檔案欄位必須包含 id, name, area, default_break"
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""資料庫初始化：全新資料庫標記為最新版本；舊版 create_all 建的資料庫可以 flask db upgrade"""
+import sqlite3
+
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask_migrate import upgrade
+from sqlalchemy import inspect, text
+
+from app import MIGRATIONS_DIR
+from extensions import db
+
+# 舊版 models.py 以 db.create_all() 建出的結構（沒有 alembic_version）
+LEGACY_SCHEMA = """
+CREATE TABLE employee (
+    id INTEGER NOT NULL, name VARCHAR(50) NOT NULL, area VARCHAR(50),
+    default_break FLOAT NOT NULL, PRIMARY KEY (id)
+);
+CREATE TABLE checkin (
+    id INTEGER NOT NULL, employee_id INTEGER NOT NULL, work_date VARCHAR(10) NOT NULL,
+    p_type VARCHAR(10) NOT NULL, ts VARCHAR(19) NOT NULL, note VARCHAR(50),
+    PRIMARY KEY (id), UNIQUE (employee_id, work_date, p_type),
+    FOREIGN KEY(employee_id) REFERENCES employee (id)
+);
+INSERT INTO employee VALUES (1, '王小明', 'A', 0.5);
+INSERT INTO checkin VALUES (1, 1, '2025-07-01', 'am-in', '2025-07-01T08:00:00', NULL);
+INSERT INTO checkin VALUES (2, 1, '2025-07-01', 'pm-out', '2025-07-01T17:00:00', NULL);
+"""
+
+
+def _revision():
+    with db.engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def test_new_database_stamped_at_head(app):
+    assert _revision() == ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+    upgrade(directory=MIGRATIONS_DIR)           # 已是最新版本：什麼都不做
+    assert "daily_summary" in inspect(db.engine).get_table_names()
+
+
+def test_upgrade_database_built_by_create_all(make_app, tmp_path):
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(LEGACY_SCHEMA)
+
+    app = make_app(path)
+    with app.app_context():
+        # 舊結構不 create_all，新資料表留給 migration 建
+        assert set(inspect(db.engine).get_table_names()) == {"employee", "checkin"}
+        upgrade(directory=MIGRATIONS_DIR)
+        assert _revision() == ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+        rows = db.session.execute(text("SELECT p_type, work_day, ts_at FROM checkin ORDER BY id")).all()
+        assert [(p, str(d)) for p, d, _ in rows] == [("am-in", "2025-07-01"), ("pm-out", "2025-07-01")]
+        db.session.remove()
+        db.engine.dispose()
+
+    # 升級後打卡寫得進去，每日摘要也算得出來
+    app = make_app(path)
+    with app.app_context():
+        from blueprints.daily_summary import month_hours
+        from blueprints.punch_writer import record_punch
+
+        assert record_punch(1, "2025-07-02", "am-in", "2025-07-02T08:00:00") is True
+        assert month_hours(2025, 7, [1]).reg[0, 0] == 8.0
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""已結帳月份：快照的數字與結帳前的 daily_summary / 工時卡片一致，結帳後唯讀"""
+import numpy as np
+import pytest
+
+from blueprints.daily_summary import close_month, month_hours, reopen_month
+from blueprints.hours import CARD_CUTOFF, RECORDS_CUTOFF
+from blueprints.month_archive import card_hours, closed_for, snapshot
+
+Y, M = 2025, 3
+EIDS = [1, 2, 3]
+BREAKS = [0.5, 1.0, 0.0]
+
+
+@pytest.fixture
+def month(add_employees, add_checkins):
+    add_employees((1, "王小明", "A", 0.5), (2, "李小華", "A", 1.0), (3, "陳大文", "B", 0.0))
+    add_checkins([
+        (1, "2025-03-03", "am-in", "2025-03-03T07:55:00", None),
+        (1, "2025-03-03", "pm-out", "2025-03-03T17:10:00", None),
+        (1, "2025-03-04", "am-in", "2025-03-04T08:20:00", None),
+        (1, "2025-03-04", "am-out", "2025-03-04T12:00:00", None),
+        (1, "2025-03-04", "pm-in", "2025-03-04T13:00:00", None),
+        (1, "2025-03-04", "pm-out", "2025-03-04T18:40:00", "晚走"),
+        (2, "2025-03-08", "ot-in", "2025-03-08T20:00:00", None),       # 週六加班
+        (2, "2025-03-09", "ot-out", "2025-03-09T02:30:00", None),
+        (2, "2025-03-10", "lv", "2025-03-10T00:00:00", "病假"),
+        (3, "2025-03-31", "ot-in", "2025-03-31T19:00:00", None),       # 月底加班到下月 1 日凌晨
+        (3, "2025-04-01", "ot-out", "2025-04-01T01:15:00", None),
+        (3, "2025-04-01", "am-in", "2025-04-01T08:00:00", None),       # 下個月的班
+    ])
+
+
+def _assert_same(a, b):
+    assert a.eids == b.eids
+    assert (a.times == b.times).all()
+    for name in ("reg", "ot2", "otx"):
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+    assert a.leave == b.leave
+
+
+def test_snapshot_matches_daily_summary(app, month):
+    before = month_hours(Y, M, EIDS)
+    cards = {c: card_hours(Y, M, EIDS, BREAKS, cutoff=c) for c in (RECORDS_CUTOFF, CARD_CUTOFF)}
+    assert before.reg[0, 2] == 8.0 and before.ot2[0, 2] == 0.5
+    assert before.otx[2, 30] == 4.0 and before.leave == {2: {"10": "病假"}}
+
+    close_month(Y, M)
+    assert snapshot(Y, M) is not None
+    _assert_same(month_hours(Y, M, EIDS), before)
+    # 只取部分員工、順序不同
+    part = month_hours(Y, M, [3, 1])
+    np.testing.assert_array_equal(part.reg, before.reg[[2, 0]])
+    for cutoff, want in cards.items():
+        got = card_hours(Y, M, EIDS, BREAKS, cutoff=cutoff)
+        _assert_same(got, want)
+        assert got.remarks == want.remarks
+
+
+def test_closed_month_read_only(app, client, month):
+    close_month(Y, M)
+    assert closed_for("2025-03-04", "am-in", "2025-03-04T08:20:00") == "2025-03"
+    assert closed_for("2025-04-01", "ot-out", "2025-04-01T01:15:00") == "2025-03"
+    assert closed_for("2025-04-01", "am-in", "2025-04-01T08:00:00") is None
+
+    def edit(emp, dt, typ, **form):
+        return client.post("/admin/edit_rec", query_string={
+            "emp": emp, "date": dt, "typ": typ, "back": "/admin/records"}, data=form)
+
+    assert edit(1, "2025-03-04", "am-in", val="09:00").status_code == 409
+    assert edit(1, "2025-03-05", "am-in", val="09:00").status_code == 409
+    assert edit(1, "2025-03-04", "am-in", clear="1").status_code == 409
+    assert edit(3, "2025-04-01", "ot-out", val="03:00").status_code == 409
+    # 下月 1 日改成 NIGHT_END 之後的下班也不行（原值仍屬已結帳月份）
+    assert edit(3, "2025-04-01", "ot-out", val="05:00").status_code == 409
+    assert edit(3, "2025-04-01", "am-in", val="08:30").status_code == 302
+
+    reopen_month(Y, M)
+    assert snapshot(Y, M) is None
+    assert edit(1, "2025-03-04", "am-in", val="09:00").status_code == 302
+    assert month_hours(Y, M, [1]).times[0, 0, 3] == "09:00"
+
+
+def test_close_month_needs_month_over(app, month):
+    with pytest.raises(ValueError):
+        close_month(2099, 1)
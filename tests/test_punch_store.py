@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""gate / token 存放區：一次性 token 只能用一次（含同時送出），add 只有一個搶得到"""
+import re
+import threading
+
+import pytest
+
+from blueprints.punch_store import MemoryStore, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "store.db"))
+
+
+def test_consume_once(store):
+    store.put("tok:s1", {"value": "abc", "exp": 1}, 60)
+
+    assert store.consume("tok:s1", "value", "wrong") is None
+    assert store.consume("tok:s1", "value", "abc") == {"value": "abc", "exp": 1}
+    assert store.consume("tok:s1", "value", "abc") is None
+    assert store.get("tok:s1") is None
+
+
+def test_consume_expired(store):
+    store.put("tok:s1", {"value": "abc"}, -1)
+    assert store.consume("tok:s1", "value", "abc") is None
+
+
+def test_consume_concurrent(store):
+    store.put("tok:s1", {"value": "abc"}, 60)
+    won = []
+    barrier = threading.Barrier(8)
+
+    def consume():
+        barrier.wait()
+        if store.consume("tok:s1", "value", "abc"):
+            won.append(1)
+
+    threads = [threading.Thread(target=consume) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(won) == 1
+
+
+def test_add_only_once(store):
+    assert store.add("card:1", {"building": True}, 60) is True
+    assert store.add("card:1", {"building": True}, 60) is False
+    store.delete("card:1")
+    assert store.add("card:1", {"rows": []}, 60) is True
+
+
+def test_update_none_keeps_value(store):
+    assert store.update("k", lambda v: v, 60) is False
+    store.put("k", {"n": 1}, 60)
+    assert store.update("k", lambda v: None, 60) is True
+    assert store.get("k") == {"n": 1}
+    assert store.update("k", lambda v: {"n": v["n"] + 1}, 60) is True
+    assert store.get("k") == {"n": 2}
+
+
+def test_api_token_single_use(app, client, add_employees):
+    add_employees((1, "王小明", "A", 0.0))
+    page = client.get("/punch/", follow_redirects=True)
+    token = re.search(r"name='token' value='([^']+)'", page.get_data(as_text=True)).group(1)
+
+    first = client.post("/punch/api", json={"eid": "1", "type": "am-in", "token": token})
+    assert first.get_json()["code"] == "ok"
+    again = client.post("/punch/api", json={"eid": "1", "type": "am-out", "token": token})
+    assert again.get_json()["code"] == "token_expired"
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""打卡寫入：唯一鍵略過重複、沒有唯一鍵時先查再寫、group commit 下的同時重複打卡、
+整批失敗時逐筆重寫、等候逾時回「尚未確認」、每日摘要與打卡同一個交易更新"""
+import re
+import threading
+import time
+
+import pytest
+from sqlalchemy import func, select, text
+
+from blueprints import punch_writer
+from blueprints.card_summary import load_month
+from blueprints.daily_summary import month_hours, watermark
+from blueprints.punch_writer import has_unique_key, record_punch
+from extensions import db
+from models import Checkin, checkin_times
+
+WD = "2025-07-08"
+
+
+def _count():
+    return db.session.execute(select(func.count()).select_from(Checkin)).scalar()
+
+
+def test_duplicate_skipped_by_unique_index(app, add_employees):
+    add_employees((1, "王小明", "A", 0.0))
+    with db.engine.connect() as conn:
+        assert has_unique_key(conn)
+
+    assert record_punch(1, WD, "am-in", f"{WD}T08:00:00") is True
+    assert record_punch(1, WD, "am-in", f"{WD}T08:05:00") is False
+    assert record_punch(1, WD, "am-out", f"{WD}T12:00:00") is True
+    assert _count() == 2
+    # 重複的那筆不覆蓋先寫入的時間
+    assert db.session.execute(
+        select(Checkin.ts).where(Checkin.p_type == "am-in")).scalar() == f"{WD}T08:00:00"
+
+
+def test_duplicate_skipped_without_unique_index(app, add_employees):
+    add_employees((1, "王小明", "A", 0.0))
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_checkin_emp_date_type"))
+    punch_writer._unique_key.pop(str(db.engine.url), None)
+    with db.engine.connect() as conn:
+        assert not has_unique_key(conn)
+
+    assert record_punch(1, WD, "am-in", f"{WD}T08:00:00") is True
+    assert record_punch(1, WD, "am-in", f"{WD}T08:05:00") is False
+    with db.engine.begin() as conn:
+        # 同一批裡前面剛寫入的也算重複
+        row = {"employee_id": 1, "work_date": WD, "p_type": "pm-in", "ts": f"{WD}T13:00:00",
+               **checkin_times(WD, f"{WD}T13:00:00")}
+        assert punch_writer.insert_rows(conn, [row, row]) == [True, False]
+    assert _count() == 2
+
+
+def test_group_commit_concurrent_duplicates(app, add_employees):
+    add_employees((1, "王小明", "A", 0.0), (2, "李小華", "A", 0.0))
+    app.config["PUNCH_GROUP_COMMIT_MS"] = 20
+    results = []
+    lock = threading.Lock()
+
+    def punch(eid):
+        with app.app_context():
+            ok = record_punch(eid, WD, "am-in", f"{WD}T08:00:00")
+        with lock:
+            results.append((eid, ok))
+
+    threads = [threading.Thread(target=punch, args=(eid,)) for eid in (1, 2) * 6]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(eid for eid, ok in results if ok) == [1, 2]
+    assert len(results) == 12
+    assert _count() == 2
+
+
+
+@pytest.mark.parametrize("window_ms", [0, 20], ids=["direct", "group-commit"])
+def test_summary_updated_with_punch(app, add_employees, window_ms):
+    add_employees((1, "王小明", "A", 0.5))
+    app.config["PUNCH_GROUP_COMMIT_MS"] = window_ms
+    mh = month_hours(2025, 7, [1])          # 先建好整月摘要，之後靠打卡增量更新
+    assert mh.reg.sum() == 0
+    rev = watermark(2025, 7)[1]
+
+    record_punch(1, WD, "am-in", f"{WD}T08:00:00")
+    record_punch(1, WD, "pm-out", f"{WD}T17:00:00")
+    # record_punch 回來時摘要已經 commit，不用等背景重算
+    summary = db.session.execute(text(
+        "SELECT am_in, pm_out, reg FROM daily_summary WHERE employee_id = 1 AND work_day = :d"),
+        {"d": WD}).one()
+    assert tuple(summary) == ("08:00", "17:00", 8.0)
+    assert watermark(2025, 7)[1] == rev + 2
+    mh = month_hours(2025, 7, [1])
+    assert mh.times[0, 0, 7] == "08:00" and mh.times[3, 0, 7] == "17:00"
+    assert mh.reg[0, 7] == 8.0 and mh.ot2[0, 7] == 0.5
+
+
+def _punch_all(app, punches):
+    """Run record_punch for every (eid, p_type) at once → {(eid, p_type): result or exception}."""
+
+    results = {}
+
+    def punch(eid, typ):
+        with app.app_context():
+            try:
+                results[eid, typ] = record_punch(eid, WD, typ, f"{WD}T08:00:00")
+            except Exception as exc:  # noqa: BLE001
+                results[eid, typ] = exc
+
+    threads = [threading.Thread(target=punch, args=p) for p in punches]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_group_commit_bad_row_fails_alone(app, add_employees, monkeypatch):
+    add_employees((1, "王小明", "A", 0.0), (2, "李小華", "A", 0.0))
+    app.config["PUNCH_GROUP_COMMIT_MS"] = 200
+    insert_rows = punch_writer.insert_rows
+    batches = []
+
+    def failing_insert(conn, rows):
+        batches.append(len(rows))
+        if any(row["p_type"] == "bad" for row in rows):
+            raise ValueError("bad row")
+        return insert_rows(conn, rows)
+
+    monkeypatch.setattr(punch_writer, "insert_rows", failing_insert)
+    results = _punch_all(app, [(1, "am-in"), (2, "bad"), (2, "am-in")])
+
+    assert batches[0] == 3                          # 同一批，失敗後逐筆重寫
+    assert results[1, "am-in"] is True and results[2, "am-in"] is True
+    assert isinstance(results[2, "bad"], ValueError)
+    assert _count() == 2
+
+
+def test_group_commit_timeout_is_pending(app, add_employees, monkeypatch):
+    add_employees((1, "王小明", "A", 0.0))
+    app.config["PUNCH_GROUP_COMMIT_MS"] = 5
+    monkeypatch.setattr(punch_writer, "RESULT_TIMEOUT_SEC", 0.05)
+    assert load_month(1, 2025, 7) == []             # 打卡結果頁摘要已存在
+    release = threading.Event()
+    insert_rows = punch_writer.insert_rows
+
+    def slow_insert(conn, rows):
+        release.wait(5)
+        return insert_rows(conn, rows)
+
+    monkeypatch.setattr(punch_writer, "insert_rows", slow_insert)
+    assert record_punch(1, WD, "am-in", f"{WD}T08:00:00") is None
+    release.set()
+
+    # 呼叫者離開後仍寫入，結果頁摘要也由寫入器補上
+    deadline = time.monotonic() + 5
+    while load_month(1, 2025, 7) == [] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert load_month(1, 2025, 7) == [(WD, "am-in", "08:00")]
+    assert _count() == 1
+
+
+def test_pending_punch_answer(client, add_employees, monkeypatch):
+    from blueprints import punch
+
+    add_employees((1, "王小明", "A", 0.0))
+    monkeypatch.setattr(punch, "record_punch", lambda *args: None)
+    page = client.get("/punch/", follow_redirects=True)
+    token = re.search(r"name='token' value='([^']+)'", page.get_data(as_text=True)).group(1)
+
+    resp = client.post("/punch/api", json={"eid": "1", "type": "am-in", "token": token})
+    assert resp.status_code == 200
+    assert resp.get_json()["code"] == "pending" and resp.get_json()["st"] == "warn"
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""串流寫出的 xlsx 以 openpyxl 讀回：值、型別、合併格，以及兩種匯出報表"""
+import io
+
+import numpy as np
+import pytest
+from openpyxl import load_workbook
+
+from blueprints.xlsx_stream import TemplateBook
+
+
+def _book(write):
+    out = io.BytesIO()
+    book = TemplateBook(None, out)
+    write(book)
+    book.close()
+    return load_workbook(io.BytesIO(out.getvalue()))
+
+
+def test_values_read_back():
+    def write(book):
+        bold = book.add_format({"bold": True, "border": 1})
+        ws = book.add_worksheet("工時")
+        ws.set_column(0, 0, 12)
+        ws.freeze_panes(1, 0)
+        ws.merge_range(0, 0, 0, 2, "王小明（1）", bold)
+        ws.write_row(1, 0, ["正班", 8, 1.5, True, "", None])
+        ws.write_row(2, 0, [np.float64(7.5), np.int64(3), np.bool_(False), np.float32(0.5)])
+        ws.write_row(3, 0, [float("nan"), "a<b & \"c\"", "tab\x01ctl", 0.1 + 0.2])
+
+    wb = _book(write)
+    ws = wb["工時"]
+    assert ws["A1"].value == "王小明（1）" and ws["A1"].font.b
+    assert [str(r) for r in ws.merged_cells.ranges] == ["A1:C1"]
+    assert [c.value for c in ws[2]][:4] == ["正班", 8, 1.5, True]
+    assert ws["E2"].value is None and ws["F2"].value is None
+    row3 = [c.value for c in ws[3]][:4]
+    assert row3 == [7.5, 3, False, 0.5]
+    assert type(row3[1]) is int and type(row3[0]) is float
+    assert ws["A4"].value is None
+    assert ws["B4"].value == 'a<b & "c"' and ws["C4"].value == "tabctl"
+    assert ws["D4"].value == pytest.approx(0.3)
+    assert ws.freeze_panes == "A2"
+    assert ws.column_dimensions["A"].width > 10
+
+
+def test_rows_must_go_down():
+    def write(book):
+        ws = book.add_worksheet("s")
+        ws.write(5, 0, "x")
+        ws.write(7, 0, "y")
+        with pytest.raises(ValueError):
+            ws.write(5, 1, "z")
+
+    assert _book(write)["s"]["A6"].value == "x"
+
+
+@pytest.fixture
+def july(add_employees, add_checkins):
+    add_employees((1, "王小明", "A區", 0.5), (2, "李小華", "B區", 0.0))
+    add_checkins([
+        (1, "2025-07-01", "am-in", "2025-07-01T08:00:00", None),
+        (1, "2025-07-01", "pm-out", "2025-07-01T19:30:00", None),
+        (1, "2025-07-02", "lv", "2025-07-02T00:00:00", "特休"),
+        (2, "2025-07-05", "am-in", "2025-07-05T09:00:00", None),         # 週六
+        (2, "2025-07-05", "am-out", "2025-07-05T12:00:00", None),
+    ])
+
+
+def test_punch_all_export(client, july):
+    resp = client.get("/admin/export/punch_all", query_string={"ym": "2025-07"})
+    assert resp.status_code == 200
+    wb = load_workbook(io.BytesIO(resp.data))
+    assert wb.sheetnames == ["A區-1-王小明", "B區-2-李小華"]
+
+    ws = wb["A區-1-王小明"]
+    assert ws["A1"].value.startswith("王小明（1）")
+    assert ws["A2"].value == "出勤天數：1"
+    day1 = [c.value for c in ws[4]]
+    assert day1[:3] == ["07-01", "08:00", None] and day1[4] == "19:30"
+    assert day1[8:11] == [8, 2, 1]          # 08:00–19:30 扣午休 0.5 = 11
+    assert ws["H5"].value == "特休"
+
+    ws = wb["B區-2-李小華"]
+    assert [c.value for c in ws[8]][8:12] == [None, None, None, 3]
+
+
+def test_payroll_export(client, july):
+    resp = client.get("/admin/export", query_string={"ym": "2025-07"})
+    assert resp.status_code == 200
+    wb = load_workbook(io.BytesIO(resp.data))
+    ws = wb[next(n for n in wb.sheetnames if n.startswith("A區"))]
+    assert ws["B1"].value == "1-王小明"
+    assert [c.value for c in ws[3]][:7] == ["07-01", 8, 2, 1, None, None, None]
+    assert ws["G4"].value == "請特休"
+    assert [c.value for c in ws[2 + 31 + 1]][1:6] == [8, 2, 1, 0, 1]